@@ -29,12 +29,18 @@ export function useWebSocket() {
       ws.onmessage = (event: MessageEvent) => {
         if (pausedRef.current) return;
         try {
-          const payload = JSON.parse(event.data as string) as {
-            type: string;
-            data: LogEntry;
-          };
-          if (payload.type === "new_log") {
-            setMessages((prev) => [payload.data, ...prev].slice(0, MAX_MESSAGES));
+          const payload = JSON.parse(event.data as string) as
+            | { type: "new_log"; data: LogEntry }
+            | { type: "new_logs"; data: LogEntry[] };
+          // The WAF coalesces events into "new_logs" frames, oldest first.
+          const entries =
+            payload.type === "new_logs"
+              ? [...payload.data].reverse()
+              : payload.type === "new_log"
+                ? [payload.data]
+                : [];
+          if (entries.length > 0) {
+            setMessages((prev) => [...entries, ...prev].slice(0, MAX_MESSAGES));
           }
         } catch {
           // ignore malformed messages
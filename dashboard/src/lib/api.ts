@@ -22,6 +22,21 @@ export interface LogEntry {
   created_at: string;
 }
 
+export interface LogPage {
+  items: LogEntry[];
+  next_cursor: string | null;
+}
+
+export interface LogFilters {
+  ip?: string;
+  action?: LogEntry["action_taken"];
+  threat_type?: string;
+  min_score?: number;
+  max_score?: number;
+  since?: string;
+  until?: string;
+}
+
 export interface Stats {
   total_requests: number;
   blocked_requests: number;
@@ -38,6 +53,8 @@ export interface Rule {
   pattern: string;
   score: number;
   action: string;
+  transforms: string[];
+  targets: string[];
   enabled: boolean;
   created_at: string;
 }
@@ -52,8 +69,14 @@ export interface BlockedIP {
 
 // ── API calls ──────────────────────────────────────────────────────────────
 
-export const getLogs = (limit = 50, offset = 0) =>
-  request<LogEntry[]>(`/api/logs?limit=${limit}&offset=${offset}`);
+export const getLogs = (limit = 50, cursor?: string | null, filters: LogFilters = {}) => {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  for (const [key, value] of Object.entries(filters)) {
+    if (value !== undefined && value !== "") params.set(key, String(value));
+  }
+  return request<LogPage>(`/api/logs?${params}`);
+};
 
 export const getStats = () => request<Stats>("/api/stats");
 
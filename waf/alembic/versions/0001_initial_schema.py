@@ -0,0 +1,69 @@
+"""Initial schema
+
+The tables as originally created by ``Base.metadata.create_all``. Databases
+that were set up that way already match this revision and only need
+``alembic stamp 0001``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "attack_logs",
+        sa.Column("id", postgresql.UUID(as_uuid=False), primary_key=True),
+        sa.Column("ip_address", sa.VARCHAR(45), nullable=False),
+        sa.Column("method", sa.VARCHAR(10), nullable=False),
+        sa.Column("endpoint", sa.Text(), nullable=False),
+        sa.Column("headers", postgresql.JSONB(), nullable=True),
+        sa.Column("request_body", sa.Text(), nullable=True),
+        sa.Column("threat_score", sa.Integer(), nullable=False),
+        sa.Column("action_taken", sa.VARCHAR(20), nullable=False),
+        sa.Column("threat_types", postgresql.ARRAY(sa.Text()), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "waf_rules",
+        sa.Column("id", postgresql.UUID(as_uuid=False), primary_key=True),
+        sa.Column("name", sa.VARCHAR(255), nullable=False),
+        sa.Column("type", sa.VARCHAR(50), nullable=False),
+        sa.Column("pattern", sa.Text(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=False),
+        sa.Column("action", sa.VARCHAR(20), nullable=False),
+        sa.Column("enabled", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "blocked_ips",
+        sa.Column("id", postgresql.UUID(as_uuid=False), primary_key=True),
+        sa.Column("ip_address", sa.VARCHAR(45), nullable=False, unique=True),
+        sa.Column("reason", sa.Text(), nullable=True),
+        sa.Column("expires_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "ip_rate_limits",
+        sa.Column("ip_address", sa.VARCHAR(45), primary_key=True),
+        sa.Column("request_count", sa.Integer(), nullable=False),
+        sa.Column("window_start", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ip_rate_limits")
+    op.drop_table("blocked_ips")
+    op.drop_table("waf_rules")
+    op.drop_table("attack_logs")
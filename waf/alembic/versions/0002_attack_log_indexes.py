@@ -0,0 +1,55 @@
+"""Indexes for attack log browsing and stats
+
+Supports keyset pagination of /api/logs on (created_at, id) and its filters
+by IP, action, score and threat type. Indexes are built CONCURRENTLY so a
+large attack_logs table stays writable while they are created.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copied, deliberately, into 0003 and AttackLog.__table_args__: a migration
+# is frozen once released and must keep building the schema of its own
+# revision, so it never imports a list that later code could change.
+_INDEXES = [
+    ("ix_attack_logs_created_at_id", ["created_at", "id"], "btree"),
+    ("ix_attack_logs_ip_created_at", ["ip_address", "created_at", "id"], "btree"),
+    ("ix_attack_logs_action_created_at", ["action_taken", "created_at", "id"], "btree"),
+    ("ix_attack_logs_threat_score", ["threat_score"], "btree"),
+    ("ix_attack_logs_threat_types", ["threat_types"], "gin"),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, columns, using in _INDEXES:
+            op.create_index(
+                name,
+                "attack_logs",
+                columns,
+                postgresql_using=using,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(_INDEXES):
+            op.drop_index(
+                name,
+                table_name="attack_logs",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
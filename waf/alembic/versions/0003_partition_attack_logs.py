@@ -0,0 +1,110 @@
+"""Partition attack_logs by day
+
+The existing table is not copied. It is renamed to attack_logs_legacy and
+attached to the new partitioned attack_logs as the partition for everything
+before tomorrow (UTC). New rows go to daily partitions created by
+app/log_retention.py. The legacy partition is dropped by the retention job once
+its newest possible row falls out of the retention window.
+
+The primary key becomes (id, created_at), as Postgres requires the partition
+key in every unique constraint. Rebuilding it on a large table takes a
+while; run this with the WAF stopped.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from datetime import datetime, time, timedelta, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The indexes as of 0002, rebuilt on the partitioned table. A copy, not an
+# import: like any released migration this one must not change when 0002 or
+# the models do (see the note in 0002).
+_INDEXES = [
+    ("ix_attack_logs_created_at_id", ["created_at", "id"], "btree"),
+    ("ix_attack_logs_ip_created_at", ["ip_address", "created_at", "id"], "btree"),
+    ("ix_attack_logs_action_created_at", ["action_taken", "created_at", "id"], "btree"),
+    ("ix_attack_logs_threat_score", ["threat_score"], "btree"),
+    ("ix_attack_logs_threat_types", ["threat_types"], "gin"),
+]
+
+
+def _columns() -> list[sa.Column]:
+    return [
+        sa.Column("id", postgresql.UUID(as_uuid=False), nullable=False),
+        sa.Column("ip_address", sa.VARCHAR(45), nullable=False),
+        sa.Column("method", sa.VARCHAR(10), nullable=False),
+        sa.Column("endpoint", sa.Text(), nullable=False),
+        sa.Column("headers", postgresql.JSONB(), nullable=True),
+        sa.Column("request_body", sa.Text(), nullable=True),
+        sa.Column("threat_score", sa.Integer(), nullable=False),
+        sa.Column("action_taken", sa.VARCHAR(20), nullable=False),
+        sa.Column("threat_types", postgresql.ARRAY(sa.Text()), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    tomorrow = datetime.combine(
+        datetime.now(timezone.utc).date() + timedelta(days=1), time.min, tzinfo=timezone.utc
+    ).isoformat()
+
+    # ── Set the old table aside as a partition-to-be ──────────────────────────
+    op.rename_table("attack_logs", "attack_logs_legacy")
+    for name, _, _ in _INDEXES:
+        legacy_name = name.replace("ix_attack_logs", "ix_attack_logs_legacy")
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {legacy_name}")
+    op.execute("ALTER TABLE attack_logs_legacy DROP CONSTRAINT attack_logs_pkey")
+    op.execute(
+        "ALTER TABLE attack_logs_legacy "
+        "ADD CONSTRAINT attack_logs_legacy_pkey PRIMARY KEY (id, created_at)"
+    )
+    # Proves the partition bound up front so ATTACH doesn't rescan the table.
+    op.execute(
+        "ALTER TABLE attack_logs_legacy ADD CONSTRAINT attack_logs_legacy_bound "
+        f"CHECK (created_at < '{tomorrow}')"
+    )
+
+    # ── Partitioned parent ────────────────────────────────────────────────────
+    op.create_table(
+        "attack_logs",
+        *_columns(),
+        sa.PrimaryKeyConstraint("id", "created_at", name="attack_logs_pkey"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    for name, columns, using in _INDEXES:
+        op.create_index(name, "attack_logs", columns, postgresql_using=using)
+
+    op.execute(
+        "ALTER TABLE attack_logs ATTACH PARTITION attack_logs_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{tomorrow}')"
+    )
+    op.execute("ALTER TABLE attack_logs_legacy DROP CONSTRAINT attack_logs_legacy_bound")
+    op.execute("CREATE TABLE attack_logs_default PARTITION OF attack_logs DEFAULT")
+
+
+def downgrade() -> None:
+    op.rename_table("attack_logs", "attack_logs_partitioned")
+    op.execute(
+        "ALTER TABLE attack_logs_partitioned "
+        "RENAME CONSTRAINT attack_logs_pkey TO attack_logs_partitioned_pkey"
+    )
+    op.create_table(
+        "attack_logs",
+        *_columns(),
+        sa.PrimaryKeyConstraint("id", name="attack_logs_pkey"),
+    )
+    op.execute("INSERT INTO attack_logs SELECT * FROM attack_logs_partitioned")
+    op.execute("DROP TABLE attack_logs_partitioned CASCADE")
+    for name, columns, using in _INDEXES:
+        op.create_index(name, "attack_logs", columns, postgresql_using=using)
@@ -0,0 +1,60 @@
+"""Per-rule normalization transforms
+
+Adds waf_rules.transforms, the chain of decoders a rule's pattern is matched
+through (see app/normalize.py), and gives the default rules the chains they
+are seeded with today. Other rules keep matching the raw text.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_SQL = ["url_decode", "html_decode", "remove_comments", "compress_whitespace"]
+_MARKUP = ["url_decode", "html_decode", "escape_decode"]
+
+_DEFAULT_RULE_TRANSFORMS = {
+    "SQLi – UNION SELECT": _SQL,
+    "SQLi – Tautology (OR 1=1)": _SQL,
+    "SQLi – Inline Comment": ["url_decode", "html_decode"],
+    "SQLi – Stacked Queries": _SQL,
+    "XSS – Script Tag": _MARKUP,
+    "XSS – Inline Event Handler": _MARKUP,
+    "XSS – javascript: Protocol": _MARKUP,
+    "Path Traversal – Dot-Dot Slash": ["url_decode"],
+    "Path Traversal – Sensitive Files": ["url_decode"],
+    "CmdInjection – Shell Metacharacters": ["url_decode"],
+    "CmdInjection – Subshell": ["url_decode"],
+    "SSRF – Internal Address": ["url_decode"],
+}
+
+
+def upgrade() -> None:
+    op.add_column(
+        "waf_rules", sa.Column("transforms", postgresql.ARRAY(sa.Text()), nullable=True)
+    )
+    waf_rules = sa.table(
+        "waf_rules",
+        sa.column("name", sa.VARCHAR(255)),
+        sa.column("transforms", postgresql.ARRAY(sa.Text())),
+    )
+    for name, transforms in _DEFAULT_RULE_TRANSFORMS.items():
+        op.execute(
+            waf_rules.update()
+            .where(waf_rules.c.name == name, waf_rules.c.transforms.is_(None))
+            .values(transforms=transforms)
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("waf_rules", "transforms")
@@ -0,0 +1,58 @@
+"""Per-rule inspection targets
+
+Adds waf_rules.targets, the parts of the request a rule scans (see
+app/targets.py), and gives the default rules the targets they are seeded with
+today. Other rules keep scanning path, query and body.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_EVERYWHERE = ["path", "query", "body", "headers", "cookies"]
+_NO_HEADERS = ["path", "query", "body", "cookies"]
+
+_DEFAULT_RULE_TARGETS = {
+    "SQLi – UNION SELECT": _EVERYWHERE,
+    "SQLi – Tautology (OR 1=1)": _EVERYWHERE,
+    "SQLi – Inline Comment": ["query", "body"],
+    "SQLi – Stacked Queries": _EVERYWHERE,
+    "XSS – Script Tag": _EVERYWHERE,
+    "XSS – Inline Event Handler": _EVERYWHERE,
+    "XSS – javascript: Protocol": _EVERYWHERE,
+    "Path Traversal – Dot-Dot Slash": _NO_HEADERS,
+    "Path Traversal – Sensitive Files": _NO_HEADERS,
+    "CmdInjection – Shell Metacharacters": _NO_HEADERS,
+    "CmdInjection – Subshell": _NO_HEADERS,
+    "SSRF – Internal Address": ["query", "body"],
+}
+
+
+def upgrade() -> None:
+    op.add_column("waf_rules", sa.Column("targets", postgresql.ARRAY(sa.Text()), nullable=True))
+    waf_rules = sa.table(
+        "waf_rules",
+        sa.column("name", sa.VARCHAR(255)),
+        sa.column("targets", postgresql.ARRAY(sa.Text())),
+    )
+    for name, targets in _DEFAULT_RULE_TARGETS.items():
+        op.execute(
+            waf_rules.update()
+            .where(waf_rules.c.name == name, waf_rules.c.targets.is_(None))
+            .values(targets=targets)
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("waf_rules", "targets")
@@ -0,0 +1,34 @@
+"""Let the default inline-comment rule count towards blocks
+
+Rules whose action is "log" are now monitor-only and no longer add to the
+score that decides a block. The default "SQLi – Inline Comment" rule (score
+20, far below the threshold on its own) exists to tip combinations such as
+``' OR 1=1 --`` over it, so it becomes a "block" rule.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE waf_rules SET action = 'block' "
+        "WHERE name = 'SQLi – Inline Comment' AND action = 'log'"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE waf_rules SET action = 'log' "
+        "WHERE name = 'SQLi – Inline Comment' AND action = 'block'"
+    )
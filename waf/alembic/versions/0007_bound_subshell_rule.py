@@ -0,0 +1,47 @@
+"""Bound the default subshell rule
+
+Rule patterns are now profiled against adversarial input when loaded, and
+the original "CmdInjection – Subshell" pattern backtracks quadratically on a
+long run of "$(" — it would be rejected. Replace it with the bounded pattern
+new installs are seeded with, unless it has been edited.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_NAME = "CmdInjection – Subshell"
+_OLD_PATTERN = r"(\$\(|\`)[^)]*[)|\`]"
+_NEW_PATTERN = r"\$\([^)]{0,100}\)|`[^`]{0,100}`"
+
+_waf_rules = sa.table(
+    "waf_rules",
+    sa.column("name", sa.VARCHAR(255)),
+    sa.column("pattern", sa.Text()),
+)
+
+
+def _replace(old: str, new: str) -> None:
+    op.execute(
+        _waf_rules.update()
+        .where(_waf_rules.c.name == _NAME, _waf_rules.c.pattern == old)
+        .values(pattern=new)
+    )
+
+
+def upgrade() -> None:
+    _replace(_OLD_PATTERN, _NEW_PATTERN)
+
+
+def downgrade() -> None:
+    _replace(_NEW_PATTERN, _OLD_PATTERN)
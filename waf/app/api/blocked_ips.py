@@ -1,12 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException
+import uuid
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, field_validator
 from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.blocklist import announce_block, announce_reload, announce_unblock, block_key
 from app.core.database import get_db
+from app.core.serialization import FastJSONResponse
 from app.models.models import BlockedIP
+from app.prefix_table import normalize_network
+from app.reputation import reputation_keys
 
 router = APIRouter(prefix="/api", tags=["blocked-ips"])
 
+# Rows per INSERT during bulk import (5 bind parameters each, well under
+# Postgres' 32767-parameter limit).
+_IMPORT_BATCH = 5000
+
+
+class BlockIPRequest(BaseModel):
+    # A single address ("203.0.113.7") or a CIDR network ("203.0.113.0/24").
+    ip_address: str
+    reason: str | None = None
+    expires_at: datetime | None = None
+
+    @field_validator("ip_address")
+    @classmethod
+    def _valid_network(cls, value: str) -> str:
+        return normalize_network(value)
+
 
 def _serialize_ip(ip: BlockedIP) -> dict:
     return {
@@ -22,16 +47,106 @@ def _serialize_ip(ip: BlockedIP) -> dict:
 async def list_blocked_ips(db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(BlockedIP).order_by(BlockedIP.created_at.desc()))
     ips = result.scalars().all()
-    return [_serialize_ip(ip) for ip in ips]
+    return FastJSONResponse([_serialize_ip(ip) for ip in ips])
+
+
+@router.post("/blocked-ips", status_code=201)
+async def block_ip(payload: BlockIPRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(BlockedIP).where(BlockedIP.ip_address == payload.ip_address)
+    )
+    if result.scalar_one_or_none() is not None:
+        raise HTTPException(status_code=409, detail="IP is already blocked")
+
+    ip = BlockedIP(
+        ip_address=payload.ip_address,
+        reason=payload.reason,
+        expires_at=payload.expires_at,
+    )
+    db.add(ip)
+    await db.commit()
+    await db.refresh(ip)
+
+    await announce_block(request.app.state.redis, ip.ip_address, ip.expires_at)
+    return _serialize_ip(ip)
+
 
+@router.post("/blocked-ips/import")
+async def import_blocked_ips(
+    request: Request,
+    reason: str | None = Query(None),
+    expires_at: datetime | None = Query(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Bulk-import a threat-intel feed: one address or CIDR per line, '#' comments."""
+    body = (await request.body()).decode("utf-8", errors="replace")
+
+    networks: set[str] = set()
+    invalid: list[str] = []
+    for line in body.splitlines():
+        entry = line.split("#", 1)[0].strip()
+        if not entry:
+            continue
+        try:
+            networks.add(normalize_network(entry))
+        except ValueError:
+            invalid.append(entry)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "ip_address": network,
+            "reason": reason,
+            "expires_at": expires_at,
+            "created_at": now,
+        }
+        for network in networks
+    ]
+    imported = 0
+    for start in range(0, len(rows), _IMPORT_BATCH):
+        stmt = (
+            insert(BlockedIP)
+            .values(rows[start : start + _IMPORT_BATCH])
+            .on_conflict_do_nothing(index_elements=["ip_address"])
+        )
+        imported += (await db.execute(stmt)).rowcount
+    await db.commit()
+
+    # Every worker rebuilds its table with one query rather than receiving
+    # tens of thousands of individual add messages.
+    await announce_reload(request.app.state.redis)
+    return {
+        "imported": imported,
+        "already_blocked": len(networks) - imported,
+        "invalid": len(invalid),
+        "invalid_entries": invalid[:20],
+    }
+
+
+@router.delete("/blocked-ips/{ip_address:path}")
+async def unblock_ip(ip_address: str, request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        ip_address = normalize_network(ip_address)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="IP not found in blocklist")
 
-@router.delete("/blocked-ips/{ip_address}")
-async def unblock_ip(ip_address: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(BlockedIP).where(BlockedIP.ip_address == ip_address))
     ip = result.scalar_one_or_none()
-    if ip is None:
+    if ip is not None:
+        await db.execute(delete(BlockedIP).where(BlockedIP.ip_address == ip_address))
+        await db.commit()
+
+    # Lift any temporary block too (rate limit or reputation, which have no
+    # row), and forget the address's reputation so it doesn't re-block at once.
+    redis = request.app.state.redis
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.delete(block_key(ip_address))
+        pipe.delete(*reputation_keys(ip_address))
+        lifted, _ = await pipe.execute()
+    if ip is None and not lifted:
         raise HTTPException(status_code=404, detail="IP not found in blocklist")
 
-    await db.execute(delete(BlockedIP).where(BlockedIP.ip_address == ip_address))
-    await db.commit()
+    # Drop the entry and any cached block decision in every worker.
+    await announce_unblock(redis, ip_address)
     return {"message": f"{ip_address} has been unblocked"}
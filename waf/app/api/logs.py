@@ -1,11 +1,15 @@
+import base64
 import json
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import desc, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import desc, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
-from app.core.database import get_db
+from app.core.database import get_read_db
+from app.core.serialization import FastJSONResponse
 from app.models.models import AttackLog
 
 router = APIRouter(prefix="/api", tags=["logs"])
@@ -24,74 +28,88 @@ def _serialize_log(log: AttackLog) -> dict:
     }
 
 
+def _encode_cursor(log: AttackLog) -> str:
+    raw = json.dumps([log.created_at.isoformat(), log.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), str(uuid.UUID(log_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+
+
 @router.get("/logs")
 async def list_logs(
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    ip: str | None = Query(None),
+    action: str | None = Query(None),
+    threat_type: str | None = Query(None),
+    min_score: int | None = Query(None, ge=0),
+    max_score: int | None = Query(None, ge=0),
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    result = await db.execute(
-        select(AttackLog).order_by(desc(AttackLog.created_at)).limit(limit).offset(offset)
-    )
-    logs = result.scalars().all()
-    return [_serialize_log(log) for log in logs]
-
-
-@router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(get_db)):
-    total_result = await db.execute(select(func.count()).select_from(AttackLog))
-    total = total_result.scalar() or 0
-
-    blocked_result = await db.execute(
-        select(func.count()).select_from(AttackLog).where(AttackLog.action_taken == "block")
-    )
-    blocked = blocked_result.scalar() or 0
+    """Newest-first page of attack logs.
 
-    allowed_result = await db.execute(
-        select(func.count()).select_from(AttackLog).where(AttackLog.action_taken == "allow")
+    Pages are keyset-paginated on (created_at, id): pass the returned
+    next_cursor to get the following page. Unlike OFFSET, the cost of a page
+    does not depend on how deep it is.
+    """
+    query = select(AttackLog).options(
+        load_only(
+            AttackLog.id,
+            AttackLog.ip_address,
+            AttackLog.method,
+            AttackLog.endpoint,
+            AttackLog.threat_score,
+            AttackLog.action_taken,
+            AttackLog.threat_types,
+            AttackLog.created_at,
+        )
     )
-    allowed = allowed_result.scalar() or 0
+    if cursor is not None:
+        query = query.where(
+            tuple_(AttackLog.created_at, AttackLog.id) < tuple_(*_decode_cursor(cursor))
+        )
+    if ip is not None:
+        query = query.where(AttackLog.ip_address == ip)
+    if action is not None:
+        query = query.where(AttackLog.action_taken == action)
+    if threat_type is not None:
+        # Array containment (@>) is served by the GIN index on threat_types.
+        query = query.where(AttackLog.threat_types.contains([threat_type]))
+    if min_score is not None:
+        query = query.where(AttackLog.threat_score >= min_score)
+    if max_score is not None:
+        query = query.where(AttackLog.threat_score <= max_score)
+    if since is not None:
+        query = query.where(AttackLog.created_at >= since)
+    if until is not None:
+        query = query.where(AttackLog.created_at < until)
 
-    # Top 5 attacking IPs
-    top_ips_result = await db.execute(
-        select(AttackLog.ip_address, func.count().label("count"))
-        .group_by(AttackLog.ip_address)
-        .order_by(desc("count"))
-        .limit(5)
+    # One extra row tells whether there is a next page.
+    result = await db.execute(
+        query.order_by(desc(AttackLog.created_at), desc(AttackLog.id)).limit(limit + 1)
     )
-    top_ips = [{"ip": row.ip_address, "count": row.count} for row in top_ips_result]
-
-    # Threat type distribution (unnest TEXT[] column)
-    threat_rows = await db.execute(
-        select(AttackLog.threat_types).where(AttackLog.threat_types.isnot(None))
+    logs = result.scalars().all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+    # Returned as a response, so the page skips FastAPI's jsonable_encoder pass.
+    return FastJSONResponse(
+        {
+            "items": [_serialize_log(log) for log in logs],
+            "next_cursor": _encode_cursor(logs[-1]) if has_more else None,
+        }
     )
-    threat_counter: dict[str, int] = {}
-    for row in threat_rows:
-        for t in (row.threat_types or []):
-            threat_counter[t] = threat_counter.get(t, 0) + 1
-    threat_distribution = [{"type": k, "count": v} for k, v in threat_counter.items()]
 
-    # Requests per hour over last 24 hours
-    since = datetime.utcnow() - timedelta(hours=24)
-    hourly_result = await db.execute(
-        select(
-            func.date_trunc("hour", AttackLog.created_at).label("hour"),
-            func.count().label("count"),
-        )
-        .where(AttackLog.created_at >= since)
-        .group_by("hour")
-        .order_by("hour")
-    )
-    requests_over_time = [
-        {"hour": row.hour.strftime("%H:%M") if row.hour else "", "count": row.count}
-        for row in hourly_result
-    ]
 
-    return {
-        "total_requests": total,
-        "blocked_requests": blocked,
-        "allowed_requests": allowed,
-        "top_ips": top_ips,
-        "threat_distribution": threat_distribution,
-        "requests_over_time": requests_over_time,
-    }
+@router.get("/stats")
+async def get_stats(request: Request):
+    # Answered from counters maintained as logs are written (app/stats.py),
+    # so the cost doesn't grow with the attack_logs table.
+    return FastJSONResponse(await request.app.state.stats.snapshot())
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
+from app.core.serialization import FastJSONResponse
 from app.models.models import WafRule
+from app.ruleset import compile_rules, rule_store
+from app.targets import DEFAULT_TARGETS
 
 router = APIRouter(prefix="/api", tags=["rules"])
 
@@ -16,26 +21,44 @@ def _serialize_rule(rule: WafRule) -> dict:
         "pattern": rule.pattern,
         "score": rule.score,
         "action": rule.action,
+        "transforms": rule.transforms or [],
+        "targets": rule.targets or list(DEFAULT_TARGETS),
         "enabled": rule.enabled,
         "created_at": rule.created_at.isoformat() if rule.created_at else None,
     }
 
 
 @router.get("/rules")
-async def list_rules(db: AsyncSession = Depends(get_db)):
+async def list_rules(db: AsyncSession = Depends(get_read_db)):
+    # May lag a toggle by the replica's delay; the dashboard doesn't reload
+    # the list after one but applies the rule toggle_rule returns.
     result = await db.execute(select(WafRule).order_by(WafRule.created_at))
     rules = result.scalars().all()
-    return [_serialize_rule(rule) for rule in rules]
+    return FastJSONResponse([_serialize_rule(rule) for rule in rules])
 
 
 @router.patch("/rules/{rule_id}/toggle")
-async def toggle_rule(rule_id: str, db: AsyncSession = Depends(get_db)):
+async def toggle_rule(rule_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(WafRule).where(WafRule.id == rule_id))
     rule = result.scalar_one_or_none()
     if rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
 
+    if not rule.enabled:
+        # A rule failing validation would be left out of the live rule set;
+        # refuse to enable it rather than report a success that isn't one.
+        # (Vetting may profile the pattern; verdicts are cached per pattern.)
+        vetted = await asyncio.to_thread(compile_rules, [rule], version=0)
+        if rule.name in vetted.rejected:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Rule cannot be enabled: {vetted.rejected[rule.name]}",
+            )
+
     rule.enabled = not rule.enabled
     await db.commit()
     await db.refresh(rule)
+
+    # Rebuild the in-memory rule set here and in every other worker.
+    await rule_store.notify_changed(request.app.state.redis)
     return _serialize_rule(rule)
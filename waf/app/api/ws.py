@@ -1,27 +1,108 @@
+"""Dashboard WebSocket fan-out.
+
+Log events reach ``ConnectionManager.publish_logs()`` already serialized —
+once per event, by the worker that wrote them — and are only appended to each
+client's bounded queue, so publishing never waits on a socket. Every client
+has its own sender task that coalesces whatever is pending into a single
+``new_logs`` frame, at most one frame per WS_FLUSH_INTERVAL_MS.
+
+A client that falls behind loses its oldest pending events once its queue is
+full; one whose socket stops accepting data for WS_SEND_TIMEOUT_SECONDS is
+disconnected. Neither can slow down the log writer, the event bus or other
+clients.
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections import deque
+
 from fastapi import WebSocket
 
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Attack-log events, published once per written batch by the worker that
+# wrote it and delivered to the dashboard clients of every worker.
+LOGS_CHANNEL = "waf:logs:new"
+
+
+class _Client:
+    __slots__ = ("websocket", "pending", "wakeup", "task")
+
+    def __init__(self, websocket: WebSocket, queue_size: int) -> None:
+        self.websocket = websocket
+        # Serialized log events not yet sent; the oldest fall off when full.
+        self.pending: deque[str] = deque(maxlen=queue_size)
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    def __init__(
+        self,
+        queue_size: int = settings.WS_CLIENT_QUEUE_SIZE,
+        flush_interval: float = settings.WS_FLUSH_INTERVAL_MS / 1000,
+        send_timeout: float = settings.WS_SEND_TIMEOUT_SECONDS,
+    ):
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.send_timeout = send_timeout
+        self._clients: dict[WebSocket, _Client] = {}
+        self.dropped = 0
+        self.frames_sent = 0
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self._clients)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = _Client(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self._clients[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        dead = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                dead.append(connection)
-        for connection in dead:
-            self.disconnect(connection)
+        client = self._clients.pop(websocket, None)
+        if client is not None and client.task is not None:
+            client.task.cancel()
+
+    def publish_logs(self, events: list[str]) -> None:
+        """Queue serialized log events for every client. Never blocks."""
+        for client in self._clients.values():
+            pending = client.pending
+            overflow = len(pending) + len(events) - self.queue_size
+            if overflow > 0:
+                self.dropped += overflow
+            pending.extend(events)
+            client.wakeup.set()
+
+    async def on_logs_event(self, data: str) -> None:
+        """Event bus handler: `data` holds one serialized log event per line."""
+        self.publish_logs(data.split("\n"))
+
+    async def _sender(self, client: _Client) -> None:
+        websocket = client.websocket
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                events = list(client.pending)
+                client.pending.clear()
+                # The events are JSON already; the frame is assembled as text.
+                frame = '{"type":"new_logs","data":[' + ",".join(events) + "]}"
+                await asyncio.wait_for(websocket.send_text(frame), self.send_timeout)
+                self.frames_sent += 1
+                # Whatever arrives meanwhile goes out together in the next frame.
+                await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.info("Dropping slow or closed dashboard WebSocket client")
+            self._clients.pop(websocket, None)
+            with contextlib.suppress(Exception):
+                await websocket.close()
 
 
 manager = ConnectionManager()
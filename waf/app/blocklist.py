@@ -0,0 +1,203 @@
+"""In-process IP blocklist: CIDR table plus a cache of block decisions.
+
+The ``blocked_ips`` table — single addresses and CIDR networks — is loaded
+into a ``PrefixTable`` at startup, so permanent blocks are resolved in memory
+with a longest-prefix match instead of a Postgres SELECT per request.
+Temporary blocks live in Redis as ``blocked:{ip}`` keys with a TTL (the braces
+are literal: a Redis Cluster hash tag, see block_key()); decisions
+from both sources, positive and negative, are cached per worker in a bounded
+LRU so repeat traffic from an IP is decided without any network I/O.
+
+Every change is published on ``waf:blocklist:changed`` (see
+app/core/events.py) as a small JSON message, and each worker applies it to its
+own table and cache:
+
+* ``add`` / ``remove`` — one network was blocked or unblocked via the API.
+* ``reload``           — bulk import; reload the table from Postgres.
+* ``invalidate``       — a temporary Redis block changed for one IP.
+
+Positive decisions never outlive the block itself: Redis key TTLs and
+``BlockedIP.expires_at`` are both honoured in memory.
+"""
+
+import json
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import redis.asyncio as aioredis
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.events import event_bus
+from app.core.metrics import STAGE_REDIS_BLOCK_LOOKUP
+from app.models.models import BlockedIP
+from app.prefix_table import PrefixTable, expiry_timestamp, parse_cidr
+
+logger = logging.getLogger(__name__)
+
+BLOCKLIST_CHANNEL = "waf:blocklist:changed"
+
+
+def block_key(ip: str) -> str:
+    """Redis key of `ip`'s temporary block.
+
+    Every per-IP key (rate-limit counters, reputation) tags the IP the same
+    way, so the keys one Lua script touches share a Redis Cluster slot.
+    """
+    return f"blocked:{{{ip}}}"
+
+
+class BlockCache:
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.networks = PrefixTable()
+        # ip -> (blocked, monotonic deadline)
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Identifies this process on the channel so it can skip its own messages.
+        self.instance_id = uuid.uuid4().hex
+
+    # ── Decision cache ───────────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, ip: str) -> bool | None:
+        entry = self._entries.get(ip)
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(ip)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, ip: str, blocked: bool, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[ip] = (blocked, time.monotonic() + ttl)
+        self._entries.move_to_end(ip)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, ip: str | None = None) -> None:
+        """Forget the decision for `ip`, or every decision when `ip` is None."""
+        if ip is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(ip, None)
+
+    async def is_blocked(self, redis: aioredis.Redis, ip: str) -> bool:
+        """Return the block decision for `ip`; a miss costs one Redis PTTL."""
+        cached = self.get(ip)
+        if cached is not None:
+            return cached
+
+        # Temporary blocks (rate limiter, manual) live in Redis with a TTL.
+        started = time.perf_counter()
+        pttl = await redis.pttl(block_key(ip))
+        STAGE_REDIS_BLOCK_LOOKUP.observe(time.perf_counter() - started)
+        if pttl != -2:
+            # -1 means the key has no expiry: cache for the regular TTL.
+            self.put(ip, True, pttl / 1000 if pttl > 0 else None)
+            return True
+
+        expires = self.networks.lookup(ip)
+        if expires is None:
+            self.put(ip, False)
+            return False
+        self.put(ip, True, None if expires == math.inf else expires - time.time())
+        return True
+
+    # ── Network table ────────────────────────────────────────────────────────
+
+    async def load(self) -> int:
+        """Rebuild the network table from the blocked_ips table."""
+        table = PrefixTable()
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(select(BlockedIP.ip_address, BlockedIP.expires_at))
+            async for ip_address, expires_at in result:
+                try:
+                    table.add(ip_address, expiry_timestamp(expires_at))
+                except ValueError:
+                    logger.warning("Ignoring malformed blocklist entry %r", ip_address)
+        self.networks = table
+        self.invalidate()
+        return len(table)
+
+    def apply(self, message: dict) -> None:
+        op = message["op"]
+        if op == "reload":
+            return
+        network = message["network"]
+        if op == "add":
+            self.networks.add(network, message.get("expires", math.inf))
+        elif op == "remove":
+            self.networks.remove(network)
+        # A single host only affects its own decision; a wider network may
+        # cover any number of cached IPs.
+        try:
+            bits, prefixlen, _ = parse_cidr(network)
+        except ValueError:
+            # A client "IP" that isn't an address (e.g. "unknown").
+            bits = prefixlen = 0
+        if prefixlen == bits:
+            self.invalidate(network)
+        else:
+            self.invalidate()
+
+    async def on_change(self, data: str) -> None:
+        """Event bus handler: apply a change announced by another worker."""
+        try:
+            change = json.loads(data)
+            if change.get("source") == self.instance_id:
+                return
+            if change["op"] == "reload":
+                await self.load()
+            else:
+                self.apply(change)
+        except (ValueError, KeyError):
+            logger.warning("Ignoring bad blocklist message %r", data)
+
+
+block_cache = BlockCache(
+    max_size=settings.BLOCK_CACHE_SIZE,
+    ttl=settings.BLOCK_CACHE_TTL_SECONDS,
+)
+
+
+async def _announce(redis: aioredis.Redis, change: dict) -> None:
+    change["source"] = block_cache.instance_id
+    await event_bus.publish(redis, BLOCKLIST_CHANNEL, json.dumps(change))
+
+
+async def announce_block(
+    redis: aioredis.Redis, network: str, expires_at: datetime | None = None
+) -> None:
+    """Add `network` here and in every other worker."""
+    change: dict = {"op": "add", "network": network}
+    expires = expiry_timestamp(expires_at)
+    if expires != math.inf:
+        change["expires"] = expires
+    block_cache.apply(change)
+    await _announce(redis, change)
+
+
+async def announce_unblock(redis: aioredis.Redis, network: str) -> None:
+    """Remove `network` here and in every other worker."""
+    change = {"op": "remove", "network": network}
+    block_cache.apply(change)
+    await _announce(redis, change)
+
+
+async def announce_reload(redis: aioredis.Redis) -> None:
+    """Reload the table from Postgres here and in every other worker."""
+    await block_cache.load()
+    await _announce(redis, {"op": "reload"})
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,6 +14,133 @@ class Settings(BaseSettings):
     THREAT_SCORE_THRESHOLD: int = 50
     CORS_ORIGINS: str = "http://localhost:3000"
 
+    # Database connection pools per worker (see app/core/database.py): the
+    # write pool serves the proxy, the read pool the dashboard queries — on
+    # DATABASE_READ_URL (a read-only replica) if set, else on the primary
+    DATABASE_READ_URL: str = ""
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_READ_POOL_SIZE: int = 5
+    DB_READ_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_ECHO: bool = False
+
+    # Per-worker cache of IP block decisions (see app/blocklist.py)
+    BLOCK_CACHE_SIZE: int = 100_000
+    BLOCK_CACHE_TTL_SECONDS: float = 30.0
+
+    # Sliding-window rate limiting (see app/rate_limit.py). RATE_LIMIT_ROUTES
+    # adds per-IP limits for path prefixes, e.g. "/login=10,/api/=300".
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REQUESTS: int = 600
+    RATE_LIMIT_WINDOW_SECONDS: int = 60
+    RATE_LIMIT_ROUTES: str = ""
+    RATE_LIMIT_BLOCK_SECONDS: int = 300
+
+    # Per-IP reputation (see app/reputation.py): threat scores add up per IP
+    # and halve every REPUTATION_HALF_LIFE_SECONDS; reaching
+    # REPUTATION_BLOCK_SCORE blocks the IP for REPUTATION_BLOCK_SECONDS, and
+    # REPUTATION_ESCALATE_AFTER such blocks within the window (0 = never) add
+    # it to blocked_ips for REPUTATION_ESCALATE_BLOCK_DAYS (0 = permanently)
+    REPUTATION_ENABLED: bool = True
+    REPUTATION_HALF_LIFE_SECONDS: float = 600.0
+    REPUTATION_BLOCK_SCORE: float = 300.0
+    REPUTATION_BLOCK_SECONDS: int = 900
+    REPUTATION_ESCALATE_AFTER: int = 3
+    REPUTATION_ESCALATE_WINDOW_SECONDS: int = 86_400
+    REPUTATION_ESCALATE_BLOCK_DAYS: float = 7.0
+
+    # Streaming proxy: request bodies are inspected incrementally up to the
+    # window, then forwarded; backend responses are relayed without buffering.
+    PROXY_STREAMING: bool = True
+    INSPECTION_WINDOW_BYTES: int = 1_048_576
+    INSPECTION_OVERLAP_CHARS: int = 4096
+
+    # Backend upstreams (see app/upstream.py): BACKEND_URLS, comma-separated,
+    # overrides BACKEND_URL to balance across several backends, each probed at
+    # UPSTREAM_HEALTH_PATH every UPSTREAM_HEALTH_INTERVAL_SECONDS (0 = off)
+    BACKEND_URLS: str = ""
+    UPSTREAM_HEALTH_PATH: str = "/"
+    UPSTREAM_HEALTH_INTERVAL_SECONDS: float = 5.0
+
+    # Connection pool to the backends; HTTP/2 uses h2 (httpx[http2]). The
+    # write timeout bounds sending each chunk of a request body upstream
+    UPSTREAM_MAX_CONNECTIONS: int = 200
+    UPSTREAM_MAX_KEEPALIVE: int = 100
+    UPSTREAM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    UPSTREAM_READ_TIMEOUT_SECONDS: float = 30.0
+    UPSTREAM_WRITE_TIMEOUT_SECONDS: float = 30.0
+    UPSTREAM_POOL_TIMEOUT_SECONDS: float = 5.0
+
+    # Rule evaluation (see app/engine.py): "short_circuit" stops as soon as a
+    # block is certain; INSPECTION_FULL_EVAL_FOR_LOGS then re-evaluates blocked
+    # requests in full after responding, so their log rows list every match
+    INSPECTION_MODE: Literal["full", "short_circuit"] = "short_circuit"
+    INSPECTION_FULL_EVAL_FOR_LOGS: bool = False
+
+    # Rule pattern safety (see app/regex_guard.py): "auto" runs patterns on RE2
+    # when google-re2 is installed; patterns left on re whose worst adversarial
+    # probe exceeds RULE_PROFILE_BUDGET_MS are not loaded
+    REGEX_ENGINE: Literal["auto", "re", "re2"] = "auto"
+    RULE_PROFILE_BUDGET_MS: float = 5.0
+
+    # Regex CPU time allowed per request (0 = unlimited), and the verdict for
+    # a request that runs out of it. Inspecting a benign body the size of
+    # INSPECTION_WINDOW_BYTES takes roughly 150-400 ms of CPU, so the budget
+    # leaves headroom for that; lowering it bounds pathological requests more
+    # tightly but, with "block", risks rejecting large legitimate uploads
+    INSPECTION_BUDGET_MS: float = 1000.0
+    INSPECTION_BUDGET_ACTION: Literal["block", "allow"] = "block"
+
+    # Large-payload inspection in a worker pool (see app/offload.py): "process",
+    # "thread" or "inline"; smaller bodies are always inspected inline
+    INSPECTION_OFFLOAD: Literal["inline", "thread", "process"] = "process"
+    INSPECTION_OFFLOAD_MIN_BYTES: int = 65_536
+    INSPECTION_OFFLOAD_WORKERS: int = 2
+
+    # Per-worker cache of verdicts for repeated identical requests (see
+    # app/verdict_cache.py); 0 entries = off
+    VERDICT_CACHE_SIZE: int = 50_000
+    VERDICT_CACHE_TTL_SECONDS: float = 300.0
+    VERDICT_CACHE_MAX_BODY_BYTES: int = 16_384
+
+    # Header values scanned by rules targeting "headers" (see app/targets.py);
+    # cookies are a target of their own
+    INSPECTION_HEADERS: str = "user-agent,referer,origin,x-original-url,x-rewrite-url"
+
+    # Attack-log pipeline (see app/log_writer.py)
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL_MS: int = 200
+    LOG_OVERFLOW_POLICY: Literal["drop", "sample", "block"] = "drop"
+    LOG_SAMPLE_RATE: float = 0.1
+
+    # Full headers/body are stored only for non-allowed requests or those
+    # scoring at least LOG_DETAIL_MIN_SCORE ("all" keeps them for everything)
+    LOG_DETAIL_POLICY: Literal["all", "flagged"] = "flagged"
+    LOG_DETAIL_MIN_SCORE: int = 1
+
+    # Daily attack_logs partitions (see app/log_retention.py); 0 = keep forever
+    LOG_RETENTION_DAYS: int = 30
+    LOG_PARTITION_PREMAKE_DAYS: int = 3
+    LOG_MAINTENANCE_INTERVAL_SECONDS: float = 3600.0
+
+    # Dashboard WebSocket fan-out (see app/api/ws.py)
+    WS_CLIENT_QUEUE_SIZE: int = 1000
+    WS_FLUSH_INTERVAL_MS: int = 250
+    WS_SEND_TIMEOUT_SECONDS: float = 5.0
+
+    # Dashboard counters in Redis (see app/stats.py)
+    STATS_TOP_IPS_CAPACITY: int = 1000
+    STATS_HOURLY_RETENTION_HOURS: int = 48
+
+    # Per-rule regex timing for /metrics: every Nth inspection (0 = off)
+    METRICS_RULE_SAMPLE_EVERY: int = 100
+
     POSTGRES_USER: str = "waf_user"
     POSTGRES_PASSWORD: str = "waf_password"
     POSTGRES_DB: str = "waf_db"
@@ -1,12 +1,54 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+"""Async SQLAlchemy engines and sessions.
+
+Two connection pools: ``engine`` on DATABASE_URL for the proxy's write path
+(attack logs, blocklist, rule toggles, stats rebuild, startup) and
+``read_engine`` for dashboard reads. The read pool connects to
+DATABASE_READ_URL — a read-only replica — when one is set, and to the primary
+otherwise; either way its connections are its own, so slow analytics queries
+can't starve the log writer of connections. Replica reads may lag the primary
+by the replication delay.
+"""
+
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import settings
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True,
-    pool_pre_ping=True,
+def _create_engine(url: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        # Prepared statements cached per connection (0 disables the cache,
+        # as PgBouncer in transaction mode requires).
+        connect_args={"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+        # JSONB columns (attack log headers) go through the fast encoder too.
+        json_serializer=dumps,
+        json_deserializer=loads,
+    )
+
+
+engine = _create_engine(settings.DATABASE_URL, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+read_engine = _create_engine(
+    settings.DATABASE_READ_URL or settings.DATABASE_URL,
+    settings.DB_READ_POOL_SIZE,
+    settings.DB_READ_MAX_OVERFLOW,
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -14,6 +56,11 @@ AsyncSessionLocal = async_sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False,
 )
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
 
 
 class Base(DeclarativeBase):
@@ -28,8 +75,73 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    """Session on the read pool, for dashboard endpoints that only query."""
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+# Serializes one-time startup work (schema creation, seeding) between workers.
+STARTUP_LOCK_KEY = 0x57414600
+
+
+async def _schema_gaps(conn) -> list[str]:
+    """What the existing tables lack compared with the models, if anything."""
+    tables = list(Base.metadata.tables)
+    result = await conn.execute(
+        text(
+            "SELECT table_name, column_name FROM information_schema.columns"
+            " WHERE table_schema = current_schema() AND table_name = ANY(:tables)"
+        ),
+        {"tables": tables},
+    )
+    existing: dict[str, set[str]] = {}
+    for table, column in result:
+        existing.setdefault(table, set()).add(column)
+    gaps = [
+        f"{name}.{column.name}"
+        for name, table in Base.metadata.tables.items()
+        if name in existing
+        for column in table.columns
+        if column.name not in existing[name]
+    ]
+    partitioned = await conn.scalar(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('attack_logs')")
+    )
+    if partitioned is False:
+        gaps.append("attack_logs partitioning")
+    return gaps
+
+
 async def init_db():
     from app.models import models  # noqa: F401 — ensures models are registered
 
     async with engine.begin() as conn:
+        # A database managed by Alembic has its schema already; skip the DDL
+        # (and the lock), only making sure it was migrated as far as the code.
+        if await conn.scalar(text("SELECT to_regclass('alembic_version') IS NOT NULL")):
+            if gaps := await _schema_gaps(conn):
+                raise RuntimeError(
+                    f"Database schema is behind the code (missing {', '.join(gaps)}); "
+                    "run `alembic upgrade head`"
+                )
+            logger.info("Schema managed by Alembic migrations; skipping create_all")
+            return
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        # create_all only adds missing tables. Tables left by a version that
+        # predates the migrations would keep their old shape, so refuse to
+        # start on them rather than fail on the first query.
+        if gaps := await _schema_gaps(conn):
+            raise RuntimeError(
+                f"Database schema predates the migrations (missing {', '.join(gaps)}); "
+                "run `alembic stamp 0001 && alembic upgrade head`"
+            )
         await conn.run_sync(Base.metadata.create_all)
+
+
+async def close_db():
+    await engine.dispose()
+    await read_engine.dispose()
@@ -0,0 +1,77 @@
+"""Redis pub/sub backbone shared by every WAF worker.
+
+Each process — uvicorn worker or container — keeps its own in-memory state:
+compiled rules, blocklist table, WebSocket clients. Changes to that state are
+announced on Redis channels, and every process applies them to its own copy:
+
+* ``waf:rules:changed``     — a rule was edited; reload the rule set.
+* ``waf:blocklist:changed`` — the blocklist changed (see app/blocklist.py).
+* ``waf:logs:new``          — a batch of attack logs was written; push it to
+  this worker's dashboard clients.
+
+A single subscriber connection per process serves all channels. When it
+drops, every subscriber's resync callback runs after reconnecting, since
+messages published in the meantime are lost.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[None]]
+Resync = Callable[[], Awaitable[None]]
+
+
+class EventBus:
+    def __init__(self) -> None:
+        self._handlers: dict[str, Handler] = {}
+        self._resyncs: list[Resync] = []
+
+    def subscribe(self, channel: str, handler: Handler, resync: Resync | None = None) -> None:
+        """Call `handler` with the payload of every message on `channel`."""
+        self._handlers[channel] = handler
+        if resync is not None:
+            self._resyncs.append(resync)
+
+    async def publish(self, redis: aioredis.Redis, channel: str, data: str) -> bool:
+        """Publish to every worker, this one included. Returns False on failure."""
+        try:
+            await redis.publish(channel, data)
+        except aioredis.RedisError:
+            logger.warning("Could not publish on %s", channel)
+            return False
+        return True
+
+    async def run(self, redis: aioredis.Redis) -> None:
+        """Dispatch messages to the handlers. Runs until cancelled."""
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(*self._handlers)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        handler = self._handlers.get(message["channel"])
+                        if handler is None:
+                            continue
+                        try:
+                            await handler(message["data"])
+                        except Exception:
+                            logger.exception("Handler for %s failed", message["channel"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event bus subscription lost; retrying")
+                await asyncio.sleep(1.0)
+                for resync in self._resyncs:
+                    try:
+                        await resync()
+                    except Exception:
+                        logger.exception("Resync after reconnect failed")
+
+
+event_bus = EventBus()
@@ -0,0 +1,256 @@
+"""Low-overhead hot-path metrics, exposed in Prometheus text format.
+
+Instruments are deliberately minimal: a histogram observation is one
+``bisect`` plus three integer/float updates, and label series are resolved
+once up front (``STAGE_BLOCK_CHECK`` etc.) rather than per request. Per-rule
+timing is the one expensive measurement, so it only runs on every
+METRICS_RULE_SAMPLE_EVERY-th inspection.
+
+Values are per worker process; scrape each worker (or aggregate by
+instance) when running several.
+"""
+
+import math
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from app.core.config import settings
+
+# Seconds; tuned for a proxy hot path (10µs … 10s).
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        registry.register(self)
+
+    def inc(self, amount: float = 1, labels: tuple[str, ...] = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class _HistogramSeries:
+    __slots__ = ("_buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self._buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], _HistogramSeries] = {}
+        registry.register(self)
+
+    def labels(self, *values: str) -> _HistogramSeries:
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = _HistogramSeries(self.buckets)
+        return series
+
+    def samples(self) -> Iterable[str]:
+        bounds = (*self.buckets, math.inf)
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series.counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            plain = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{plain} {_format_value(series.sum)}"
+            yield f"{self.name}_count{plain} {series.count}"
+
+
+class GaugeFunc:
+    """Gauge whose value(s) are read from a callback at scrape time.
+
+    The callback returns a number, or a mapping of label-value tuples to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        func: Callable[[], float | dict[tuple[str, ...], float]],
+        labelnames: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self._func = func
+        registry.register(self)
+
+    def samples(self) -> Iterable[str]:
+        value = self._func()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}"
+
+
+# ── Hot-path instruments ──────────────────────────────────────────────────────
+
+stage_seconds = Histogram(
+    "waf_stage_duration_seconds",
+    "Time spent in each stage of the proxy path.",
+    labelnames=("stage",),
+)
+STAGE_BLOCK_CHECK = stage_seconds.labels("block_check")
+STAGE_REDIS_BLOCK_LOOKUP = stage_seconds.labels("redis_block_lookup")
+STAGE_RATE_LIMIT = stage_seconds.labels("rate_limit")
+STAGE_REPUTATION = stage_seconds.labels("reputation")
+STAGE_INSPECTION = stage_seconds.labels("inspection")
+STAGE_LOG_ENQUEUE = stage_seconds.labels("log_enqueue")
+STAGE_LOG_WRITE = stage_seconds.labels("log_write")
+STAGE_FORWARD = stage_seconds.labels("forward")
+
+requests_total = Counter(
+    "waf_requests_total",
+    "Proxied requests by final decision.",
+    labelnames=("action",),
+)
+
+reputation_blocks = Counter(
+    "waf_reputation_blocks_total",
+    "IPs blocked by their decayed reputation, temporarily or escalated to blocked_ips.",
+    labelnames=("kind",),
+)
+
+inspection_budget_exceeded = Counter(
+    "waf_inspection_budget_exceeded_total",
+    "Inspections stopped by INSPECTION_BUDGET_MS, by the rule that crossed it.",
+    labelnames=("rule",),
+)
+
+
+class RuleTimings:
+    """Sampled per-rule regex cost, used to surface the slowest rules."""
+
+    def __init__(self, sample_every: int) -> None:
+        self.sample_every = sample_every
+        self._inspections = 0
+        # rule name -> [evaluations, total seconds, max seconds]
+        self.stats: dict[str, list[float]] = {}
+
+    def should_sample(self) -> bool:
+        if not self.sample_every:
+            return False
+        self._inspections += 1
+        return self._inspections % self.sample_every == 0
+
+    def observe(self, rule, seconds: float) -> None:
+        stats = self.stats.get(rule.name)
+        if stats is None:
+            self.stats[rule.name] = [1, seconds, seconds]
+            return
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+
+    def slowest(self, limit: int = 10) -> list[tuple[str, float]]:
+        """(rule name, mean seconds) for the `limit` slowest rules."""
+        means = [(name, total / count) for name, (count, total, _) in self.stats.items()]
+        return sorted(means, key=lambda item: item[1], reverse=True)[:limit]
+
+
+rule_timings = RuleTimings(settings.METRICS_RULE_SAMPLE_EVERY)
+
+GaugeFunc(
+    "waf_rule_eval_seconds_total",
+    "Sampled cumulative regex time per rule.",
+    lambda: {(name,): stats[1] for name, stats in rule_timings.stats.items()},
+    labelnames=("rule",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_rule_evals_total",
+    "Sampled regex evaluations per rule.",
+    lambda: {(name,): stats[0] for name, stats in rule_timings.stats.items()},
+    labelnames=("rule",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_rule_eval_max_seconds",
+    "Slowest sampled single evaluation per rule.",
+    lambda: {(name,): stats[2] for name, stats in rule_timings.stats.items()},
+    labelnames=("rule",),
+)
+GaugeFunc(
+    "waf_slowest_rules_mean_seconds",
+    "Mean sampled regex time of the slowest rules, rank 1 = slowest.",
+    lambda: {
+        (str(rank), name): mean
+        for rank, (name, mean) in enumerate(rule_timings.slowest(), start=1)
+    },
+    labelnames=("rank", "rule"),
+)
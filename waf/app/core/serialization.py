@@ -0,0 +1,62 @@
+"""JSON encoding for log rows, dashboard events and API responses.
+
+Uses orjson when it is installed — several times faster than the stdlib
+encoder, and it produces bytes directly — and falls back to a compact
+stdlib ``json`` encoding otherwise. Both produce the same documents:
+datetimes become ISO 8601 strings, and the output never contains a raw
+newline, so serialized events can be joined line by line.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps_bytes(value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+
+    loads = orjson.loads
+
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def dumps_bytes(value: Any) -> bytes:
+        return _encoder.encode(value).encode()
+
+    def dumps(value: Any) -> str:
+        return _encoder.encode(value)
+
+    loads = json.loads
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps_bytes().
+
+    Endpoints that return one directly also skip FastAPI's jsonable_encoder
+    pass over the content, which must then hold only JSON types, datetimes
+    and UUIDs.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -1,54 +1,317 @@
 """WAF inspection engine — scores an incoming request against enabled rules."""
 
-import re
-
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+import codecs
+import time
+from typing import Container, Iterable, Mapping
 
 from app.core.config import settings
-from app.models.models import WafRule
+from app.core.metrics import STAGE_INSPECTION, inspection_budget_exceeded, rule_timings
+from app.ruleset import CompiledRule, InspectionBudgetExceeded, RuleSet, rule_store
+from app.targets import body_target, is_structured, request_targets
+from app.verdict_cache import verdict_cache
+
+
+# Whether evaluation stops once a block is certain (see RuleSet.match).
+SHORT_CIRCUIT = settings.INSPECTION_MODE == "short_circuit"
+# Regex CPU time allowed per request, in seconds; None = unlimited.
+BUDGET = settings.INSPECTION_BUDGET_MS / 1000 or None
+
+# Reported in threat_types when the budget ran out.
+BUDGET_THREAT = "INSPECTION_BUDGET"
+
+
+def _match(
+    rule_set: RuleSet,
+    targets: Mapping[str, str],
+    stop_at: int | None = None,
+    skip: Container[str] = (),
+    deadline: float | None = None,
+) -> list[CompiledRule]:
+    # A sampled fraction of inspections also records per-rule regex cost.
+    observe = rule_timings.observe if rule_timings.should_sample() else None
+    return rule_set.match(
+        targets, observe=observe, stop_at=stop_at, skip=skip, deadline=deadline
+    )
+
+
+def over_budget(
+    rule_name: str, matched: Iterable[CompiledRule] = ()
+) -> tuple[int, list[str], str]:
+    """Verdict for a request whose inspection ran out of time at `rule_name`."""
+    inspection_budget_exceeded.inc(labels=(rule_name,))
+    score, threat_types, action = _score(matched)
+    if action != "block":
+        action = settings.INSPECTION_BUDGET_ACTION
+    return score, [*threat_types, BUDGET_THREAT], action
+
+
+def _score(rules: Iterable[CompiledRule]) -> tuple[int, list[str], str]:
+    total_score = 0
+    # Only rules whose action is "block" count towards the block decision;
+    # "log" rules are monitor-only and just show up in the score and types.
+    blocking_score = 0
+    # Use a dict to deduplicate threat types while preserving first-seen order.
+    matched: dict[str, bool] = {}
 
+    for rule in rules:
+        total_score += rule.score
+        if rule.action == "block":
+            blocking_score += rule.score
+        matched[rule.type] = True
+
+    threat_types = list(matched.keys())
+    action = "block" if blocking_score >= settings.THREAT_SCORE_THRESHOLD else "allow"
+    return total_score, threat_types, action
 
-async def inspect_request(
-    db: AsyncSession,
-    method: str,
+
+def inspect_request(
     path: str,
     query: str,
     body: str | None,
+    headers: Mapping[str, str] | None = None,
+    short_circuit: bool = SHORT_CIRCUIT,
+    budget: float | None = BUDGET,
+    complete: bool = True,
 ) -> tuple[int, list[str], str]:
     """Score the request against all enabled WAF rules.
 
+    Rules come from the process-local compiled rule set, so inspection does
+    no I/O at all. The request is split into targets (app/targets.py) and
+    each rule only scans the targets it names. Every target's text is
+    normalized once per transform chain in use (decoded views are shared
+    between rules), and each distinct view gets one literal scan that selects
+    the few rules whose full regex has to run.
+
+    With `short_circuit`, rules are evaluated highest score first and
+    evaluation stops as soon as a block is certain, so the score and threat
+    types of a blocked request may be incomplete.
+
+    Matching stops once it has used more than `budget` seconds of CPU time
+    (time waiting for the event loop or the GIL doesn't count); the request
+    then gets INSPECTION_BUDGET_ACTION (unless already blocked) with
+    "INSPECTION_BUDGET" among its threat types. `complete` is False when
+    `body` is only the start of the request body.
+
+    Verdicts for requests with small bodies are cached per rule set version
+    (app/verdict_cache.py), so an identical repeat isn't matched again.
+
     Returns:
         (threat_score, threat_types, action_taken)
-        action_taken is "block" when score >= THREAT_SCORE_THRESHOLD, else "allow".
+        action_taken is "block" when the matched "block" rules score at least
+        THREAT_SCORE_THRESHOLD, else "allow".
     """
-    result = await db.execute(select(WafRule).where(WafRule.enabled == True))  # noqa: E712
-    rules = result.scalars().all()
-
-    # Build inspection corpus: method + path + query string + body.
-    # We intentionally skip header values here to avoid false positives
-    # (e.g. Content-Type containing HTML keywords). Header inspection can
-    # be added as a separate rule category later.
-    parts = [method, path]
-    if query:
-        parts.append(query)
+    started = time.perf_counter()
+    rule_set = rule_store.current
+    targets = request_targets(path, query, headers)
+    content_type = headers.get("content-type") if headers else None
+
+    key = None
+    if verdict_cache.covers(len(body) if body else 0):
+        key = verdict_cache.key(targets, body, content_type, short_circuit, complete)
+        verdict = verdict_cache.get(key, rule_set.version)
+        if verdict is not None:
+            STAGE_INSPECTION.observe(time.perf_counter() - started)
+            return verdict
+
+    _, verdict = _evaluate(rule_set, targets, body, content_type, short_circuit, budget, complete)
+    # A verdict cut short by the budget depends on timing, not on the request.
+    if key is not None and BUDGET_THREAT not in verdict[1]:
+        verdict_cache.put(key, rule_set.version, verdict)
+    STAGE_INSPECTION.observe(time.perf_counter() - started)
+    return verdict
+
+
+def evaluate_request(
+    path: str,
+    query: str,
+    body: str | None,
+    headers: Mapping[str, str] | None = None,
+    short_circuit: bool = SHORT_CIRCUIT,
+    budget: float | None = BUDGET,
+    complete: bool = True,
+) -> tuple[list[CompiledRule], tuple[int, list[str], str]]:
+    """inspect_request(), bypassing the verdict cache, also returning the
+    rules that matched."""
+    started = time.perf_counter()
+    content_type = headers.get("content-type") if headers else None
+    result = _evaluate(
+        rule_store.current,
+        request_targets(path, query, headers),
+        body,
+        content_type,
+        short_circuit,
+        budget,
+        complete,
+    )
+    STAGE_INSPECTION.observe(time.perf_counter() - started)
+    return result
+
+
+def _evaluate(
+    rule_set: RuleSet,
+    targets: dict[str, str],
+    body: str | None,
+    content_type: str | None,
+    short_circuit: bool,
+    budget: float | None,
+    complete: bool,
+) -> tuple[list[CompiledRule], tuple[int, list[str], str]]:
     if body:
-        parts.append(body)
-    target = "\n".join(parts)
+        targets["body"] = body_target(body, content_type, complete)
+    stop_at = settings.THREAT_SCORE_THRESHOLD if short_circuit else None
+    deadline = time.thread_time() + budget if budget else None
+    try:
+        matched = _match(rule_set, targets, stop_at, deadline=deadline)
+        return matched, _score(matched)
+    except InspectionBudgetExceeded as exc:
+        return exc.matched, over_budget(exc.rule.name, exc.matched)
 
-    total_score = 0
-    # Use a dict to deduplicate threat types while preserving first-seen order.
-    matched: dict[str, bool] = {}
 
-    for rule in rules:
-        try:
-            if re.search(rule.pattern, target, re.IGNORECASE):
-                total_score += rule.score
-                matched[rule.type] = True
-        except re.error:
-            # Skip malformed patterns silently — don't crash the proxy.
-            continue
+class StreamInspector:
+    """Inspects a request body chunk by chunk as it is read.
 
-    threat_types = list(matched.keys())
-    action = "block" if total_score >= settings.THREAT_SCORE_THRESHOLD else "allow"
-    return total_score, threat_types, action
+    Path, query, headers and cookies are inspected up front, so a request
+    they already condemn is blocked before its body is read. Only the first
+    `window` bytes of the body are inspected.
+
+    Form and JSON bodies are inspected field by field once they are complete
+    (whole within the window). Any other body is scanned chunk by chunk:
+    each chunk together with the last `overlap` characters before it, so a
+    match straddling a chunk boundary is still found as long as it is shorter
+    than the overlap. Rules are counted once no matter how many chunks or
+    targets they match. Multi-byte UTF-8 sequences split across chunks are
+    reassembled by an incremental decoder.
+
+    With `short_circuit`, nothing more is evaluated once a block is certain,
+    and `budget` caps the regex time spent on the whole request (see
+    inspect_request()). The verdict is otherwise the same as inspect_request()
+    would give for the inspected part of the body.
+
+    With `scan_body` False, or after collect_only(), the rest of the body is
+    only collected, for the caller to inspect elsewhere (app/offload.py);
+    finish() then reports on the request line and headers alone, and leaves
+    the inspection metrics to the caller.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        query: str,
+        headers: Mapping[str, str] | None = None,
+        window: int = settings.INSPECTION_WINDOW_BYTES,
+        overlap: int = settings.INSPECTION_OVERLAP_CHARS,
+        short_circuit: bool = SHORT_CIRCUIT,
+        budget: float | None = BUDGET,
+        scan_body: bool = True,
+    ) -> None:
+        # Pin one rule set snapshot for the whole request.
+        self._rule_set = rule_store.current
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._window = window
+        self._overlap = overlap
+        self._short_circuit = short_circuit
+        self._budget = budget
+        # The rule during which the budget ran out, if it did.
+        self._over_budget_at: CompiledRule | None = None
+        self._content_type = headers.get("content-type") if headers else None
+        self._scan_body = scan_body
+        # Form and JSON bodies are parsed whole at the end instead of streamed.
+        self._deferred = is_structured(self._content_type)
+        self._tail = ""
+        self._body: list[str] = []
+        self._matched: dict[str, CompiledRule] = {}
+        self._blocking_score = 0
+        self._inspect_seconds = 0.0
+        # CPU time of the same, which is what the budget is charged.
+        self._inspect_cpu_seconds = 0.0
+        self.inspected_bytes = 0
+        self._scan(request_targets(path, query, headers))
+
+    @property
+    def window(self) -> int:
+        return self._window
+
+    @property
+    def window_full(self) -> bool:
+        return self.inspected_bytes >= self._window
+
+    @property
+    def blocking(self) -> bool:
+        """True once the outcome is certain to be a block."""
+        if self._over_budget_at is not None and settings.INSPECTION_BUDGET_ACTION == "block":
+            return True
+        return self._blocking_score >= settings.THREAT_SCORE_THRESHOLD
+
+    @property
+    def body_text(self) -> str | None:
+        """Decoded text of the inspected window (what gets logged)."""
+        return "".join(self._body) or None
+
+    def feed(self, chunk: bytes) -> None:
+        """Inspect the next body chunk; bytes past the window are ignored."""
+        if self.window_full or not chunk:
+            return
+        chunk = chunk[: self._window - self.inspected_bytes]
+        self.inspected_bytes += len(chunk)
+        text = self._decoder.decode(chunk, final=self.window_full)
+        if text:
+            self._body.append(text)
+            if self._scan_body and not self._deferred:
+                self._scan_chunk(text)
+
+    def collect_only(self) -> None:
+        """Stop scanning the body; the caller will inspect body_text itself."""
+        self._scan_body = False
+
+    def finish(self, complete: bool = True) -> tuple[int, list[str], str]:
+        """Flush the decoder and return (threat_score, threat_types, action_taken).
+
+        `complete` is False when the caller stopped reading the body early.
+        """
+        if not self.window_full:
+            text = self._decoder.decode(b"", final=True)
+            if text:
+                self._body.append(text)
+                if self._scan_body and not self._deferred:
+                    self._scan_chunk(text)
+        if self._scan_body and self._deferred and self._body:
+            body = "".join(self._body)
+            complete = complete and not self.window_full
+            self._scan({"body": body_target(body, self._content_type, complete)})
+        # Only matching time counts as inspection, not waiting for the body.
+        if self._scan_body:
+            STAGE_INSPECTION.observe(self._inspect_seconds)
+        if self._over_budget_at is not None:
+            return over_budget(self._over_budget_at.name, self._matched.values())
+        return _score(self._matched.values())
+
+    def _scan_chunk(self, text: str) -> None:
+        segment = self._tail + text
+        self._tail = segment[-self._overlap :] if self._overlap else ""
+        self._scan({"body": segment})
+
+    def _scan(self, targets: Mapping[str, str]) -> None:
+        if self._over_budget_at is not None:
+            return
+        stop_at = None
+        if self._short_circuit:
+            if self.blocking:
+                return
+            stop_at = settings.THREAT_SCORE_THRESHOLD - self._blocking_score
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        deadline = None
+        if self._budget:
+            deadline = cpu_started + self._budget - self._inspect_cpu_seconds
+        # Rules matched by earlier chunks or targets are not evaluated again.
+        try:
+            matched = _match(self._rule_set, targets, stop_at, self._matched, deadline)
+        except InspectionBudgetExceeded as exc:
+            self._over_budget_at = exc.rule
+            matched = exc.matched
+        for rule in matched:
+            self._matched[rule.id] = rule
+            if rule.action == "block":
+                self._blocking_score += rule.score
+        self._inspect_seconds += time.perf_counter() - started
+        self._inspect_cpu_seconds += time.thread_time() - cpu_started
@@ -0,0 +1,173 @@
+"""Daily partitions and retention for the attack_logs table.
+
+``attack_logs`` is range-partitioned on ``created_at`` with one partition per
+UTC day (``attack_logs_pYYYYMMDD``) plus a DEFAULT partition that only
+catches rows no daily partition covers. A maintenance pass:
+
+* creates the partitions for today and the next LOG_PARTITION_PREMAKE_DAYS
+  days, so inserts never depend on the job running at midnight;
+* drops every partition that ends before the retention cutoff
+  (LOG_RETENTION_DAYS). Dropping a partition frees its disk space at once and
+  leaves nothing for autovacuum, unlike ``DELETE``.
+
+Every worker runs the loop; a Postgres advisory lock makes sure only one of
+them does the work at a time.
+"""
+
+import asyncio
+import logging
+import re
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "attack_logs"
+
+# Arbitrary application-wide key for pg_try_advisory_lock.
+_ADVISORY_LOCK_KEY = 0x57414601
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+_PARTITIONS_SQL = text(
+    """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:parent AS regclass)
+    """
+)
+
+
+def _parse_bound(value: str) -> datetime | None:
+    """Parse one side of a partition bound; None for MINVALUE/MAXVALUE."""
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+async def _partitions(
+    conn: AsyncConnection,
+) -> list[tuple[str, datetime | None, datetime | None]]:
+    """(name, lower, upper) of each range partition; None means unbounded."""
+    result = await conn.execute(_PARTITIONS_SQL, {"parent": PARENT_TABLE})
+    partitions = []
+    for name, bound in result:
+        match = _BOUND.search(bound)
+        if match is None:  # the DEFAULT partition
+            continue
+        partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return partitions
+
+
+async def _is_partitioned(conn: AsyncConnection) -> bool:
+    relkind = await conn.scalar(
+        text("SELECT relkind FROM pg_class WHERE oid = CAST(:parent AS regclass)"),
+        {"parent": PARENT_TABLE},
+    )
+    return relkind == "p"
+
+
+async def ensure_partitions(conn: AsyncConnection, days_ahead: int) -> list[str]:
+    """Create the daily partitions for today … today + days_ahead that are missing."""
+    await conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {PARENT_TABLE}_default "
+            f"PARTITION OF {PARENT_TABLE} DEFAULT"
+        )
+    )
+    existing = await _partitions(conn)
+    created = []
+    today = datetime.now(timezone.utc).date()
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        lower, upper = _day_start(day), _day_start(day + timedelta(days=1))
+        # Skip days already covered, e.g. by a partition attached by a migration.
+        if any(
+            (start is None or start < upper) and (end is None or end > lower)
+            for _, start, end in existing
+        ):
+            continue
+        name = f"{PARENT_TABLE}_p{day:%Y%m%d}"
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+        )
+        created.append(name)
+    return created
+
+
+async def drop_expired_partitions(conn: AsyncConnection, retention_days: int) -> list[str]:
+    """Drop partitions whose whole range is older than the retention window."""
+    cutoff = _day_start(datetime.now(timezone.utc).date() - timedelta(days=retention_days))
+    dropped = []
+    for name, _, upper in await _partitions(conn):
+        if upper is not None and upper <= cutoff:
+            await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped.append(name)
+    return dropped
+
+
+async def run_maintenance(wait: bool = False) -> bool:
+    """One maintenance pass.
+
+    If another worker is already running one, returns False immediately — or,
+    with `wait`, waits for it and then runs (used at startup, so no worker
+    writes logs before today's partition exists).
+    """
+    async with engine.connect() as conn:
+        if wait:
+            await conn.execute(
+                text("SELECT pg_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}
+            )
+        elif not await conn.scalar(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}
+        ):
+            await conn.commit()
+            return False
+        await conn.commit()
+        try:
+            if not await _is_partitioned(conn):
+                logger.warning(
+                    "attack_logs is not partitioned; run `alembic upgrade head` to convert it"
+                )
+                return True
+            created = await ensure_partitions(conn, settings.LOG_PARTITION_PREMAKE_DAYS)
+            await conn.commit()
+            dropped = []
+            if settings.LOG_RETENTION_DAYS > 0:
+                dropped = await drop_expired_partitions(conn, settings.LOG_RETENTION_DAYS)
+                await conn.commit()
+        finally:
+            # Discard a failed transaction so the unlock can run.
+            await conn.rollback()
+            await conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY}
+            )
+            await conn.commit()
+    if created or dropped:
+        logger.info("attack_logs partitions created %s, dropped %s", created, dropped)
+    return True
+
+
+async def maintain(interval: float = settings.LOG_MAINTENANCE_INTERVAL_SECONDS) -> None:
+    """Run maintenance every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("attack_logs partition maintenance failed")
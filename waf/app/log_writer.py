@@ -0,0 +1,231 @@
+"""Background attack-log pipeline.
+
+The proxy hands each log row to ``log_writer.enqueue()``, which only puts it
+on a bounded in-memory queue. A single writer task drains the queue and
+persists rows in batches — one bulk INSERT per batch, flushed whenever the
+batch is full or the flush interval elapses — so log persistence never adds
+database round trips to a proxied request.
+
+When the queue fills up, LOG_OVERFLOW_POLICY decides what happens:
+
+* ``drop``   — new rows are discarded and counted.
+* ``sample`` — once the queue is half full, only a LOG_SAMPLE_RATE fraction of
+  allowed requests is kept; blocked requests are kept until the queue is full.
+* ``block``  — the request waits for room (backpressure onto the proxy).
+
+With LOG_DETAIL_POLICY=flagged, allowed requests that scored below
+LOG_DETAIL_MIN_SCORE are stored as summary rows without headers and body;
+those columns are by far the largest part of the table.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Mapping
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import STAGE_LOG_WRITE
+from app.models.models import AttackLog
+
+logger = logging.getLogger(__name__)
+
+FlushCallback = Callable[[list[dict]], Awaitable[None]]
+
+_STOP = object()
+
+
+class LogWriter:
+    def __init__(
+        self,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow_policy: str,
+        sample_rate: float,
+        detail_policy: str = "all",
+        detail_min_score: int = 0,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+        self.detail_policy = detail_policy
+        self.detail_min_score = detail_min_score
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+        self._on_flush: FlushCallback | None = None
+
+        # Backpressure metrics.
+        self.enqueued = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.summarized = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_flush_seconds = 0.0
+
+    # ── Producer side (request path) ─────────────────────────────────────────
+
+    async def enqueue(
+        self,
+        ip: str,
+        method: str,
+        endpoint: str,
+        headers: Mapping[str, str] | None,
+        body: str | None,
+        threat_score: int,
+        threat_types: list[str],
+        action: str,
+    ) -> None:
+        """Queue a log row for the writer task. Never touches the database."""
+        if (
+            self.detail_policy == "flagged"
+            and action == "allow"
+            and threat_score < self.detail_min_score
+        ):
+            headers, body = None, None
+            self.summarized += 1
+        elif headers is not None:
+            # Snapshot for the JSONB column (request headers are a read-only
+            # view; the copy is made only for rows that keep them).
+            headers = dict(headers)
+
+        row = {
+            "id": str(uuid.uuid4()),
+            "ip_address": ip,
+            "method": method,
+            "endpoint": endpoint,
+            "headers": headers,
+            "request_body": body,
+            "threat_score": threat_score,
+            "action_taken": action,
+            "threat_types": threat_types,
+            # Timezone-aware, so live events serialize with their UTC offset.
+            "created_at": datetime.now(timezone.utc),
+        }
+
+        queue = self._queue
+        if self.overflow_policy == "block":
+            await queue.put(row)
+        else:
+            if (
+                self.overflow_policy == "sample"
+                and action != "block"
+                and queue.qsize() >= queue.maxsize // 2
+                and random.random() >= self.sample_rate
+            ):
+                self.sampled_out += 1
+                return
+            try:
+                queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                return
+
+        self.enqueued += 1
+        depth = queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    # ── Writer task ──────────────────────────────────────────────────────────
+
+    def start(self, on_flush: FlushCallback | None = None) -> None:
+        """Start the writer task. `on_flush` receives each persisted batch."""
+        self._on_flush = on_flush
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the writer task."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        stopping = False
+
+        while not stopping:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[dict]) -> None:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(AttackLog), batch)
+                await db.commit()
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %d attack log rows", len(batch))
+            return
+        finally:
+            self.last_flush_seconds = time.perf_counter() - started
+            STAGE_LOG_WRITE.observe(self.last_flush_seconds)
+
+        self.written += len(batch)
+        self.batches += 1
+
+        if self._on_flush is not None:
+            try:
+                await self._on_flush(batch)
+            except Exception:
+                logger.exception("Log flush callback failed")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "max_depth": self.max_depth,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "summarized": self.summarized,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_seconds": round(self.last_flush_seconds, 6),
+        }
+
+
+log_writer = LogWriter(
+    max_queue=settings.LOG_QUEUE_SIZE,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL_MS / 1000,
+    overflow_policy=settings.LOG_OVERFLOW_POLICY,
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    detail_policy=settings.LOG_DETAIL_POLICY,
+    detail_min_score=settings.LOG_DETAIL_MIN_SCORE,
+)
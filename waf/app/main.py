@@ -1,20 +1,50 @@
-import json
+import asyncio
+import contextlib
+import time
 from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping
 
 import httpx
 import redis.asyncio as aioredis
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
-from sqlalchemy import select, text
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import text
+from starlette.background import BackgroundTask
 
 from app.api import blocked_ips, logs, rules
-from app.api.ws import manager
+from app.api.ws import LOGS_CHANNEL, manager
+from app.blocklist import BLOCKLIST_CHANNEL, block_cache
 from app.core.config import settings
-from app.core.database import AsyncSessionLocal, init_db
-from app.engine import inspect_request
-from app.models.models import AttackLog, BlockedIP
+from app.core.database import AsyncSessionLocal, close_db, engine, init_db, read_engine
+from app.core.events import event_bus
+from app.core.metrics import (
+    STAGE_BLOCK_CHECK,
+    STAGE_FORWARD,
+    STAGE_LOG_ENQUEUE,
+    GaugeFunc,
+    registry,
+    requests_total,
+)
+from app.core.serialization import FastJSONResponse, dumps
+from app.engine import SHORT_CIRCUIT, StreamInspector, inspect_request
+from app.log_retention import maintain as maintain_log_partitions
+from app.log_retention import run_maintenance as run_log_maintenance
+from app.log_writer import log_writer
+from app.offload import inspection_pool
+from app.rate_limit import RateLimiter
+from app.reputation import ALLOWED, ESCALATED, REPUTATION_THREAT, Reputation, escalate
+from app.ruleset import RULES_CHANNEL, rule_store
 from app.seed import seed_default_rules
+from app.stats import StatsCounters
+from app.upstream import CONNECT_ERRORS, create_client, upstreams
+from app.verdict_cache import verdict_cache
+
+# Re-evaluate short-circuited blocks in full for their log rows (see step 5).
+_DEFER_FULL_EVAL = SHORT_CIRCUIT and settings.INSPECTION_FULL_EVAL_FOR_LOGS
+# Added to a full evaluation's threat types when only part of the body was
+# read before the block, so its log row doesn't pass for the whole request.
+BODY_TRUNCATED_THREAT = "BODY_TRUNCATED"
 
 # Headers that must not be forwarded between proxies (RFC 7230 §6.1).
 _HOP_BY_HOP = frozenset(
@@ -36,6 +66,11 @@ async def lifespan(app: FastAPI):
     # ── Startup ──────────────────────────────────────────────────────────────
     await init_db()
 
+    # attack_logs is partitioned by day: make sure today's partition exists
+    # before the first insert, then keep creating / expiring them.
+    await run_log_maintenance(wait=True)
+    log_maintenance = asyncio.create_task(maintain_log_partitions())
+
     async with AsyncSessionLocal() as db:
         await seed_default_rules(db)
 
@@ -45,17 +80,49 @@ async def lifespan(app: FastAPI):
         decode_responses=True,
     )
 
-    # Shared httpx client — reuses connection pool across requests.
-    app.state.http_client = httpx.AsyncClient(
-        timeout=httpx.Timeout(30.0),
-        follow_redirects=True,
+    app.state.rate_limiter = (
+        RateLimiter(app.state.redis) if settings.RATE_LIMIT_ENABLED else None
     )
+    app.state.reputation = (
+        Reputation(app.state.redis) if settings.REPUTATION_ENABLED else None
+    )
+
+    # Compile the rule set and load blocked addresses/networks into memory.
+    # Later changes, and log events for WS clients, arrive from every worker
+    # over the Redis event bus.
+    await rule_store.reload()
+    # Process workers start with the rule set just compiled.
+    inspection_pool.start()
+    await block_cache.load()
+    event_bus.subscribe(RULES_CHANNEL, rule_store.on_change, resync=rule_store.reload)
+    event_bus.subscribe(BLOCKLIST_CHANNEL, block_cache.on_change, resync=block_cache.load)
+    event_bus.subscribe(LOGS_CHANNEL, manager.on_logs_event)
+    events_listener = asyncio.create_task(event_bus.run(app.state.redis))
+
+    # Dashboard counters are updated per written batch; a background task
+    # rebuilds them from Postgres whenever Redis doesn't have them.
+    app.state.stats = StatsCounters(app.state.redis)
+    stats_maintenance = asyncio.create_task(app.state.stats.maintain())
+
+    # Attack logs are persisted in batches by a background task.
+    log_writer.start(on_flush=_on_logs_written)
+
+    # Shared httpx client — reuses connection pool across requests.
+    app.state.http_client = create_client()
+    health_checks = asyncio.create_task(upstreams.run_health_checks(app.state.http_client))
 
     yield
 
     # ── Shutdown ─────────────────────────────────────────────────────────────
+    for task in (events_listener, log_maintenance, stats_maintenance, health_checks):
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await log_writer.stop()
+    inspection_pool.stop()
     await app.state.redis.aclose()
     await app.state.http_client.aclose()
+    await close_db()
 
 
 app = FastAPI(
@@ -63,6 +130,7 @@ app = FastAPI(
     description="A rule-based reverse-proxy Web Application Firewall",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -100,23 +168,138 @@ async def ready():
         redis_status = "error"
 
     status_code = 200 if db_status == "ok" and redis_status == "ok" else 503
-    return JSONResponse(
-        content={"db": db_status, "redis": redis_status},
+    return FastJSONResponse(
+        content={"db": db_status, "redis": redis_status, "log_queue": log_writer.stats()},
         status_code=status_code,
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(
+        content=registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.websocket("/ws/logs")
 async def websocket_logs(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            # Keep connection alive; WAF engine pushes via manager.broadcast()
+            # Keep connection alive; log events are pushed by the manager's
+            # per-client sender task.
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 
+# ── Metrics read at scrape time ───────────────────────────────────────────────
+
+GaugeFunc(
+    "waf_log_queue_depth",
+    "Attack-log rows waiting for the writer task.",
+    lambda: log_writer.stats()["queue_depth"],
+)
+GaugeFunc(
+    "waf_log_queue_capacity",
+    "Size of the attack-log queue.",
+    lambda: log_writer.stats()["queue_capacity"],
+)
+GaugeFunc(
+    "waf_log_rows_total",
+    "Attack-log rows by outcome.",
+    lambda: {
+        (outcome,): log_writer.stats()[outcome]
+        for outcome in ("enqueued", "dropped", "sampled_out", "written", "failed")
+    },
+    labelnames=("outcome",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_block_cache_lookups_total",
+    "IP block decision cache lookups.",
+    lambda: {("hit",): block_cache.hits, ("miss",): block_cache.misses},
+    labelnames=("result",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_block_cache_entries",
+    "Cached IP block decisions.",
+    lambda: len(block_cache),
+)
+GaugeFunc(
+    "waf_blocked_networks",
+    "Blocked addresses and networks in memory.",
+    lambda: len(block_cache.networks),
+)
+GaugeFunc(
+    "waf_rules_loaded",
+    "Enabled rules in the active rule set.",
+    lambda: len(rule_store.current.rules),
+)
+GaugeFunc(
+    "waf_rules_rejected",
+    "Enabled rules left out of the rule set as invalid or unsafe.",
+    lambda: len(rule_store.current.rejected),
+)
+GaugeFunc(
+    "waf_inspections_offloaded_total",
+    "Large-body inspections run in the worker pool, timed out there, or run "
+    "inline because every worker was busy.",
+    lambda: {
+        ("done",): inspection_pool.offloaded - inspection_pool.timeouts,
+        ("timeout",): inspection_pool.timeouts,
+        ("pool_full",): inspection_pool.overflowed,
+    },
+    labelnames=("result",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_upstream_healthy",
+    "Whether each backend upstream is in rotation (1) or not (0).",
+    lambda: {(upstream.url,): int(upstream.healthy) for upstream in upstreams.upstreams},
+    labelnames=("upstream",),
+)
+GaugeFunc(
+    "waf_verdict_cache_size",
+    "Inspection verdicts cached in this worker.",
+    lambda: len(verdict_cache),
+)
+GaugeFunc(
+    "waf_verdict_cache_lookups_total",
+    "Inspection verdict cache lookups.",
+    lambda: {("hit",): verdict_cache.hits, ("miss",): verdict_cache.misses},
+    labelnames=("result",),
+    kind="counter",
+)
+GaugeFunc(
+    "waf_db_connections_in_use",
+    "Database connections checked out of each pool.",
+    lambda: {("write",): engine.pool.checkedout(), ("read",): read_engine.pool.checkedout()},
+    labelnames=("pool",),
+)
+GaugeFunc(
+    "waf_ws_connections",
+    "Connected dashboard WebSocket clients.",
+    lambda: len(manager.active_connections),
+)
+GaugeFunc(
+    "waf_ws_events_dropped_total",
+    "Log events dropped for dashboard clients that fell behind.",
+    lambda: manager.dropped,
+    kind="counter",
+)
+GaugeFunc(
+    "waf_ws_frames_sent_total",
+    "Coalesced log frames sent to dashboard clients.",
+    lambda: manager.frames_sent,
+    kind="counter",
+)
+
+
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
 
@@ -124,46 +307,142 @@ async def _write_log(
     ip: str,
     method: str,
     endpoint: str,
-    headers: dict,
+    headers: Mapping[str, str],
     body: str | None,
     threat_score: int,
     threat_types: list[str],
     action: str,
-) -> AttackLog:
-    """Persist an AttackLog row and broadcast it to all WS clients."""
-    log = AttackLog(
-        ip_address=ip,
-        method=method,
-        endpoint=endpoint,
-        headers=headers,
-        request_body=body,
-        threat_score=threat_score,
-        action_taken=action,
-        threat_types=threat_types,
+) -> None:
+    """Queue an AttackLog row; the background writer persists and broadcasts it."""
+    started = time.perf_counter()
+    await log_writer.enqueue(
+        ip, method, endpoint, headers, body, threat_score, threat_types, action
     )
-    async with AsyncSessionLocal() as db:
-        db.add(log)
-        await db.commit()
-        await db.refresh(log)
+    STAGE_LOG_ENQUEUE.observe(time.perf_counter() - started)
 
-    await manager.broadcast(
-        json.dumps(
+
+async def _log_full_evaluation(
+    ip: str,
+    method: str,
+    path: str,
+    query: str,
+    headers: Mapping[str, str],
+    body: str | None,
+    complete: bool,
+) -> None:
+    """Re-inspect a short-circuited block with every rule and log that verdict.
+
+    `complete` is False when reading the body stopped at the block (or at the
+    inspection window): every rule then ran on the part that was read only,
+    and the row says so with BODY_TRUNCATED_THREAT.
+    """
+    threat_score, threat_types, _ = await inspection_pool.inspect(
+        path, query, body, headers, complete=complete, short_circuit=False
+    )
+    if not complete:
+        threat_types = [*threat_types, BODY_TRUNCATED_THREAT]
+    # Still a block: the full evaluation only ever adds matches.
+    await _write_log(ip, method, path, headers, body, threat_score, threat_types, "block")
+
+
+async def _on_logs_written(rows: list[dict]) -> None:
+    """Called by the log writer with every batch it persisted."""
+    await app.state.stats.record(rows)
+    await _broadcast_logs(rows)
+
+
+async def _broadcast_logs(rows: list[dict]) -> None:
+    """Push a freshly persisted batch of log rows to the WS clients of all workers."""
+    # Serialized once here; workers and clients only pass the strings along.
+    events = [
+        dumps(
             {
-                "type": "new_log",
-                "data": {
-                    "id": log.id,
-                    "ip_address": log.ip_address,
-                    "method": log.method,
-                    "endpoint": log.endpoint,
-                    "threat_score": log.threat_score,
-                    "action_taken": log.action_taken,
-                    "threat_types": log.threat_types or [],
-                    "created_at": log.created_at.isoformat(),
-                },
+                "id": row["id"],
+                "ip_address": row["ip_address"],
+                "method": row["method"],
+                "endpoint": row["endpoint"],
+                "threat_score": row["threat_score"],
+                "action_taken": row["action_taken"],
+                "threat_types": row["threat_types"] or [],
+                "created_at": row["created_at"],
             }
         )
-    )
-    return log
+        for row in rows
+    ]
+    # Every worker, this one included, receives the batch from the bus — one
+    # event per line, as serialized JSON never contains a raw newline.
+    if not await event_bus.publish(app.state.redis, LOGS_CHANNEL, "\n".join(events)):
+        manager.publish_logs(events)
+
+
+async def _read_and_inspect(
+    request: Request, full_path: str, query: str
+) -> tuple[str | None, bytes | AsyncIterator[bytes], tuple[int, list[str], str], bool]:
+    """Read the request body while inspecting it chunk by chunk.
+
+    The body is scanned as it arrives until the bytes read reach
+    INSPECTION_OFFLOAD_MIN_BYTES; from then on it is only read, up to the
+    inspection window, and then inspected whole in the worker pool. Chunked
+    and unknown-length bodies are offloaded the same way, since only what was
+    actually buffered counts. A request whose known body size is small enough
+    for the verdict cache is read whole and inspected at once, so that its
+    repeats hit the cache.
+
+    Returns (inspected_body_text, forward_content, verdict, body_complete).
+    Reading stops as soon as the inspection window is full or a block is
+    certain; if the body was not consumed completely, body_complete is False
+    and forward_content is a stream that replays the chunks read so far and
+    then relays the rest without buffering it.
+    """
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        declared = 0
+    # Without Content-Length or Transfer-Encoding there is no body at all.
+    size_known = "transfer-encoding" not in request.headers
+    if size_known and verdict_cache.covers(declared):
+        content = await request.body()
+        body_str = content.decode("utf-8", errors="replace") if content else None
+        verdict = inspect_request(full_path, query, body_str, request.headers)
+        return body_str, content, verdict, True
+
+    inspector = StreamInspector(full_path, query, request.headers)
+    offload = False
+    stream = request.stream()
+    head: list[bytes] = []
+    # Nothing is read when the request line or headers already decide a block;
+    # only a request without a body has then been seen whole.
+    body_complete = not inspector.blocking or (size_known and declared == 0)
+
+    if not inspector.blocking:
+        async for chunk in stream:
+            head.append(chunk)
+            # Once enough has been read, the rest of the window is collected
+            # here and inspected in the pool.
+            buffered = min(inspector.inspected_bytes + len(chunk), inspector.window)
+            if not offload and inspection_pool.should_offload(buffered):
+                offload = True
+                inspector.collect_only()
+            inspector.feed(chunk)
+            if inspector.window_full or inspector.blocking:
+                body_complete = False
+                break
+
+    verdict = inspector.finish(complete=body_complete)
+    if offload and not inspector.blocking and inspector.body_text:
+        verdict = await inspection_pool.inspect(
+            full_path, query, inspector.body_text, request.headers, complete=body_complete
+        )
+    if body_complete:
+        return inspector.body_text, b"".join(head), verdict, True
+
+    async def replay() -> AsyncIterator[bytes]:
+        for chunk in head:
+            yield chunk
+        async for chunk in stream:
+            yield chunk
+
+    return inspector.body_text, replay(), verdict, False
 
 
 # ── Reverse proxy catch-all ───────────────────────────────────────────────────
@@ -181,56 +460,99 @@ async def reverse_proxy(request: Request, path: str):
     ip: str = request.headers.get("X-Real-IP") or (
         request.client.host if request.client else "unknown"
     )
-    body_bytes: bytes = await request.body()
-    body_str: str | None = body_bytes.decode("utf-8", errors="replace") if body_bytes else None
     query: str = request.url.query
 
     redis = request.app.state.redis
     http_client: httpx.AsyncClient = request.app.state.http_client
 
-    # ── 1. Redis temporary block check ────────────────────────────────────────
-    if await redis.get(f"blocked:{ip}"):
+    # ── 1. IP block check (local cache, then Redis + Postgres on a miss) ─────
+    started = time.perf_counter()
+    blocked = await block_cache.is_blocked(redis, ip)
+    STAGE_BLOCK_CHECK.observe(time.perf_counter() - started)
+    if blocked:
+        requests_total.inc(labels=("ip_block",))
         await _write_log(
-            ip, request.method, full_path, dict(request.headers),
-            body_str, 100, ["IP_BLOCKED"], "block",
+            ip, request.method, full_path, request.headers,
+            None, 100, ["IP_BLOCKED"], "block",
         )
-        return JSONResponse(status_code=403, content={"detail": "Your IP has been blocked."})
-
-    # ── 2. DB permanent block + WAF rule inspection (single DB session) ───────
-    async with AsyncSessionLocal() as db:
-        blocked = (
-            await db.execute(select(BlockedIP).where(BlockedIP.ip_address == ip))
-        ).scalar_one_or_none()
-
-        if blocked:
-            await _write_log(
-                ip, request.method, full_path, dict(request.headers),
-                body_str, 100, ["IP_BLOCKED"], "block",
-            )
-            return JSONResponse(status_code=403, content={"detail": "Your IP has been blocked."})
-
-        threat_score, threat_types, action = await inspect_request(
-            db, request.method, full_path, query, body_str
+        return FastJSONResponse(status_code=403, content={"detail": "Your IP has been blocked."})
+
+    # ── 2. Sliding-window rate limit (one atomic Redis round trip) ────────────
+    rate_limiter: RateLimiter | None = request.app.state.rate_limiter
+    if rate_limiter is not None and not await rate_limiter.allow(ip, full_path):
+        # An IP-wide breach also set blocked:{ip}; don't wait for the pub/sub echo.
+        block_cache.invalidate(ip)
+        requests_total.inc(labels=("rate_limit",))
+        await _write_log(
+            ip, request.method, full_path, request.headers,
+            None, 0, ["RATE_LIMIT"], "rate_limit",
+        )
+        return FastJSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests."},
+            headers={"Retry-After": str(rate_limiter.retry_after)},
         )
 
-    # ── 3. Log every request (allowed and blocked alike) ─────────────────────
-    await _write_log(
-        ip, request.method, full_path, dict(request.headers),
-        body_str, threat_score, threat_types, action,
-    )
+    # ── 3. WAF rule inspection (in-memory rule set, no I/O) ───────────────────
+    # Blocked IPs are rejected above without ever reading their body.
+    if settings.PROXY_STREAMING:
+        (
+            body_str,
+            content,
+            (threat_score, threat_types, action),
+            body_complete,
+        ) = await _read_and_inspect(request, full_path, query)
+    else:
+        body_complete = True
+        content = await request.body()
+        body_str = content.decode("utf-8", errors="replace") if content else None
+        threat_score, threat_types, action = await inspection_pool.inspect(
+            full_path, query, body_str, request.headers
+        )
+    # A short-circuited block may list only the rules that decided it; the
+    # full evaluation for its log row is done once the client has its 403.
+    full_eval_later = action == "block" and _DEFER_FULL_EVAL
+
+    # ── 4. Per-IP reputation (one atomic Redis round trip if scored) ──────────
+    reputation: Reputation | None = request.app.state.reputation
+    if reputation is not None and threat_score > 0:
+        outcome = await reputation.record(ip, threat_score)
+        if outcome != ALLOWED:
+            # The script also set blocked:{ip}; don't wait for the pub/sub echo.
+            block_cache.invalidate(ip)
+            if action != "block":
+                action = "block"
+                threat_types = [*threat_types, REPUTATION_THREAT]
+            if outcome == ESCALATED:
+                await escalate(redis, ip)
+
+    # ── 5. Log every request (allowed and blocked alike) ─────────────────────
+    # The immutable request headers; the log writer copies them only for
+    # rows that keep their details.
+    headers = request.headers
+    if not full_eval_later:
+        await _write_log(
+            ip, request.method, full_path, headers,
+            body_str, threat_score, threat_types, action,
+        )
 
-    # ── 4. Enforce block decision ─────────────────────────────────────────────
+    # ── 6. Enforce block decision ─────────────────────────────────────────────
+    requests_total.inc(labels=(action,))
     if action == "block":
-        return JSONResponse(
+        background = None
+        if full_eval_later:
+            background = BackgroundTask(
+                _log_full_evaluation,
+                ip, request.method, full_path, query, headers, body_str, body_complete,
+            )
+        return FastJSONResponse(
             status_code=403,
             content={"detail": "Request blocked by WAF", "threat_types": threat_types},
+            background=background,
         )
 
-    # ── 5. Forward allowed request to backend ─────────────────────────────────
-    backend_url = settings.BACKEND_URL.rstrip("/") + full_path
-    if query:
-        backend_url += f"?{query}"
-
+    # ── 7. Forward allowed request to backend ─────────────────────────────────
+    target = full_path + (f"?{query}" if query else "")
     forward_headers = {
         k: v
         for k, v in request.headers.items()
@@ -239,26 +561,61 @@ async def reverse_proxy(request: Request, path: str):
     forward_headers["X-Forwarded-For"] = ip
     forward_headers["X-Real-IP"] = ip
     forward_headers["X-Forwarded-Host"] = request.headers.get("host", "")
-
+    # Bodies are relayed still encoded (below); without this httpx would ask
+    # for gzip on behalf of a client that never offered to decode it.
+    forward_headers.setdefault("accept-encoding", "identity")
+
+    # A backend refusing the connection never saw the request: try the next
+    # one, as long as the body can be sent again (a streamed one can't).
+    attempts = len(upstreams.upstreams) if isinstance(content, bytes) else 1
+    started = time.perf_counter()
     try:
-        backend_resp = await http_client.request(
-            method=request.method,
-            url=backend_url,
-            headers=forward_headers,
-            content=body_bytes,
-        )
+        for attempt in range(attempts):
+            upstream = upstreams.pick()
+            backend_req = http_client.build_request(
+                method=request.method,
+                url=upstream.url + target,
+                headers=forward_headers,
+                content=content,
+            )
+            try:
+                backend_resp = await http_client.send(backend_req, stream=True)
+                break
+            except CONNECT_ERRORS:
+                upstreams.mark_down(upstream)
+                if attempt == attempts - 1:
+                    raise
+        if not settings.PROXY_STREAMING:
+            try:
+                raw_body = b"".join([chunk async for chunk in backend_resp.aiter_raw()])
+            finally:
+                await backend_resp.aclose()
     except httpx.RequestError as exc:
-        return JSONResponse(status_code=502, content={"detail": f"Backend unreachable: {exc!s}"})
+        return FastJSONResponse(
+            status_code=502, content={"detail": f"Backend unreachable: {exc!s}"}
+        )
+    finally:
+        # Time to response headers (the whole response when not streaming).
+        STAGE_FORWARD.observe(time.perf_counter() - started)
 
-    # Strip hop-by-hop and encoding headers from the backend response so the
-    # client receives raw content (httpx already decompresses the body).
-    excluded_resp = _HOP_BY_HOP | {"content-encoding", "content-length"}
+    # The body is passed through exactly as the backend sent it, compressed
+    # or not, so Content-Encoding and Content-Length still apply to it.
     resp_headers = {
-        k: v for k, v in backend_resp.headers.items() if k.lower() not in excluded_resp
+        k: v for k, v in backend_resp.headers.items() if k.lower() not in _HOP_BY_HOP
     }
 
+    if settings.PROXY_STREAMING:
+        # Relay the body as it arrives; the upstream response is closed once
+        # the client has received everything (or gone away).
+        return StreamingResponse(
+            backend_resp.aiter_raw(),
+            status_code=backend_resp.status_code,
+            headers=resp_headers,
+            background=BackgroundTask(backend_resp.aclose),
+        )
+
     return Response(
-        content=backend_resp.content,
+        content=raw_body,
         status_code=backend_resp.status_code,
         headers=resp_headers,
     )
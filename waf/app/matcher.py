@@ -0,0 +1,169 @@
+r"""Single-pass multi-pattern matching for the compiled rule set.
+
+Running every rule's regex over the whole corpus makes inspection cost grow
+with rule count times body size. Instead, each rule is reduced to a set of
+literals at least one of which must occur in any match — ``union\s+select``
+cannot match without "select". The literals of all rules are compiled into one
+trie-shaped scanner regex that reports every literal occurrence in a single
+pass over the (case-folded) corpus. Only rules whose literals were seen, plus
+the few rules with no extractable literal, then run their full regex.
+
+The prefilter is conservative: whenever a pattern construct isn't understood,
+the rule is simply evaluated on every request.
+"""
+
+import re
+from typing import Protocol, Sequence
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse  # type: ignore[no-redef]
+
+_LITERAL = sre_parse.LITERAL
+_SUBPATTERN = sre_parse.SUBPATTERN
+_BRANCH = sre_parse.BRANCH
+_REPEATS = {
+    op
+    for op in (
+        sre_parse.MAX_REPEAT,
+        sre_parse.MIN_REPEAT,
+        getattr(sre_parse, "POSSESSIVE_REPEAT", None),
+    )
+    if op is not None
+}
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+# Non-ASCII characters that re.IGNORECASE treats as equal to an ASCII letter.
+# They are folded explicitly so a payload like "ſelect" can't slip past the
+# "select" literal (str.lower() leaves them alone, or expands "İ" to 2 chars).
+_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s", "K": "k"})
+
+
+class _Rule(Protocol):
+    pattern: re.Pattern[str]
+
+
+def fold(text: str) -> str:
+    """Case-fold text the same way the scanner literals are folded."""
+    if text.isascii():
+        return text.lower()
+    return text.translate(_FOLD).lower()
+
+
+def required_literals(pattern: re.Pattern[str]) -> frozenset[str] | None:
+    """Return literals of which at least one occurs in every match.
+
+    Literals are lower-cased ASCII. Returns None when no such set could be
+    derived, meaning the pattern must always be evaluated.
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    return _required(list(parsed))
+
+
+def _required(items: list) -> frozenset[str] | None:
+    candidates: list[frozenset[str]] = []
+    run: list[str] = []
+
+    for op, av in items:
+        if op is _LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+
+        if run:
+            candidates.append(frozenset(["".join(run)]))
+            run = []
+
+        sub: frozenset[str] | None = None
+        if op is _SUBPATTERN:
+            sub = _required(list(av[-1]))
+        elif op is _ATOMIC_GROUP:
+            sub = _required(list(av))
+        elif op in _REPEATS and av[0] >= 1:
+            sub = _required(list(av[2]))
+        elif op is _BRANCH:
+            alternatives = [_required(list(branch)) for branch in av[1]]
+            if all(alternatives):
+                sub = frozenset().union(*alternatives)
+        if sub:
+            candidates.append(sub)
+
+    if run:
+        candidates.append(frozenset(["".join(run)]))
+
+    # Prefer the most selective requirement: the longest shortest-literal,
+    # then the fewest alternatives.
+    return max(candidates, key=lambda c: (min(map(len, c)), -len(c)), default=None)
+
+
+def _trie_pattern(literals: Sequence[str]) -> str:
+    """Build a regex that matches the longest of `literals` at a position."""
+    trie: dict = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        ends_here = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Greedy optional group: the longest literal wins, shorter ones that
+        # end here are recovered from the prefix closure in MultiMatcher.
+        return group + "?" if ends_here else group
+
+    return build(trie)
+
+
+class MultiMatcher:
+    """Finds every matching rule with one literal scan plus targeted regexes."""
+
+    __slots__ = ("_rules", "_always", "_triggers", "_scanner")
+
+    def __init__(self, rules: Sequence[_Rule]) -> None:
+        self._rules = tuple(rules)
+        self._always: list[int] = []
+        by_literal: dict[str, set[int]] = {}
+
+        for index, rule in enumerate(self._rules):
+            literals = required_literals(rule.pattern)
+            if literals is None:
+                self._always.append(index)
+                continue
+            for literal in literals:
+                by_literal.setdefault(literal, set()).add(index)
+
+        # The scanner reports only the longest literal starting at a given
+        # position, so each literal also triggers the rules of every shorter
+        # literal that is a prefix of it.
+        self._triggers: dict[str, frozenset[int]] = {}
+        for literal in by_literal:
+            triggered: set[int] = set()
+            for end in range(1, len(literal) + 1):
+                triggered |= by_literal.get(literal[:end], set())
+            self._triggers[literal] = frozenset(triggered)
+
+        self._scanner = (
+            re.compile("(?=(" + _trie_pattern(list(by_literal)) + "))") if by_literal else None
+        )
+
+    def candidates(self, text: str) -> list[int]:
+        """Indexes of rules whose required literals occur in `text`, in rule order."""
+        found = set(self._always)
+        if self._scanner is not None:
+            for literal in set(self._scanner.findall(fold(text))):
+                found |= self._triggers[literal]
+        return sorted(found)
+
+    def match(self, text: str) -> list[_Rule]:
+        """Return every rule whose pattern matches `text`, in rule order."""
+        rules = self._rules
+        return [rules[i] for i in self.candidates(text) if rules[i].pattern.search(text)]
@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import ARRAY, Boolean, Integer, Text, Timestamp, VARCHAR
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import TIMESTAMP, Boolean, Index, Integer, Text, VARCHAR
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.database import Base
@@ -14,6 +14,20 @@ def _uuid() -> str:
 
 class AttackLog(Base):
     __tablename__ = "attack_logs"
+    # Every listing is ordered by (created_at, id) — the keyset of /api/logs —
+    # so each filter column is indexed together with it. The table is
+    # range-partitioned by day on created_at (see app/log_retention.py), which
+    # is why created_at is part of the primary key. The indexes match those
+    # created by alembic/versions/0002 and 0003; change them with a new
+    # migration, not by editing those.
+    __table_args__ = (
+        Index("ix_attack_logs_created_at_id", "created_at", "id"),
+        Index("ix_attack_logs_ip_created_at", "ip_address", "created_at", "id"),
+        Index("ix_attack_logs_action_created_at", "action_taken", "created_at", "id"),
+        Index("ix_attack_logs_threat_score", "threat_score"),
+        Index("ix_attack_logs_threat_types", "threat_types", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True, default=_uuid)
     ip_address: Mapped[str] = mapped_column(VARCHAR(45), nullable=False)
@@ -25,7 +39,7 @@ class AttackLog(Base):
     action_taken: Mapped[str] = mapped_column(VARCHAR(20), nullable=False)
     threat_types: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        Timestamp(timezone=True), default=datetime.utcnow, nullable=False
+        TIMESTAMP(timezone=True), primary_key=True, default=datetime.utcnow, nullable=False
     )
 
 
@@ -38,9 +52,15 @@ class WafRule(Base):
     pattern: Mapped[str] = mapped_column(Text, nullable=False)
     score: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     action: Mapped[str] = mapped_column(VARCHAR(20), nullable=False)
+    # Normalization chain applied before matching, e.g. ["url_decode",
+    # "html_decode"]; see app/normalize.py. NULL matches the raw text.
+    transforms: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
+    # Parts of the request scanned, e.g. ["query", "body", "cookies"]; see
+    # app/targets.py. NULL scans path, query and body.
+    targets: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
     enabled: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
-        Timestamp(timezone=True), default=datetime.utcnow, nullable=False
+        TIMESTAMP(timezone=True), default=datetime.utcnow, nullable=False
     )
 
 
@@ -50,9 +70,9 @@ class BlockedIP(Base):
     id: Mapped[str] = mapped_column(UUID(as_uuid=False), primary_key=True, default=_uuid)
     ip_address: Mapped[str] = mapped_column(VARCHAR(45), nullable=False, unique=True)
     reason: Mapped[str | None] = mapped_column(Text, nullable=True)
-    expires_at: Mapped[datetime | None] = mapped_column(Timestamp(timezone=True), nullable=True)
+    expires_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
-        Timestamp(timezone=True), default=datetime.utcnow, nullable=False
+        TIMESTAMP(timezone=True), default=datetime.utcnow, nullable=False
     )
 
 
@@ -62,5 +82,5 @@ class IPRateLimit(Base):
     ip_address: Mapped[str] = mapped_column(VARCHAR(45), primary_key=True)
     request_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     window_start: Mapped[datetime] = mapped_column(
-        Timestamp(timezone=True), default=datetime.utcnow, nullable=False
+        TIMESTAMP(timezone=True), default=datetime.utcnow, nullable=False
     )
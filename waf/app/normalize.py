@@ -0,0 +1,97 @@
+"""Request normalization: decoded views of the inspection text.
+
+Matching regexes against the raw request lets attackers hide a payload behind
+an encoding the pattern didn't anticipate — ``%252e%252e%252f``, ``&#x3c;``,
+``union/**/select``. Each rule therefore names an ordered chain of transforms
+(its ``transforms`` column), and is matched against the text those produce.
+
+Views are computed lazily and memoized per request by chain prefix: rules
+using ``url_decode → html_decode`` and ``url_decode → remove_comments`` share
+the single URL-decoded text, and a view no enabled rule asks for is never
+computed. Every transform returns its input unchanged, without copying, when
+there is nothing for it to do.
+"""
+
+import html
+import re
+from typing import Callable
+from urllib.parse import unquote_plus
+
+from app.matcher import fold
+
+# Bound on repeated decoding, enough for double and triple encoding.
+_MAX_DECODE_PASSES = 3
+
+_PERCENT_U = re.compile(r"%u([0-9a-fA-F]{4})")
+_ESCAPE = re.compile(r"\\(?:u([0-9a-fA-F]{4})|x([0-9a-fA-F]{2}))")
+_COMMENT = re.compile(r"/\*.*?(?:\*/|\Z)|<!--.*?(?:-->|\Z)", re.DOTALL)
+_WHITESPACE = re.compile(r"\s{2,}")
+
+
+def url_decode(text: str) -> str:
+    """Percent-decode (including IIS-style %uXXXX and '+') until stable."""
+    for _ in range(_MAX_DECODE_PASSES):
+        if "%" not in text and "+" not in text:
+            break
+        decoded = unquote_plus(_PERCENT_U.sub(lambda m: chr(int(m.group(1), 16)), text))
+        if decoded == text:
+            break
+        text = decoded
+    return text
+
+
+def html_decode(text: str) -> str:
+    """Decode HTML character references (named, decimal and hex) until stable."""
+    for _ in range(_MAX_DECODE_PASSES):
+        if "&" not in text:
+            break
+        decoded = html.unescape(text)
+        if decoded == text:
+            break
+        text = decoded
+    return text
+
+
+def escape_decode(text: str) -> str:
+    r"""Decode JavaScript/JSON-style \uXXXX and \xHH escapes."""
+    if "\\" not in text:
+        return text
+    return _ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)), text)
+
+
+def remove_comments(text: str) -> str:
+    """Replace /* … */ and <!-- … --> comments (even unterminated) with a space."""
+    if "/*" not in text and "<!--" not in text:
+        return text
+    return _COMMENT.sub(" ", text)
+
+
+def compress_whitespace(text: str) -> str:
+    """Collapse every run of two or more whitespace characters into one space."""
+    return _WHITESPACE.sub(" ", text)
+
+
+TRANSFORMS: dict[str, Callable[[str], str]] = {
+    "url_decode": url_decode,
+    "html_decode": html_decode,
+    "escape_decode": escape_decode,
+    "remove_comments": remove_comments,
+    "compress_whitespace": compress_whitespace,
+    "lowercase": fold,
+}
+
+
+class Views:
+    """Lazily computed, memoized transform chains over one request's text."""
+
+    __slots__ = ("_cache",)
+
+    def __init__(self, raw: str) -> None:
+        self._cache: dict[tuple[str, ...], str] = {(): raw}
+
+    def get(self, chain: tuple[str, ...]) -> str:
+        text = self._cache.get(chain)
+        if text is None:
+            text = TRANSFORMS[chain[-1]](self.get(chain[:-1]))
+            self._cache[chain] = text
+        return text
@@ -0,0 +1,232 @@
+"""Inspection of large payloads in a worker pool, off the event loop.
+
+Regex matching is CPU-bound and synchronous: while a big body is scanned
+inline, the worker's event loop can't accept connections, service dashboard
+WebSockets or relay other responses, so one large JSON upload shows up as a
+latency spike on every concurrent request. With INSPECTION_OFFLOAD set to
+"process" or "thread", bodies of at least INSPECTION_OFFLOAD_MIN_BYTES are
+inspected in a pool instead. Smaller requests keep running inline, where a
+pool round trip would cost more than the scan.
+
+"process" frees the loop whatever the rules run on; "thread" only helps
+with RE2 rules (app/regex_guard.py), as stdlib ``re`` holds the GIL while
+matching. Process workers are spawned with the current rule set preloaded —
+compiled once per worker, without profiling patterns again — and the pool
+is replaced when the rule set changes; inspections already submitted finish
+on the old one. Until the workers of a new pool are up, large bodies are
+inspected inline.
+
+At most one inspection per worker is in the pool at a time, so a submitted
+inspection starts right away; when every worker is busy, the body is
+inspected inline instead of queueing. The wait for a pooled verdict is
+bounded by four times INSPECTION_BUDGET_MS, and a request whose verdict
+doesn't arrive by then gets the over-budget verdict: even a regex that can't
+be interrupted only ties up a pool worker, never the proxy. That worker
+counts as busy until its inspection actually ends.
+Per-rule timings and budget counts recorded inside worker processes stay
+there; /metrics shows the inline and thread-pool ones.
+"""
+
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Callable, Mapping
+
+from app.core.config import settings
+from app.core.metrics import STAGE_INSPECTION
+from app.engine import BUDGET, SHORT_CIRCUIT, inspect_request, over_budget
+from app.models.models import WafRule
+from app.ruleset import RuleSet, compile_rules, rule_store
+
+logger = logging.getLogger(__name__)
+
+# Reported as the rule when a pooled inspection doesn't answer in time.
+POOL_TIMEOUT_RULE = "(pool timeout)"
+
+
+def rule_definitions(rule_set: RuleSet) -> list[dict]:
+    """The rule set as WafRule column values, to rebuild it in a worker."""
+    return [
+        {
+            "id": rule.id,
+            "name": rule.name,
+            "type": rule.type,
+            "pattern": rule.pattern.pattern,
+            "score": rule.score,
+            "action": rule.action,
+            "transforms": list(rule.transforms),
+            "targets": list(rule.targets),
+        }
+        for rule in rule_set.rules
+    ]
+
+
+def load_rules(definitions: list[dict], version: int) -> None:
+    """Process pool initializer: compile the parent's rule set once per worker."""
+    rows = [WafRule(**definition) for definition in definitions]
+    rule_store.install(compile_rules(rows, version, vetted=True))
+
+
+def _ready() -> None:
+    """Submitted once per new worker process, so it starts up right away."""
+
+
+def _inspect(
+    path: str,
+    query: str,
+    body: str,
+    headers: dict[str, str] | None,
+    complete: bool,
+    short_circuit: bool,
+) -> tuple[int, list[str], str]:
+    return inspect_request(
+        path, query, body, headers, short_circuit=short_circuit, complete=complete
+    )
+
+
+class InspectionPool:
+    def __init__(
+        self,
+        mode: str = settings.INSPECTION_OFFLOAD,
+        min_bytes: int = settings.INSPECTION_OFFLOAD_MIN_BYTES,
+        workers: int = settings.INSPECTION_OFFLOAD_WORKERS,
+    ) -> None:
+        self.mode = mode
+        self.min_bytes = min_bytes
+        self.workers = workers
+        self.timeout = 4 * BUDGET if BUDGET else None
+        self._executor: Executor | None = None
+        # Rule set version the process pool was started with.
+        self._version = -1
+        # Pending until every worker process of a new pool is up.
+        self._warmup: list[Future] = []
+        # Inspections submitted and not yet finished by their worker.
+        self._running = 0
+        self.offloaded = 0
+        self.timeouts = 0
+        # Inspected inline because every worker was busy.
+        self.overflowed = 0
+
+    def should_offload(self, size: int) -> bool:
+        return self.mode != "inline" and size >= self.min_bytes
+
+    def start(self) -> None:
+        """Start the pool now rather than on the first large request."""
+        if self.mode != "inline":
+            self._current_executor()
+
+    def _released(self, loop: asyncio.AbstractEventLoop) -> Callable[[Future], None]:
+        """Done callback for a submitted inspection; runs in a pool thread."""
+
+        def release(_: Future) -> None:
+            def decrement() -> None:
+                self._running -= 1
+
+            # The loop is gone if the job ends after shutdown.
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(decrement)
+
+        return release
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _current_executor(self) -> Executor | None:
+        """The pool to submit to, or None while a new process pool starts."""
+        if self.mode == "thread":
+            # Threads share this process's rule store; nothing to preload.
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inspect")
+            return self._executor
+
+        rule_set = rule_store.current
+        if self._executor is None or self._version != rule_set.version:
+            if self._executor is not None:
+                # Already submitted inspections still run to completion.
+                self._executor.shutdown(wait=False)
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                # Never fork a process that runs an event loop and threads.
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_rules,
+                initargs=(rule_definitions(rule_set), rule_set.version),
+            )
+            self._version = rule_set.version
+            self._warmup = [self._executor.submit(_ready) for _ in range(self.workers)]
+            logger.info(
+                "Inspection pool: %d worker processes, rule set v%d", self.workers, self._version
+            )
+        # Spawning and compiling the rules takes a while; the pool timeout is
+        # meant for inspection, not for that.
+        if not all(future.done() for future in self._warmup):
+            return None
+        return self._executor
+
+    async def inspect(
+        self,
+        path: str,
+        query: str,
+        body: str | None,
+        headers: Mapping[str, str] | None = None,
+        complete: bool = True,
+        short_circuit: bool = SHORT_CIRCUIT,
+    ) -> tuple[int, list[str], str]:
+        """inspect_request(), in the pool when the body is large enough."""
+        executor = None
+        if body and self.should_offload(len(body)):
+            executor = self._current_executor()
+            # Queueing would count waiting for a worker against the timeout.
+            if executor is not None and self._running >= self.workers:
+                self.overflowed += 1
+                executor = None
+        if executor is None:
+            return inspect_request(
+                path, query, body, headers, short_circuit=short_circuit, complete=complete
+            )
+
+        self.offloaded += 1
+        started = time.perf_counter()
+        try:
+            job = executor.submit(
+                _inspect,
+                path,
+                query,
+                body,
+                dict(headers) if headers else None,
+                complete,
+                short_circuit,
+            )
+            self._running += 1
+            # Called when the worker is done, not when this request stops
+            # waiting: a timed-out inspection still occupies its worker.
+            job.add_done_callback(self._released(asyncio.get_running_loop()))
+            return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return over_budget(POOL_TIMEOUT_RULE)
+        except BrokenExecutor:
+            # A worker died (e.g. killed for memory); start afresh next time.
+            logger.exception("Inspection pool broken; inspecting inline")
+            self._executor = None
+            self._warmup = []
+            return inspect_request(
+                path, query, body, headers, short_circuit=short_circuit, complete=complete
+            )
+        finally:
+            # Workers in another process can't report it themselves.
+            if self.mode == "process":
+                STAGE_INSPECTION.observe(time.perf_counter() - started)
+
+
+inspection_pool = InspectionPool()
@@ -0,0 +1,155 @@
+"""Per-IP and per-route rate limiting backed by Redis.
+
+Uses the sliding-window-counter approximation: each window keeps one counter
+per fixed bucket, and the request rate is estimated as the current bucket
+plus the previous bucket weighted by how much of it still overlaps the
+sliding window. That is O(1) memory per client no matter how hard it floods.
+
+Both limits are checked and counted by one Lua script, so a request costs a
+single atomic round trip. A client that exceeds the per-IP limit is also
+written to the ``blocked:{ip}`` key with a TTL, and the IP is announced on the
+blocklist channel so every worker's block cache picks it up immediately. A
+client that exceeds a per-route limit is only denied that route: the block is
+a key of its own, checked by the same script, and the rest of the site stays
+reachable. Postgres is never involved.
+
+The script touches no key it isn't passed: bucket keys are computed here, and
+all of them carry the IP as a hash tag, so it runs on Redis Cluster too.
+"""
+
+import logging
+import time
+
+import redis.asyncio as aioredis
+
+from app.blocklist import BLOCKLIST_CHANNEL, block_key
+from app.core.config import settings
+from app.core.metrics import STAGE_RATE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# KEYS: per-IP counter for the current and previous bucket, the same for the
+# route, route block key, IP block key.
+# ARGV: window seconds, IP limit, route limit (0 = none), block seconds,
+# blocklist channel, IP, weight of the previous bucket.
+# Returns 0 when allowed, 1 when the IP limit is hit, 2 for the route limit.
+_SLIDING_WINDOW_LUA = """
+local window = tonumber(ARGV[1])
+local ip_limit = tonumber(ARGV[2])
+local route_limit = tonumber(ARGV[3])
+local block_seconds = tonumber(ARGV[4])
+local weight = tonumber(ARGV[7])
+
+if route_limit > 0 and redis.call('EXISTS', KEYS[5]) == 1 then
+  return 2
+end
+
+local function estimate(current, previous)
+  return tonumber(redis.call('GET', previous) or 0) * weight
+    + tonumber(redis.call('GET', current) or 0)
+end
+
+local exceeded = 0
+if ip_limit > 0 and estimate(KEYS[1], KEYS[2]) >= ip_limit then
+  exceeded = 1
+elseif route_limit > 0 and estimate(KEYS[3], KEYS[4]) >= route_limit then
+  exceeded = 2
+end
+
+if exceeded > 0 then
+  if block_seconds > 0 then
+    if exceeded == 1 then
+      redis.call('SET', KEYS[6], 'rate_limit', 'EX', block_seconds)
+      redis.call('PUBLISH', ARGV[5], cjson.encode({op = 'invalidate', network = ARGV[6]}))
+    else
+      redis.call('SET', KEYS[5], 'rate_limit', 'EX', block_seconds)
+    end
+  end
+  return exceeded
+end
+
+local function count(key)
+  redis.call('INCR', key)
+  redis.call('EXPIRE', key, window * 2)
+end
+
+if ip_limit > 0 then count(KEYS[1]) end
+if route_limit > 0 then count(KEYS[3]) end
+return 0
+"""
+
+
+def _parse_routes(spec: str) -> list[tuple[str, int]]:
+    """Parse "prefix=limit,prefix=limit" into (prefix, limit), longest first."""
+    routes: list[tuple[str, int]] = []
+    for item in spec.split(","):
+        prefix, sep, limit = item.strip().rpartition("=")
+        if sep and prefix:
+            routes.append((prefix, int(limit)))
+    return sorted(routes, key=lambda r: len(r[0]), reverse=True)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        ip_limit: int = settings.RATE_LIMIT_REQUESTS,
+        window_seconds: int = settings.RATE_LIMIT_WINDOW_SECONDS,
+        routes: str = settings.RATE_LIMIT_ROUTES,
+        block_seconds: int = settings.RATE_LIMIT_BLOCK_SECONDS,
+    ) -> None:
+        self.ip_limit = ip_limit
+        self.window_seconds = window_seconds
+        self.routes = _parse_routes(routes)
+        self.block_seconds = block_seconds
+        self._script = redis.register_script(_SLIDING_WINDOW_LUA)
+
+    def _route_for(self, path: str) -> tuple[str, int]:
+        for prefix, limit in self.routes:
+            if path.startswith(prefix):
+                return prefix, limit
+        return "", 0
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds a limited client should wait before retrying."""
+        return self.block_seconds or self.window_seconds
+
+    async def allow(self, ip: str, path: str) -> bool:
+        """Count the request and return False if it exceeds a limit.
+
+        Fails open: if Redis is unreachable the request is allowed.
+        """
+        route, route_limit = self._route_for(path)
+        # Buckets follow this worker's clock; workers are assumed NTP-synced.
+        now = time.time()
+        bucket, into = divmod(now, self.window_seconds)
+        ip_counter = f"ratelimit:{{{ip}}}:ip:"
+        route_counter = f"ratelimit:{{{ip}}}:route:{route}:"
+        started = time.perf_counter()
+        try:
+            exceeded = await self._script(
+                keys=[
+                    f"{ip_counter}{bucket:.0f}",
+                    f"{ip_counter}{bucket - 1:.0f}",
+                    f"{route_counter}{bucket:.0f}",
+                    f"{route_counter}{bucket - 1:.0f}",
+                    f"{route_counter}blocked",
+                    block_key(ip),
+                ],
+                args=[
+                    self.window_seconds,
+                    self.ip_limit,
+                    route_limit,
+                    self.block_seconds,
+                    BLOCKLIST_CHANNEL,
+                    ip,
+                    1 - into / self.window_seconds,
+                ],
+            )
+        except aioredis.RedisError:
+            logger.warning("Rate limiter unavailable; allowing request from %s", ip)
+            return True
+        finally:
+            STAGE_RATE_LIMIT.observe(time.perf_counter() - started)
+        return not exceeded
@@ -0,0 +1,159 @@
+"""Load-time safety checks and engine selection for rule patterns.
+
+Rule patterns are arbitrary regexes, and Python's backtracking engine can
+take exponential (or, more commonly, quadratic) time on crafted input — time
+during which the worker's event loop is stuck, as ``re`` never releases the
+GIL. Every rule is therefore vetted when the rule set is compiled:
+
+- With REGEX_ENGINE "auto" (the default) or "re2", patterns run on RE2 when
+  the optional ``google-re2`` package is installed and the pattern is
+  compatible (no backreferences or lookarounds). RE2 matches in linear time,
+  so such rules need no further checks.
+- Patterns left on ``re`` are rejected when they contain nested or ambiguous
+  unbounded repetition (``(a+)+``, ``(a|ab)*``), the shapes behind
+  exponential blow-ups, and are then profiled against adversarial probes built
+  from their own literals. A rule whose slowest probe takes longer than
+  RULE_PROFILE_BUDGET_MS is rejected too.
+
+Results are cached per pattern, so reloading an unchanged rule set is cheap.
+"""
+
+import logging
+import re
+import time
+from typing import Callable
+
+from app.core.config import settings
+from app.matcher import required_literals
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse  # type: ignore[no-redef]
+
+try:
+    import re2
+except ImportError:  # optional dependency
+    re2 = None
+
+logger = logging.getLogger(__name__)
+
+Search = Callable[[str], object]
+
+_REPEATS = {
+    op
+    for op in (
+        sre_parse.MAX_REPEAT,
+        sre_parse.MIN_REPEAT,
+        getattr(sre_parse, "POSSESSIVE_REPEAT", None),
+    )
+    if op is not None
+}
+_UNBOUNDED = sre_parse.MAXREPEAT
+
+# Probe seeds besides the rule's own literals: characters that commonly sit
+# under a quantifier in signatures.
+_PROBE_SEEDS = ("a", "0", " ", "'", "<", "$(", "=")
+# Probe lengths, growing so that a pathological rule is caught on a short
+# input before it gets to chew on a long one.
+_PROBE_SIZES = (256, 2048)
+
+_verdicts: dict[str, tuple[Search, str | None]] = {}
+
+
+def _nested_repeat(items: list, under_repeat: bool = False) -> bool:
+    """Whether an unbounded repeat contains another unbounded repeat or an
+    alternation — the ambiguity that makes backtracking exponential."""
+    for op, av in items:
+        if op in _REPEATS:
+            unbounded = av[1] == _UNBOUNDED
+            if unbounded and under_repeat:
+                return True
+            if _nested_repeat(list(av[2]), under_repeat or unbounded):
+                return True
+        elif op is sre_parse.BRANCH:
+            if under_repeat:
+                return True
+            if any(_nested_repeat(list(branch), under_repeat) for branch in av[1]):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if _nested_repeat(list(av[-1]), under_repeat):
+                return True
+    return False
+
+
+def _probes(pattern: re.Pattern[str]) -> list[str]:
+    seeds = list(_PROBE_SEEDS)
+    seeds.extend(sorted(required_literals(pattern) or ()))
+    probes = []
+    for size in _PROBE_SIZES:
+        for seed in seeds:
+            # The seed alone, and followed by a separator, repeated to size.
+            for unit in (seed, seed + " "):
+                probes.append(unit * (size // len(unit)))
+    return probes
+
+
+def _search_seconds(pattern: re.Pattern[str], text: str) -> float:
+    started = time.perf_counter()
+    pattern.search(text)
+    return time.perf_counter() - started
+
+
+def worst_case_seconds(pattern: re.Pattern[str], limit: float) -> float:
+    """Slowest search over the adversarial probes; stops once over `limit`."""
+    worst = 0.0
+    for probe in _probes(pattern):
+        seconds = _search_seconds(pattern, probe)
+        if seconds > limit:
+            # Retry before condemning the rule: a GC pause or a busy CPU
+            # shouldn't make a linear pattern look pathological.
+            seconds = min(seconds, *(_search_seconds(pattern, probe) for _ in range(2)))
+        worst = max(worst, seconds)
+        if worst > limit:
+            break
+    return worst
+
+
+def _re2_search(pattern: re.Pattern[str]) -> Search | None:
+    if re2 is None or settings.REGEX_ENGINE == "re":
+        return None
+    try:
+        # Rule patterns are always case-insensitive.
+        return re2.compile("(?i)" + pattern.pattern).search
+    except re2.error:
+        return None
+
+
+def vet(pattern: re.Pattern[str], check: bool = True) -> tuple[Search, str | None]:
+    """Pick the engine for a compiled rule pattern and check its safety.
+
+    Returns (search function, problem); `problem` is None for a safe pattern,
+    otherwise why the rule must not be loaded. With `check` False only the
+    engine is picked, for patterns that were vetted already.
+    """
+    cached = _verdicts.get(pattern.pattern)
+    if cached is not None:
+        return cached
+
+    search = _re2_search(pattern)
+    if not check:
+        return search or pattern.search, None
+    if search is not None:
+        verdict: tuple[Search, str | None] = (search, None)
+    elif _nested_repeat(list(sre_parse.parse(pattern.pattern, pattern.flags))):
+        verdict = (pattern.search, "nested or ambiguous unbounded repetition")
+    else:
+        budget = settings.RULE_PROFILE_BUDGET_MS / 1000
+        worst = worst_case_seconds(pattern, budget)
+        problem = None
+        if worst > budget:
+            problem = f"{worst * 1000:.1f} ms on adversarial input"
+        verdict = (pattern.search, problem)
+
+    _verdicts[pattern.pattern] = verdict
+    return verdict
+
+
+if settings.REGEX_ENGINE == "re2" and re2 is None:
+    logger.warning("REGEX_ENGINE=re2 but google-re2 is not installed; using re")
@@ -0,0 +1,157 @@
+"""Per-IP reputation: threat scores that add up across requests.
+
+Each request is scored on its own, so a client probing with payloads that
+each stay just under THREAT_SCORE_THRESHOLD would never be blocked. Every
+request that scores above zero therefore also adds its threat score to the
+client IP's reputation in Redis, which decays exponentially: it halves every
+REPUTATION_HALF_LIFE_SECONDS, so occasional false positives fade while a
+scanner's scores pile up.
+
+An IP whose reputation reaches REPUTATION_BLOCK_SCORE is written to the
+``blocked:{ip}`` key for REPUTATION_BLOCK_SECONDS and announced on the
+blocklist channel, exactly like a rate-limit block, and its reputation starts
+over. An IP blocked REPUTATION_ESCALATE_AFTER times within
+REPUTATION_ESCALATE_WINDOW_SECONDS is escalated to a ``blocked_ips`` row.
+
+Decay, update and block are one Lua script, so a scored request costs a
+single atomic round trip and clean traffic (score 0) costs none.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+import redis.asyncio as aioredis
+from sqlalchemy.dialects.postgresql import insert
+
+from app.blocklist import BLOCKLIST_CHANNEL, announce_block, block_key
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import STAGE_REPUTATION, reputation_blocks
+from app.models.models import BlockedIP
+from app.prefix_table import normalize_network
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of Reputation.record().
+ALLOWED, BLOCKED, ESCALATED = 0, 1, 2
+
+# Reported in threat_types when reputation blocked the request.
+REPUTATION_THREAT = "REPUTATION"
+
+# KEYS[1] reputation hash, KEYS[2] block counter, KEYS[3] block key.
+# ARGV: score to add, half-life seconds, block score, block seconds,
+# escalate after (0 = never), escalate window seconds, blocklist channel, IP.
+# Returns {outcome, reputation}; the reputation as a string, since Redis
+# truncates Lua numbers to integers.
+_REPUTATION_LUA = """
+local half_life = tonumber(ARGV[2])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'score', 'at')
+local score = tonumber(state[1]) or 0
+local at = tonumber(state[2]) or now
+score = score * 0.5 ^ ((now - at) / half_life) + tonumber(ARGV[1])
+
+if score >= tonumber(ARGV[3]) then
+  redis.call('DEL', KEYS[1])
+  redis.call('SET', KEYS[3], 'reputation', 'EX', ARGV[4])
+  redis.call('PUBLISH', ARGV[7], cjson.encode({op = 'invalidate', network = ARGV[8]}))
+  local escalate_after = tonumber(ARGV[5])
+  if escalate_after > 0 then
+    local blocks = redis.call('INCR', KEYS[2])
+    if blocks == 1 then redis.call('EXPIRE', KEYS[2], ARGV[6]) end
+    if blocks >= escalate_after then
+      redis.call('DEL', KEYS[2])
+      return {2, tostring(score)}
+    end
+  end
+  return {1, tostring(score)}
+end
+
+redis.call('HSET', KEYS[1], 'score', tostring(score), 'at', tostring(now))
+-- Forget the IP once its reputation has decayed below 1.
+local lifetime = half_life * math.max(1, math.log(score) / math.log(2))
+redis.call('EXPIRE', KEYS[1], math.ceil(lifetime))
+return {0, tostring(score)}
+"""
+
+
+def reputation_keys(ip: str) -> list[str]:
+    """`ip`'s reputation hash and block counter (hash-tagged like block_key())."""
+    return [f"reputation:{{{ip}}}", f"reputation:blocks:{{{ip}}}"]
+
+
+class Reputation:
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        half_life_seconds: float = settings.REPUTATION_HALF_LIFE_SECONDS,
+        block_score: float = settings.REPUTATION_BLOCK_SCORE,
+        block_seconds: int = settings.REPUTATION_BLOCK_SECONDS,
+        escalate_after: int = settings.REPUTATION_ESCALATE_AFTER,
+        escalate_window_seconds: int = settings.REPUTATION_ESCALATE_WINDOW_SECONDS,
+    ) -> None:
+        self.half_life_seconds = half_life_seconds
+        self.block_score = block_score
+        self.block_seconds = block_seconds
+        self.escalate_after = escalate_after
+        self.escalate_window_seconds = escalate_window_seconds
+        self._script = redis.register_script(_REPUTATION_LUA)
+
+    async def record(self, ip: str, threat_score: int) -> int:
+        """Add a request's threat score to `ip`'s reputation.
+
+        Returns ALLOWED, BLOCKED (the IP was just blocked for
+        REPUTATION_BLOCK_SECONDS) or ESCALATED (blocked, and due for a
+        blocked_ips row — see escalate()). Fails open: if Redis is
+        unreachable, ALLOWED.
+        """
+        started = time.perf_counter()
+        try:
+            outcome, _ = await self._script(
+                keys=[*reputation_keys(ip), block_key(ip)],
+                args=[
+                    threat_score,
+                    self.half_life_seconds,
+                    self.block_score,
+                    self.block_seconds,
+                    self.escalate_after,
+                    self.escalate_window_seconds,
+                    BLOCKLIST_CHANNEL,
+                    ip,
+                ],
+            )
+        except aioredis.RedisError:
+            logger.warning("Reputation unavailable; not scoring %s", ip)
+            return ALLOWED
+        finally:
+            STAGE_REPUTATION.observe(time.perf_counter() - started)
+        outcome = int(outcome)
+        if outcome == BLOCKED:
+            reputation_blocks.inc(labels=("temporary",))
+        elif outcome == ESCALATED:
+            reputation_blocks.inc(labels=("escalated",))
+        return outcome
+
+
+async def escalate(redis: aioredis.Redis, ip: str) -> None:
+    """Add `ip` to the blocked_ips table, for REPUTATION_ESCALATE_BLOCK_DAYS."""
+    days = settings.REPUTATION_ESCALATE_BLOCK_DAYS
+    expires_at = datetime.utcnow() + timedelta(days=days) if days > 0 else None
+    try:
+        network = normalize_network(ip)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                insert(BlockedIP)
+                .values(ip_address=network, reason="reputation", expires_at=expires_at)
+                .on_conflict_do_nothing(index_elements=["ip_address"])
+            )
+            await db.commit()
+        await announce_block(redis, network, expires_at)
+    except Exception:
+        # The temporary Redis block is already in place.
+        logger.exception("Could not escalate %s to the blocklist", ip)
+    else:
+        logger.warning("Escalated %s to the blocklist (repeated reputation blocks)", ip)
@@ -0,0 +1,282 @@
+"""Process-local compiled rule set with hot reload.
+
+Enabled rules are loaded from Postgres once at startup and compiled into an
+immutable ``RuleSet``. The inspection hot path only ever reads
+``rule_store.current`` — it never touches the database.
+
+When a rule is edited through the API, the handling worker rebuilds its set
+and publishes a notification on the event bus (app/core/events.py); every
+other worker rebuilds its own copy from the table.
+"""
+
+import asyncio
+import logging
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Callable, Container, Iterable, Mapping
+
+import redis.asyncio as aioredis
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.core.events import event_bus
+from app.core.metrics import rule_timings
+from app.matcher import MultiMatcher
+from app.models.models import WafRule
+from app.normalize import TRANSFORMS, Views
+from app.regex_guard import vet
+from app.targets import DEFAULT_TARGETS, TARGETS
+
+logger = logging.getLogger(__name__)
+
+RULES_CHANNEL = "waf:rules:changed"
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    id: str
+    name: str
+    type: str
+    pattern: re.Pattern[str]
+    # pattern.search, or the RE2 equivalent (app/regex_guard.py).
+    search: Callable[[str], object]
+    score: int
+    # "block" rules decide blocking; any other action ("log") is monitor-only.
+    action: str
+    # Normalization chain applied to the text before matching (app/normalize.py).
+    transforms: tuple[str, ...] = ()
+    # Parts of the request the rule scans (app/targets.py).
+    targets: tuple[str, ...] = DEFAULT_TARGETS
+
+
+class InspectionBudgetExceeded(Exception):
+    """Matching ran past its deadline; `rule` is the one that crossed it."""
+
+    def __init__(self, rule: CompiledRule, matched: list[CompiledRule]) -> None:
+        super().__init__(rule.name)
+        self.rule = rule
+        # Rules matched before time ran out.
+        self.matched = matched
+
+
+class _Scope:
+    """The rules that apply to one target, with a literal prefilter of their own."""
+
+    __slots__ = ("indices", "matcher", "chains")
+
+    def __init__(self, rules: tuple[CompiledRule, ...], indices: list[int]) -> None:
+        # Positions in RuleSet.rules, so results keep the global rule order.
+        self.indices = tuple(indices)
+        self.matcher = MultiMatcher([rules[index] for index in indices])
+        self.chains = tuple(dict.fromkeys(rules[index].transforms for index in indices))
+
+
+class RuleSet:
+    """Immutable snapshot of the enabled rules, ready for matching.
+
+    Rules are grouped by target (app/targets.py); each target's text is only
+    scanned for the rules that apply to it. Within a target, one literal
+    prefilter runs once per distinct normalized view of the text — a
+    transform with nothing to decode returns the text itself, so typically
+    only one or two scans are needed — and each candidate rule's regex then
+    runs on the view its own chain produced.
+
+    Rules are kept in evaluation order (see _evaluation_order), so matching
+    can stop as soon as a block is certain.
+    """
+
+    __slots__ = ("rules", "version", "rejected", "_scopes")
+
+    def __init__(
+        self,
+        rules: Iterable[CompiledRule],
+        version: int,
+        rejected: dict[str, str] | None = None,
+    ) -> None:
+        self.rules: tuple[CompiledRule, ...] = tuple(rules)
+        self.version = version
+        # Enabled rules left out of the set: rule name -> reason.
+        self.rejected = rejected or {}
+        by_target: dict[str, list[int]] = {}
+        for index, rule in enumerate(self.rules):
+            for target in rule.targets:
+                by_target.setdefault(target, []).append(index)
+        # Built alongside the rules so a swap replaces both at once.
+        self._scopes = {
+            target: _Scope(self.rules, indices) for target, indices in by_target.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(
+        self,
+        targets: Mapping[str, str],
+        observe: Callable[[CompiledRule, float], None] | None = None,
+        stop_at: int | None = None,
+        skip: Container[str] = (),
+        deadline: float | None = None,
+    ) -> list[CompiledRule]:
+        """Rules matching any of their targets, in rule (evaluation) order.
+
+        `targets` maps target names to their text. With `stop_at`, evaluation
+        ends as soon as the matched "block" rules score that much: the block
+        is certain, and the remaining rules are not evaluated. Rules whose id
+        is in `skip` (already matched elsewhere) are not evaluated at all.
+        With `observe`, each full-regex evaluation is timed and reported.
+
+        Raises InspectionBudgetExceeded once a regex evaluation ends after
+        `deadline` (a time.thread_time() value: CPU time of the inspecting
+        thread, so time spent on other requests doesn't count).
+        """
+        rules = self.rules
+        matched: set[int] = set()
+        blocking = 0
+        for target, text in targets.items():
+            scope = self._scopes.get(target)
+            if scope is None or not text:
+                continue
+            for index, view in self._candidates(scope, text):
+                rule = rules[index]
+                # Already matched in another target, or by the caller.
+                if index in matched or rule.id in skip:
+                    continue
+                if observe is None:
+                    hit = rule.search(view)
+                else:
+                    started = time.perf_counter()
+                    hit = rule.search(view)
+                    observe(rule, time.perf_counter() - started)
+                if deadline is not None and time.thread_time() > deadline:
+                    if hit:
+                        matched.add(index)
+                    raise InspectionBudgetExceeded(rule, [rules[i] for i in sorted(matched)])
+                if not hit:
+                    continue
+                matched.add(index)
+                if rule.action == "block":
+                    blocking += rule.score
+                    if stop_at is not None and blocking >= stop_at:
+                        return [rules[i] for i in sorted(matched)]
+        return [rules[index] for index in sorted(matched)]
+
+    def _candidates(self, scope: _Scope, text: str) -> list[tuple[int, str]]:
+        """(rule index, view to match it against) for every prefilter candidate
+        of `scope` in `text`, in rule order."""
+        views = Views(text)
+        by_chain = {chain: views.get(chain) for chain in scope.chains}
+        rules = self.rules
+        found: list[tuple[int, str]] = []
+        for view in set(by_chain.values()):
+            for local in scope.matcher.candidates(view):
+                index = scope.indices[local]
+                if by_chain[rules[index].transforms] == view:
+                    found.append((index, view))
+        # Each rule has exactly one view, so the indexes alone decide the order.
+        found.sort(key=itemgetter(0))
+        return found
+
+
+def _evaluation_order(rule: CompiledRule) -> tuple[bool, int, float]:
+    """Sort key: blocking rules first, highest score first, then cheapest by
+    sampled regex cost — the order that reaches a certain block soonest."""
+    stats = rule_timings.stats.get(rule.name)
+    cost = stats[1] / stats[0] if stats else 0.0
+    return rule.action != "block", -rule.score, cost
+
+
+def compile_rules(rows: Iterable[WafRule], version: int, vetted: bool = False) -> RuleSet:
+    """Compile rule rows into a RuleSet, leaving out malformed and unsafe ones.
+
+    Profiling new patterns takes a while (see app/regex_guard.py); call this
+    off the event loop, or pass `vetted` for rows that passed already.
+    """
+    compiled: list[CompiledRule] = []
+    rejected: dict[str, str] = {}
+    for row in rows:
+        # Don't let one bad rule take the whole rule set down.
+        try:
+            pattern = re.compile(row.pattern, re.IGNORECASE)
+        except re.error as exc:
+            rejected[row.name] = f"invalid pattern ({exc})"
+            continue
+        transforms = tuple(row.transforms or ())
+        unknown = [name for name in transforms if name not in TRANSFORMS]
+        if unknown:
+            rejected[row.name] = f"unknown transforms {unknown}"
+            continue
+        targets = tuple(row.targets or DEFAULT_TARGETS)
+        unknown = [name for name in targets if name not in TARGETS]
+        if unknown:
+            rejected[row.name] = f"unknown targets {unknown}"
+            continue
+        search, problem = vet(pattern, check=not vetted)
+        if problem is not None:
+            rejected[row.name] = f"unsafe pattern: {problem}"
+            continue
+        compiled.append(
+            CompiledRule(
+                id=str(row.id),
+                name=row.name,
+                type=row.type,
+                pattern=pattern,
+                search=search,
+                score=row.score,
+                action=row.action,
+                transforms=transforms,
+                targets=targets,
+            )
+        )
+    for name, reason in rejected.items():
+        logger.warning("Skipping rule %r: %s", name, reason)
+    compiled.sort(key=_evaluation_order)
+    return RuleSet(compiled, version, rejected)
+
+
+class RuleStore:
+    """Holds the current RuleSet and keeps it in sync across workers."""
+
+    def __init__(self) -> None:
+        self._current = RuleSet((), 0)
+        self._lock = asyncio.Lock()
+        # Identifies this process on the pub/sub channel so it can ignore
+        # its own notifications.
+        self.instance_id = uuid.uuid4().hex
+
+    @property
+    def current(self) -> RuleSet:
+        return self._current
+
+    def install(self, rule_set: RuleSet) -> None:
+        """Use a rule set built elsewhere (inspection pool workers)."""
+        self._current = rule_set
+
+    async def reload(self) -> RuleSet:
+        """Rebuild the rule set from the table and swap it in atomically."""
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(WafRule).where(WafRule.enabled == True))  # noqa: E712
+                rows = result.scalars().all()
+            # Vetting new patterns is CPU work; keep it off the event loop.
+            rule_set = await asyncio.to_thread(compile_rules, rows, self._current.version + 1)
+            # A single reference assignment — in-flight inspections keep
+            # using the snapshot they already hold.
+            self._current = rule_set
+            return self._current
+
+    async def notify_changed(self, redis: aioredis.Redis) -> None:
+        """Reload locally, then tell every other worker to do the same."""
+        await self.reload()
+        if not await event_bus.publish(redis, RULES_CHANNEL, self.instance_id):
+            logger.warning("Rule change not announced; other workers keep stale rules")
+
+    async def on_change(self, source: str) -> None:
+        """Event bus handler: another worker changed the rules."""
+        if source != self.instance_id:
+            await self.reload()
+
+
+rule_store = RuleStore()
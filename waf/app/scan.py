@@ -0,0 +1,298 @@
+"""Offline replay of request corpora through the WAF rules.
+
+Scores recorded traffic with the same logic as the proxy (inspect_request),
+without a database, Redis or a running WAF — to retro-scan history when a
+rule is added, or to measure a rule's false-positive rate before rollout.
+Run from the waf/ directory:
+
+    python -m app.scan traffic.jsonl /var/log/nginx/access.log \\
+        --rules new_rules.json --verdicts verdicts.jsonl --report report.json
+
+Inputs are read line by line, so files of any size stream through in
+constant memory:
+
+- JSONL: one request per line, ``{"method", "path", "query", "headers",
+  "body"}`` (the benchmark corpus format); a query may also be part of
+  ``path``, and a body given as a JSON object or array is inspected as its
+  JSON text. Lines whose ``headers`` is not an object count as unparsed.
+- nginx access logs in the ``combined`` format: the request line, Referer
+  and User-Agent are inspected (access logs don't record bodies).
+
+Lines are scanned in batches by a pool of worker processes, each holding the
+compiled rule set. Every rule is evaluated (no short-circuit), so per-rule
+hit counts are complete. The seeded default rules are used unless
+--no-default-rules is given; --rules adds rules from a JSON array of objects
+with the ``waf_rules`` columns (name, pattern, and optionally type, score,
+action, transforms and targets).
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from types import SimpleNamespace
+from typing import IO, Iterator
+
+from app.engine import evaluate_request
+from app.offload import load_rules, rule_definitions
+from app.ruleset import RuleSet, compile_rules, rule_store
+from app.seed import _DEFAULT_RULES
+
+# nginx "combined": $remote_addr - $remote_user [$time_local] "$request"
+# $status $body_bytes_sent "$http_referer" "$http_user_agent"
+_ACCESS_LOG = re.compile(
+    r'^\S+ \S+ \S+ \[[^\]]*\] "(?P<method>[A-Z]+) (?P<target>\S+)[^"]*" \d{3} \S+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+# nginx writes '"', '\' and non-printable bytes in logged strings as \xHH.
+_LOG_ESCAPE = re.compile(r"\\x([0-9A-Fa-f]{2})")
+
+# Batches submitted per worker ahead of the one being collected.
+_PENDING_PER_WORKER = 4
+
+
+def _unescape(text: str) -> str:
+    if "\\x" not in text:
+        return text
+    raw = _LOG_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), text)
+    return raw.encode("latin-1", errors="replace").decode("utf-8", errors="replace")
+
+
+def _text(value: object) -> str:
+    """A JSONL field as text: structured values as JSON, scalars via str()."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def parse_line(line: str) -> dict | None:
+    """A request from a JSONL or access-log line; None if it is neither."""
+    line = line.strip()
+    if line.startswith("{"):
+        try:
+            item = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(item, dict) or "path" not in item:
+            return None
+        headers = item.get("headers") or {}
+        if not isinstance(headers, dict):
+            return None
+        path, _, query = _text(item["path"]).partition("?")
+        body = item.get("body")
+        return {
+            "method": _text(item.get("method", "GET")),
+            "path": path,
+            "query": _text(item.get("query") or query),
+            "headers": {
+                _text(k).lower(): _text(v) for k, v in headers.items() if v is not None
+            },
+            "body": _text(body) if body not in (None, "") else None,
+        }
+
+    match = _ACCESS_LOG.match(line)
+    if match is None:
+        return None
+    path, _, query = _unescape(match["target"]).partition("?")
+    headers = {}
+    for name, group in (("referer", "referer"), ("user-agent", "agent")):
+        value = match[group]
+        if value and value != "-":
+            headers[name] = _unescape(value)
+    return {
+        "method": match["method"],
+        "path": path,
+        "query": query,
+        "headers": headers,
+        "body": None,
+    }
+
+
+def _scan_batch(lines: list[str]) -> list[dict | None]:
+    """Worker: the verdict for each line (None for unparsable ones)."""
+    results: list[dict | None] = []
+    for line in lines:
+        request = parse_line(line)
+        if request is None:
+            results.append(None)
+            continue
+        matched, (score, threat_types, action) = evaluate_request(
+            request["path"],
+            request["query"],
+            request["body"],
+            request["headers"],
+            short_circuit=False,
+        )
+        results.append(
+            {
+                "method": request["method"],
+                "path": request["path"],
+                "score": score,
+                "threat_types": threat_types,
+                "action": action,
+                "rules": [rule.name for rule in matched],
+            }
+        )
+    return results
+
+
+def load_rule_set(rule_files: list[str], default_rules: bool = True) -> RuleSet:
+    """Compile (and vet) the default rules plus those in `rule_files`."""
+    definitions = list(_DEFAULT_RULES) if default_rules else []
+    for path in rule_files:
+        with open(path, encoding="utf-8") as fh:
+            definitions.extend(json.load(fh))
+    rows = [
+        SimpleNamespace(
+            id=str(index),
+            name=rule["name"],
+            type=rule.get("type", "Custom"),
+            pattern=rule["pattern"],
+            score=rule.get("score", 50),
+            action=rule.get("action", "block"),
+            transforms=rule.get("transforms"),
+            targets=rule.get("targets"),
+        )
+        for index, rule in enumerate(definitions)
+    ]
+    return compile_rules(rows, version=1)
+
+
+def _batches(files: list[str], size: int) -> Iterator[tuple[str, int, list[str]]]:
+    """(file, number of its first line, lines) for consecutive runs of lines."""
+    for path in files:
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            line_number = 1
+            while batch := list(islice(fh, size)):
+                yield path, line_number, batch
+                line_number += len(batch)
+
+
+class Report:
+    def __init__(self, rule_set: RuleSet) -> None:
+        self.rule_set = rule_set
+        self.requests = 0
+        self.unparsed = 0
+        self.actions: Counter[str] = Counter()
+        self.flagged = 0
+        self.hits: Counter[str] = Counter({rule.name: 0 for rule in rule_set.rules})
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, result: dict | None) -> None:
+        if result is None:
+            self.unparsed += 1
+            return
+        self.requests += 1
+        self.actions[result["action"]] += 1
+        if result["rules"]:
+            self.flagged += 1
+        self.hits.update(result["rules"])
+
+    def finish(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "unparsed_lines": self.unparsed,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "requests_per_second": round(self.requests / self.elapsed, 1) if self.elapsed else 0,
+            "actions": dict(self.actions),
+            "flagged": self.flagged,
+            "rule_hits": dict(self.hits.most_common()),
+            "rejected_rules": self.rule_set.rejected,
+        }
+
+    def write(self, out: IO[str]) -> None:
+        rate = self.requests / self.elapsed if self.elapsed else 0.0
+        print(f"requests     {self.requests} ({self.unparsed} unparsed lines)", file=out)
+        print(f"elapsed      {self.elapsed:.2f}s", file=out)
+        print(f"throughput   {rate:,.0f} req/s", file=out)
+        actions = ", ".join(f"{name}: {count}" for name, count in sorted(self.actions.items()))
+        print(f"actions      {actions or '-'}", file=out)
+        print(f"flagged      {self.flagged} (matched at least one rule)", file=out)
+        print(file=out)
+        print(f"{'rule':<40}{'hits':>10}{'% of requests':>16}", file=out)
+        for name, hits in self.hits.most_common():
+            share = 100 * hits / self.requests if self.requests else 0.0
+            print(f"{name[:39]:<40}{hits:>10}{share:>15.3f}%", file=out)
+        for name, reason in self.rule_set.rejected.items():
+            print(f"rejected: {name}: {reason}", file=out)
+
+
+def scan(args: argparse.Namespace) -> Report:
+    rule_set = load_rule_set(args.rules, default_rules=not args.no_default_rules)
+    rule_store.install(rule_set)
+    report = Report(rule_set)
+    verdicts = open(args.verdicts, "w", encoding="utf-8") if args.verdicts else None
+
+    def collect(source: str, first_line: int, results: list[dict | None]) -> None:
+        for line, result in enumerate(results, first_line):
+            report.add(result)
+            if verdicts is not None and result is not None:
+                if result["rules"] or not args.only_flagged:
+                    record = {"source": source, "line": line, **result}
+                    verdicts.write(json.dumps(record) + "\n")
+
+    try:
+        if args.workers <= 1:
+            for source, first_line, batch in _batches(args.inputs, args.batch_size):
+                collect(source, first_line, _scan_batch(batch))
+        else:
+            with ProcessPoolExecutor(
+                args.workers,
+                initializer=load_rules,
+                initargs=(rule_definitions(rule_set), rule_set.version),
+            ) as pool:
+                # Keep a bounded number of batches in flight, collected in
+                # input order, so memory stays flat however large the input.
+                pending: deque[tuple[str, int, Future]] = deque()
+                for source, first_line, batch in _batches(args.inputs, args.batch_size):
+                    pending.append((source, first_line, pool.submit(_scan_batch, batch)))
+                    if len(pending) >= args.workers * _PENDING_PER_WORKER:
+                        source, first_line, future = pending.popleft()
+                        collect(source, first_line, future.result())
+                while pending:
+                    source, first_line, future = pending.popleft()
+                    collect(source, first_line, future.result())
+    finally:
+        if verdicts is not None:
+            verdicts.close()
+    report.finish()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("inputs", nargs="+", help="JSONL request corpora or nginx access logs")
+    parser.add_argument(
+        "--rules", action="append", default=[], help="JSON file of extra rules (repeatable)"
+    )
+    parser.add_argument(
+        "--no-default-rules", action="store_true", help="scan with the --rules files only"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="worker processes (1 = inline)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="lines per worker batch")
+    parser.add_argument("--verdicts", help="write one JSON verdict per request to this file")
+    parser.add_argument(
+        "--only-flagged", action="store_true", help="only write verdicts that matched a rule"
+    )
+    parser.add_argument("--report", help="also write the summary report as JSON to this file")
+    args = parser.parse_args()
+
+    report = scan(args)
+    report.write(sys.stdout)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump(report.as_dict(), fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 """Seed default WAF rules on first startup."""
 
-from sqlalchemy import func, select
+from sqlalchemy import exists, func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.database import STARTUP_LOCK_KEY
 from app.models.models import WafRule
 
+# Injection payloads can arrive in any part of the request, including the
+# inspected headers (User-Agent, Referer, …) and cookies.
+_EVERYWHERE = ["path", "query", "body", "headers", "cookies"]
+
 # These rules cover the most common web attack vectors.
-# Each pattern is matched case-insensitively against: method + path + query + body.
+# Each pattern is matched case-insensitively against the request parts named
+# in its targets (see app/targets.py), after the rule's normalization
+# transforms (see app/normalize.py) — so the patterns only need to describe
+# decoded payloads.
 _DEFAULT_RULES: list[dict] = [
     # ── SQL Injection ─────────────────────────────────────────────────────────
     {
@@ -15,6 +23,8 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"union\s+(all\s+)?select",
         "score": 60,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "remove_comments", "compress_whitespace"],
+        "targets": _EVERYWHERE,
     },
     {
         "name": "SQLi – Tautology (OR 1=1)",
@@ -22,13 +32,18 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"\b(or|and)\b\s+[\w'\"]+\s*=\s*[\w'\"]+",
         "score": 40,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "remove_comments", "compress_whitespace"],
+        "targets": _EVERYWHERE,
     },
     {
         "name": "SQLi – Inline Comment",
         "type": "SQLi",
         "pattern": r"(--|#|/\*|\*/)",
+        # Too weak to block on its own, but tips tautologies etc. over.
         "score": 20,
-        "action": "log",
+        "action": "block",
+        "transforms": ["url_decode", "html_decode"],
+        "targets": ["query", "body"],
     },
     {
         "name": "SQLi – Stacked Queries",
@@ -36,6 +51,8 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r";\s*(select|insert|update|delete|drop|exec)",
         "score": 60,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "remove_comments", "compress_whitespace"],
+        "targets": _EVERYWHERE,
     },
     # ── Cross-Site Scripting ──────────────────────────────────────────────────
     {
@@ -44,6 +61,8 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"<\s*script[^>]*>",
         "score": 60,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "escape_decode"],
+        "targets": _EVERYWHERE,
     },
     {
         "name": "XSS – Inline Event Handler",
@@ -51,6 +70,8 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"\bon(load|error|click|mouseover|focus|blur|submit|keydown|keyup)\s*=",
         "score": 50,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "escape_decode"],
+        "targets": _EVERYWHERE,
     },
     {
         "name": "XSS – javascript: Protocol",
@@ -58,14 +79,18 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"javascript\s*:",
         "score": 50,
         "action": "block",
+        "transforms": ["url_decode", "html_decode", "escape_decode"],
+        "targets": _EVERYWHERE,
     },
     # ── Path Traversal ────────────────────────────────────────────────────────
     {
         "name": "Path Traversal – Dot-Dot Slash",
         "type": "PathTraversal",
-        "pattern": r"(\.\./|\.\.\\|%2e%2e%2f|%2e%2e%5c|\.\.%2f|\.\.%5c)",
+        "pattern": r"(\.\./|\.\.\\)",
         "score": 50,
         "action": "block",
+        "transforms": ["url_decode"],
+        "targets": ["path", "query", "body", "cookies"],
     },
     {
         "name": "Path Traversal – Sensitive Files",
@@ -73,6 +98,8 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"(etc/passwd|etc/shadow|proc/self|win\.ini|system32)",
         "score": 70,
         "action": "block",
+        "transforms": ["url_decode"],
+        "targets": ["path", "query", "body", "cookies"],
     },
     # ── Command Injection ─────────────────────────────────────────────────────
     {
@@ -81,13 +108,18 @@ _DEFAULT_RULES: list[dict] = [
         "pattern": r"[;&|`$]\s*(ls|cat|id|whoami|uname|curl|wget|bash|sh|cmd|powershell)",
         "score": 70,
         "action": "block",
+        "transforms": ["url_decode"],
+        "targets": ["path", "query", "body", "cookies"],
     },
     {
         "name": "CmdInjection – Subshell",
         "type": "CmdInjection",
-        "pattern": r"(\$\(|\`)[^)]*[)|\`]",
+        # Bounded, so a long run of "$(" can't make it backtrack quadratically.
+        "pattern": r"\$\([^)]{0,100}\)|`[^`]{0,100}`",
         "score": 60,
         "action": "block",
+        "transforms": ["url_decode"],
+        "targets": ["path", "query", "body", "cookies"],
     },
     # ── SSRF ──────────────────────────────────────────────────────────────────
     {
@@ -99,12 +131,19 @@ _DEFAULT_RULES: list[dict] = [
         ),
         "score": 40,
         "action": "log",
+        "transforms": ["url_decode"],
+        "targets": ["query", "body"],
     },
 ]
 
 
 async def seed_default_rules(db: AsyncSession) -> None:
     """Insert default rules if the waf_rules table is empty."""
+    # Once rules exist, workers return without queueing on the startup lock.
+    if await db.scalar(select(exists().select_from(WafRule))):
+        return
+    # Held until commit, so concurrently starting workers seed only once.
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_LOCK_KEY})
     count = (await db.execute(select(func.count()).select_from(WafRule))).scalar() or 0
     if count > 0:
         return
@@ -117,6 +156,8 @@ async def seed_default_rules(db: AsyncSession) -> None:
                 pattern=r["pattern"],
                 score=r["score"],
                 action=r["action"],
+                transforms=r["transforms"],
+                targets=r["targets"],
                 enabled=True,
             )
         )
@@ -0,0 +1,300 @@
+"""Pre-aggregated dashboard statistics kept in Redis.
+
+Counting attack logs with ``COUNT(*)`` / ``GROUP BY`` on every dashboard
+refresh gets slower as the table grows. Instead the log writer hands every
+persisted batch to ``StatsCounters.record()``, which folds it into a few small
+Redis structures with one atomic Lua call:
+
+* ``stats:totals``  — hash: ``total`` and ``action:{action}`` counters.
+* ``stats:threats`` — hash: threat type -> count.
+* ``stats:hourly``  — hash: ``YYYYMMDDHH`` (UTC) -> count; hours older than
+  STATS_HOURLY_RETENTION_HOURS are pruned as new ones are written.
+* ``stats:top_ips`` — sorted set holding a Space-Saving heavy-hitters sketch
+  of at most STATS_TOP_IPS_CAPACITY addresses. Any IP seen more often than
+  total / capacity times is guaranteed to be in it; counts of IPs that
+  evicted another one may be overestimated by the evicted count.
+
+``/api/stats`` reads these in constant time. ``stats:ready`` marks counters
+that were built from Postgres; record() never writes it, so when it is
+missing (first start on an existing database, or Redis lost its data) a
+background task rebuilds the counters from Postgres — never a dashboard
+request, which meanwhile sees whatever has been recorded so far.
+
+The rebuild aggregates one REPEATABLE READ snapshot of attack_logs into
+temporary keys. While it runs, record() also queues every batch's delta,
+tagged with one of the batch's row ids; as a batch is committed in a single
+transaction, that id tells whether the snapshot already counts the whole
+batch or none of it. Queued batches the snapshot doesn't see are folded into
+the temporary keys, which then replace the live ones atomically, so no batch
+is lost or counted twice however long the aggregates take.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+import redis.asyncio as aioredis
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.serialization import dumps, loads
+from app.models.models import AttackLog
+
+logger = logging.getLogger(__name__)
+
+TOTALS_KEY = "stats:totals"
+THREATS_KEY = "stats:threats"
+HOURLY_KEY = "stats:hourly"
+TOP_IPS_KEY = "stats:top_ips"
+READY_KEY = "stats:ready"
+_LIVE_KEYS = [TOTALS_KEY, THREATS_KEY, HOURLY_KEY, TOP_IPS_KEY]
+# Held while a rebuild runs; record() queues its batches while it exists.
+_BACKFILL_LOCK_KEY = "stats:backfill"
+_PENDING_KEY = "stats:backfill:pending"
+_REBUILD_KEYS = [f"{key}:rebuild" for key in _LIVE_KEYS]
+_BACKFILL_LOCK_SECONDS = 600
+# How often each worker checks that the counters are in place.
+_CHECK_INTERVAL_SECONDS = 60.0
+
+_HOUR_FORMAT = "%Y%m%d%H"
+
+# KEYS: totals hash, threats hash, hourly hash, top-IP sorted set, rebuild
+# lock, rebuild queue. ARGV[1] JSON delta {totals, threats, hours, ips},
+# ARGV[2] top-IP capacity, ARGV[3] oldest hour bucket to keep, ARGV[4] the id
+# of a row in the batch ("" = never queue it).
+_RECORD_LUA = """
+local delta = cjson.decode(ARGV[1])
+local capacity = tonumber(ARGV[2])
+
+if ARGV[4] ~= '' and redis.call('EXISTS', KEYS[5]) == 1 then
+  redis.call('RPUSH', KEYS[6], cjson.encode({ARGV[4], ARGV[1]}))
+  redis.call('EXPIRE', KEYS[6], redis.call('TTL', KEYS[5]))
+end
+
+for field, n in pairs(delta.totals) do redis.call('HINCRBY', KEYS[1], field, n) end
+for name, n in pairs(delta.threats) do redis.call('HINCRBY', KEYS[2], name, n) end
+for hour, n in pairs(delta.hours) do redis.call('HINCRBY', KEYS[3], hour, n) end
+
+for _, hour in ipairs(redis.call('HKEYS', KEYS[3])) do
+  if hour < ARGV[3] then redis.call('HDEL', KEYS[3], hour) end
+end
+
+-- Space-Saving: a new IP in a full sketch replaces the current minimum and
+-- inherits its count.
+for ip, n in pairs(delta.ips) do
+  if redis.call('ZSCORE', KEYS[4], ip) then
+    redis.call('ZINCRBY', KEYS[4], n, ip)
+  elseif redis.call('ZCARD', KEYS[4]) < capacity then
+    redis.call('ZADD', KEYS[4], n, ip)
+  else
+    local evicted = redis.call('ZPOPMIN', KEYS[4])
+    redis.call('ZADD', KEYS[4], tonumber(evicted[2]) + n, ip)
+  end
+end
+return 1
+"""
+
+# KEYS[1] rebuild lock, KEYS[2] rebuild queue. ARGV[1] lock TTL.
+_BEGIN_REBUILD_LUA = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+  redis.call('DEL', KEYS[2])
+  return 1
+end
+return 0
+"""
+
+# KEYS: rebuild lock, rebuild queue, ready marker, the 4 rebuilt keys, the 4
+# live keys. ARGV[1] queued batches already folded in. Swaps the rebuilt
+# counters in, unless more batches were queued meanwhile (returns 0).
+_FINISH_REBUILD_LUA = """
+if redis.call('LLEN', KEYS[2]) ~= tonumber(ARGV[1]) then return 0 end
+for i = 4, 7 do
+  if redis.call('EXISTS', KEYS[i]) == 1 then
+    redis.call('RENAME', KEYS[i], KEYS[i + 4])
+  else
+    redis.call('DEL', KEYS[i + 4])
+  end
+end
+redis.call('SET', KEYS[3], '1')
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+"""
+
+
+class StatsCounters:
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        top_ips_capacity: int = settings.STATS_TOP_IPS_CAPACITY,
+        hourly_retention_hours: int = settings.STATS_HOURLY_RETENTION_HOURS,
+    ) -> None:
+        self._redis = redis
+        self.top_ips_capacity = top_ips_capacity
+        self.hourly_retention_hours = hourly_retention_hours
+        self._script = redis.register_script(_RECORD_LUA)
+        self._begin_rebuild = redis.register_script(_BEGIN_REBUILD_LUA)
+        self._finish_rebuild = redis.register_script(_FINISH_REBUILD_LUA)
+
+    def _oldest_hour(self) -> str:
+        cutoff = datetime.utcnow() - timedelta(hours=self.hourly_retention_hours)
+        return cutoff.strftime(_HOUR_FORMAT)
+
+    # ── Write side (log writer flush) ────────────────────────────────────────
+
+    async def record(self, rows: list[dict]) -> None:
+        """Fold a batch of persisted AttackLog rows into the counters.
+
+        `rows` must be the rows of one committed transaction (a log writer
+        batch), so that a rebuild can tell by one id whether it saw them.
+        """
+        if not rows:
+            return
+        try:
+            await self._fold(self._delta(rows), _LIVE_KEYS, rows[0]["id"])
+        except aioredis.RedisError:
+            logger.warning("Could not update stats counters for %d log rows", len(rows))
+
+    @staticmethod
+    def _delta(rows: list[dict]) -> str:
+        actions: Counter[str] = Counter()
+        threats: Counter[str] = Counter()
+        hours: Counter[str] = Counter()
+        ips: Counter[str] = Counter()
+        for row in rows:
+            actions[f"action:{row['action_taken']}"] += 1
+            threats.update(row["threat_types"] or ())
+            # created_at is in UTC (see app/log_writer.py), as are the buckets.
+            hours[row["created_at"].strftime(_HOUR_FORMAT)] += 1
+            ips[row["ip_address"]] += 1
+        actions["total"] = len(rows)
+
+        return dumps({"totals": actions, "threats": threats, "hours": hours, "ips": ips})
+
+    async def _fold(self, delta: str, keys: list[str], row_id: str = "") -> None:
+        await self._script(
+            keys=[*keys, _BACKFILL_LOCK_KEY, _PENDING_KEY],
+            args=[delta, self.top_ips_capacity, self._oldest_hour(), row_id],
+        )
+
+    # ── Read side (/api/stats) ───────────────────────────────────────────────
+
+    async def snapshot(self, top_n: int = 5, hours: int = 24) -> dict:
+        """Dashboard statistics; a handful of Redis reads regardless of table size."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(TOTALS_KEY)
+            pipe.hgetall(THREATS_KEY)
+            pipe.hgetall(HOURLY_KEY)
+            pipe.zrevrange(TOP_IPS_KEY, 0, top_n - 1, withscores=True)
+            totals, threats, hourly, top_ips = await pipe.execute()
+
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        buckets = [now - timedelta(hours=offset) for offset in range(hours, -1, -1)]
+        requests_over_time = [
+            {"hour": bucket.strftime("%H:%M"), "count": int(hourly[key])}
+            for bucket in buckets
+            if (key := bucket.strftime(_HOUR_FORMAT)) in hourly
+        ]
+
+        return {
+            "total_requests": int(totals.get("total", 0)),
+            "blocked_requests": int(totals.get("action:block", 0)),
+            "allowed_requests": int(totals.get("action:allow", 0)),
+            "top_ips": [{"ip": ip, "count": int(count)} for ip, count in top_ips],
+            "threat_distribution": [
+                {"type": name, "count": int(count)} for name, count in threats.items()
+            ],
+            "requests_over_time": requests_over_time,
+        }
+
+    # ── Rebuild from Postgres ────────────────────────────────────────────────
+
+    async def maintain(self) -> None:
+        """Background task: rebuild the counters whenever they go missing."""
+        while True:
+            try:
+                await self.backfill()
+            except Exception:
+                logger.exception("Stats rebuild failed; retrying later")
+            await asyncio.sleep(_CHECK_INTERVAL_SECONDS)
+
+    async def backfill(self) -> bool:
+        """Rebuild the counters from attack_logs unless they were built already.
+
+        Runs the expensive aggregate queries once, on the primary (a replica
+        snapshot could miss batches committed before the rebuild started); a
+        Redis lock keeps several workers from doing it at the same time.
+        Returns True if this call rebuilt the counters.
+        """
+        redis = self._redis
+        if await redis.exists(READY_KEY):
+            return False
+        if not await self._begin_rebuild(
+            keys=[_BACKFILL_LOCK_KEY, _PENDING_KEY], args=[_BACKFILL_LOCK_SECONDS]
+        ):
+            return False
+        try:
+            logger.info("Rebuilding stats counters from attack_logs")
+            async with AsyncSessionLocal() as db:
+                # Every query below reads the same snapshot.
+                await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+                await self._aggregate(db)
+                folded = 0
+                while True:
+                    entries = await redis.lrange(_PENDING_KEY, folded, -1)
+                    if entries:
+                        await self._fold_unseen(db, [loads(entry) for entry in entries])
+                        folded += len(entries)
+                    elif await self._finish_rebuild(
+                        keys=[_BACKFILL_LOCK_KEY, _PENDING_KEY, READY_KEY,
+                              *_REBUILD_KEYS, *_LIVE_KEYS],
+                        args=[folded],
+                    ):
+                        return True
+        finally:
+            # No-ops after a successful swap.
+            await redis.delete(_BACKFILL_LOCK_KEY, _PENDING_KEY, *_REBUILD_KEYS)
+
+    async def _aggregate(self, db: AsyncSession) -> None:
+        """Write the snapshot's aggregates to the rebuild keys."""
+        hour = func.date_trunc("hour", func.timezone("UTC", AttackLog.created_at))
+        threat = func.unnest(AttackLog.threat_types)
+        since = datetime.utcnow() - timedelta(hours=self.hourly_retention_hours)
+
+        actions = await db.execute(
+            select(AttackLog.action_taken, func.count()).group_by(AttackLog.action_taken)
+        )
+        threats = await db.execute(select(threat, func.count()).group_by(threat))
+        hourly = await db.execute(
+            select(hour, func.count()).where(AttackLog.created_at >= since).group_by(hour)
+        )
+        top_ips = await db.execute(
+            select(AttackLog.ip_address, func.count().label("count"))
+            .group_by(AttackLog.ip_address)
+            .order_by(desc("count"))
+            .limit(self.top_ips_capacity)
+        )
+
+        totals = {f"action:{action}": count for action, count in actions}
+        totals["total"] = sum(totals.values())
+        totals_key, threats_key, hourly_key, top_ips_key = _REBUILD_KEYS
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*_REBUILD_KEYS)
+            pipe.hset(totals_key, mapping=totals)
+            if threat_counts := dict(threats.all()):
+                pipe.hset(threats_key, mapping=threat_counts)
+            if hour_counts := {h.strftime(_HOUR_FORMAT): n for h, n in hourly}:
+                pipe.hset(hourly_key, mapping=hour_counts)
+            if ip_counts := dict(top_ips.all()):
+                pipe.zadd(top_ips_key, ip_counts)
+            await pipe.execute()
+
+    async def _fold_unseen(self, db: AsyncSession, entries: list[list[str]]) -> None:
+        """Fold queued batches into the rebuild keys, unless the snapshot has them."""
+        ids = [row_id for row_id, _ in entries]
+        seen = set((await db.execute(select(AttackLog.id).where(AttackLog.id.in_(ids)))).scalars())
+        for row_id, delta in entries:
+            if row_id not in seen:
+                await self._fold(delta, _REBUILD_KEYS)
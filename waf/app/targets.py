@@ -0,0 +1,120 @@
+"""Request parsing into inspection targets.
+
+A rule only scans the parts of the request named in its ``targets`` column:
+
+- ``path``     the URL path
+- ``query``    each query-string parameter name and value
+- ``body``     each form or JSON field name and value; the raw body when it
+               is neither, doesn't parse, or was cut off by the inspection
+               window
+- ``headers``  the values of the headers listed in INSPECTION_HEADERS
+- ``cookies``  each cookie value
+
+Values are taken verbatim (percent-encoding, entities, … are left to each
+rule's transforms). The fields of one target are joined into a single
+newline-separated text, so a target costs one scan per request however many
+fields it has.
+"""
+
+from typing import Mapping
+
+from app.core.config import settings
+from app.core.serialization import loads
+
+TARGETS = frozenset({"path", "query", "body", "headers", "cookies"})
+
+# What rules without explicit targets scan — the request line and body, as
+# before targets existed.
+DEFAULT_TARGETS = ("path", "query", "body")
+
+_INSPECTED_HEADERS = frozenset(
+    name.strip().lower() for name in settings.INSPECTION_HEADERS.split(",") if name.strip()
+)
+
+
+def _pairs(text: str, separator: str) -> list[str]:
+    """Names and values of `name=value` pairs, in order."""
+    fields: list[str] = []
+    for pair in text.split(separator):
+        name, _, value = pair.partition("=")
+        if name:
+            fields.append(name)
+        if value:
+            fields.append(value)
+    return fields
+
+
+def _cookie_values(header: str) -> list[str]:
+    values = []
+    for pair in header.split(";"):
+        value = pair.partition("=")[2].strip()
+        if value:
+            values.append(value)
+    return values
+
+
+def _json_fields(document: object) -> list[str]:
+    """Every object key and string value in a parsed JSON document."""
+    fields: list[str] = []
+    stack = [document]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            fields.append(item)
+        elif isinstance(item, dict):
+            fields.extend(item)
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return fields
+
+
+def request_targets(
+    path: str, query: str, headers: Mapping[str, str] | None = None
+) -> dict[str, str]:
+    """Texts of every target except the body, omitting empty ones."""
+    targets = {"path": path}
+    if query:
+        targets["query"] = "\n".join(_pairs(query, "&"))
+    if headers:
+        values: list[str] = []
+        cookies: list[str] = []
+        for name, value in headers.items():
+            name = name.lower()
+            if name == "cookie":
+                cookies.extend(_cookie_values(value))
+            elif name in _INSPECTED_HEADERS:
+                values.append(value)
+        if values:
+            targets["headers"] = "\n".join(values)
+        if cookies:
+            targets["cookies"] = "\n".join(cookies)
+    return targets
+
+
+def _media_type(content_type: str | None) -> str:
+    return (content_type or "").partition(";")[0].strip().lower()
+
+
+def is_structured(content_type: str | None) -> bool:
+    """Whether a body of this type is inspected field by field."""
+    media_type = _media_type(content_type)
+    return (
+        media_type in ("application/x-www-form-urlencoded", "application/json")
+        or media_type.endswith("+json")
+    )
+
+
+def body_target(body: str, content_type: str | None, complete: bool = True) -> str:
+    """Text of the body target: its fields when the body is a complete form
+    or JSON document, otherwise the body itself."""
+    if not complete or not is_structured(content_type):
+        return body
+    if _media_type(content_type) == "application/x-www-form-urlencoded":
+        return "\n".join(_pairs(body, "&"))
+    try:
+        document = loads(body)
+    except ValueError:
+        # Malformed JSON is inspected as is rather than let through.
+        return body
+    return "\n".join(_json_fields(document))
@@ -0,0 +1,116 @@
+"""Backend upstreams: the shared connection pool, load balancing and health.
+
+Allowed requests are forwarded over one ``httpx.AsyncClient`` per worker
+whose pool limits, keep-alive and timeouts come from the UPSTREAM_* settings,
+so connections to the backends are reused instead of re-established under
+load. HTTP/2 (UPSTREAM_HTTP2) multiplexes requests over a few connections
+per backend; it needs the optional ``h2`` package.
+
+BACKEND_URLS lists the backends to balance across (round robin), falling back
+to BACKEND_URL. With more than one, each is probed at UPSTREAM_HEALTH_PATH
+every UPSTREAM_HEALTH_INTERVAL_SECONDS, and a backend that refuses a
+connection is taken out of rotation right away until a probe succeeds again.
+When no backend is healthy, requests are still spread over all of them rather
+than refused outright.
+"""
+
+import asyncio
+import itertools
+import logging
+
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # optional dependency
+    h2 = None
+
+logger = logging.getLogger(__name__)
+
+# Failures where the request never reached the backend, so it can safely be
+# sent to another one.
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def create_client() -> httpx.AsyncClient:
+    """The shared client used to forward requests to the backends."""
+    http2 = settings.UPSTREAM_HTTP2
+    if http2 and h2 is None:
+        logger.warning("UPSTREAM_HTTP2=true but h2 is not installed; using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+            read=settings.UPSTREAM_READ_TIMEOUT_SECONDS,
+            write=settings.UPSTREAM_WRITE_TIMEOUT_SECONDS,
+            pool=settings.UPSTREAM_POOL_TIMEOUT_SECONDS,
+        ),
+        # Redirects are the client's to follow; the proxy relays them as is.
+        follow_redirects=False,
+    )
+
+
+class Upstream:
+    __slots__ = ("url", "healthy")
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+        self.healthy = True
+
+
+class UpstreamPool:
+    def __init__(self, urls: list[str]) -> None:
+        self.upstreams = [Upstream(url) for url in urls]
+        self._turn = itertools.count()
+
+    def pick(self) -> Upstream:
+        """The next backend in round-robin order, skipping unhealthy ones."""
+        candidates = [upstream for upstream in self.upstreams if upstream.healthy]
+        if not candidates:
+            candidates = self.upstreams
+        return candidates[next(self._turn) % len(candidates)]
+
+    def mark_down(self, upstream: Upstream) -> None:
+        if upstream.healthy and len(self.upstreams) > 1:
+            logger.warning("Upstream %s unreachable; out of rotation", upstream.url)
+            upstream.healthy = False
+
+    async def _probe(self, client: httpx.AsyncClient, upstream: Upstream) -> None:
+        try:
+            response = await client.get(
+                upstream.url + settings.UPSTREAM_HEALTH_PATH,
+                timeout=settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+            )
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != upstream.healthy:
+            logger.warning(
+                "Upstream %s %s", upstream.url, "healthy again" if healthy else "unhealthy"
+            )
+            upstream.healthy = healthy
+
+    async def run_health_checks(self, client: httpx.AsyncClient) -> None:
+        """Probe every backend periodically; runs until cancelled."""
+        interval = settings.UPSTREAM_HEALTH_INTERVAL_SECONDS
+        if interval <= 0 or len(self.upstreams) < 2:
+            return
+        while True:
+            await asyncio.gather(*(self._probe(client, upstream) for upstream in self.upstreams))
+            await asyncio.sleep(interval)
+
+
+def _configured_urls() -> list[str]:
+    urls = [url.strip() for url in settings.BACKEND_URLS.split(",") if url.strip()]
+    return urls or [settings.BACKEND_URL]
+
+
+upstreams = UpstreamPool(_configured_urls())
@@ -0,0 +1,95 @@
+"""Per-worker cache of inspection verdicts for repeated identical requests.
+
+Health checks, crawlers and floods send the same request over and over, and
+each repeat used to run the whole rule set again. inspect_request() keys its
+verdicts by a digest of what it inspects — the request targets
+(app/targets.py), the body and its content type — so a repeat costs one hash
+and a dict lookup. The digest is SHA-256, which CPUs with SHA extensions
+compute faster than BLAKE2.
+
+Entries are evicted least-recently-used beyond VERDICT_CACHE_SIZE and expire
+after VERDICT_CACHE_TTL_SECONDS. The cache is emptied whenever the rule set
+version changes, so a verdict never outlives the rules that produced it.
+Verdicts cut short by the inspection budget are not cached, and bodies over
+VERDICT_CACHE_MAX_BODY_BYTES are never looked up: hashing is cheap, but a
+large body is rarely sent twice.
+"""
+
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Mapping
+
+from app.core.config import settings
+
+Verdict = tuple[int, list[str], str]
+
+
+class VerdictCache:
+    def __init__(self, max_size: int, ttl: float, max_body_bytes: int) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_body_bytes = max_body_bytes
+        # key -> (score, threat types, action, monotonic deadline)
+        self._entries: OrderedDict[bytes, tuple[int, tuple[str, ...], str, float]] = (
+            OrderedDict()
+        )
+        # Rule set version the cached verdicts were computed with.
+        self._version = -1
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def covers(self, body_size: int) -> bool:
+        """Whether a request with a body this large can be answered from cache."""
+        return self.max_size > 0 and body_size <= self.max_body_bytes
+
+    def key(
+        self,
+        targets: Mapping[str, str],
+        body: str | None,
+        content_type: str | None,
+        *flags: object,
+    ) -> bytes:
+        """Digest of the inspected texts; `flags` are inspection options that
+        change the verdict (e.g. short-circuit)."""
+        digest = sha256()
+        for name, text in targets.items():
+            # Length-prefixed, so no two different inputs run together alike.
+            digest.update(f"{name}:{len(text)}:".encode())
+            digest.update(text.encode("utf-8", "surrogatepass"))
+        if body:
+            digest.update(f"body:{content_type}:{len(body)}:".encode())
+            digest.update(body.encode("utf-8", "surrogatepass"))
+        digest.update(repr(flags).encode())
+        return digest.digest()
+
+    def get(self, key: bytes, version: int) -> Verdict | None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        entry = self._entries.get(key)
+        if entry is None or entry[3] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], list(entry[1]), entry[2]
+
+    def put(self, key: bytes, version: int, verdict: Verdict) -> None:
+        if version != self._version:
+            return
+        score, threat_types, action = verdict
+        self._entries[key] = (score, tuple(threat_types), action, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+verdict_cache = VerdictCache(
+    max_size=settings.VERDICT_CACHE_SIZE,
+    ttl=settings.VERDICT_CACHE_TTL_SECONDS,
+    max_body_bytes=settings.VERDICT_CACHE_MAX_BODY_BYTES,
+)
@@ -0,0 +1,93 @@
+"""Micro-benchmark for inspect_request across rule counts and body sizes.
+
+Run from the waf/ directory:
+
+    python -m benchmarks.bench_inspect --rules 13 100 300 1000 --sizes 0 1024 16384 262144
+
+The seeded rules are always included; larger rule counts are padded with
+deterministic synthetic rules shaped like real signatures (a keyword plus
+some regex structure), so the matcher's prefilter sees realistic literals.
+Bodies are benign JSON-ish text, i.e. the common case of clean traffic.
+The verdict cache is disabled, since every call repeats the same request:
+the figures are the cost of matching, not of a cache hit.
+"""
+
+import argparse
+import random
+import string
+import time
+from types import SimpleNamespace
+
+from app.engine import inspect_request
+from app.ruleset import compile_rules, rule_store
+from app.seed import _DEFAULT_RULES
+from app.verdict_cache import verdict_cache
+
+_WORDS = ["user", "name", "value", "items", "order", "price", "title", "lorem", "ipsum", "data"]
+
+_TEMPLATES = [
+    r"\b{w}\s*\(",
+    r"{w}\s*=\s*['\"]",
+    r"<\s*{w}[^>]*>",
+    r"\b{w}\b.{{0,20}}\b{v}\b",
+    r"/{w}/{v}",
+]
+
+
+def synthetic_rules(count: int, seed: int = 1) -> list[SimpleNamespace]:
+    rng = random.Random(seed)
+    rows = [SimpleNamespace(id=str(i), **rule) for i, rule in enumerate(_DEFAULT_RULES)]
+    while len(rows) < count:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 9)))
+        other = "".join(rng.choices(string.ascii_lowercase, k=5))
+        pattern = rng.choice(_TEMPLATES).format(w=word, v=other)
+        rows.append(
+            SimpleNamespace(
+                id=str(len(rows)), name=f"Synthetic {len(rows)}", type="Synthetic",
+                pattern=pattern, score=10, action="block", transforms=None, targets=None,
+            )
+        )
+    return rows
+
+
+def benign_body(size: int, seed: int = 2) -> str:
+    rng = random.Random(seed)
+    parts: list[str] = []
+    length = 0
+    while length < size:
+        part = f'"{rng.choice(_WORDS)}": "{rng.choice(_WORDS)} {rng.randint(0, 9999)}", '
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def measure(body: str, min_seconds: float) -> float:
+    """Mean seconds per inspect_request call."""
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        inspect_request("/api/data", "page=1", body or None)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[13, 100, 300, 1000])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1024, 16384, 262144])
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="time per cell")
+    args = parser.parse_args()
+
+    verdict_cache.max_size = 0
+    bodies = {size: benign_body(size) for size in args.sizes}
+    print(f"{'rules':>6}" + "".join(f"{f'{size}B':>14}" for size in args.sizes) + "   (ms/request)")
+    for count in args.rules:
+        rule_store._current = compile_rules(synthetic_rules(count), count)
+        cells = [measure(bodies[size], args.min_seconds) * 1000 for size in args.sizes]
+        print(f"{count:>6}" + "".join(f"{cell:>14.3f}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Replay a JSONL request corpus through the WAF proxy, in-process.
+
+Run from the waf/ directory:
+
+    python -m benchmarks.bench_proxy benchmarks/corpus/sample.jsonl \\
+        --requests 5000 --concurrency 32
+
+Each corpus line is one request object with the keys ``method``, ``path``,
+``query``, ``headers``, ``body`` and ``ip`` (everything but ``path`` is
+optional). Requests go through the real ``reverse_proxy`` over an ASGI
+transport; allowed ones are forwarded, also over ASGI, to the dummy backend
+in backend/app/main.py. Redis and Postgres are replaced by the in-memory
+stand-ins in benchmarks/standins.py.
+
+Reports throughput and p50/p95/p99 latency end to end and for each stage of
+the proxy path: block check, inspection, logging and forwarding. The corpus
+is replayed cyclically, so after the first pass small-body requests are
+mostly verdict-cache hits (app/verdict_cache.py) and inspection figures are
+a best case; run with VERDICT_CACHE_SIZE=0 for the cost of matching.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from app import log_writer as log_writer_module
+from app import main
+from app.blocklist import block_cache
+from app.core.config import settings
+from app.log_writer import log_writer
+from app.rate_limit import RateLimiter
+from app.reputation import Reputation
+from app.ruleset import rule_store
+from app.upstream import UpstreamPool
+from app.verdict_cache import verdict_cache
+from benchmarks.standins import StandInRedis, StandInSession, default_rule_set
+
+BACKEND_MAIN = Path(__file__).resolve().parents[2] / "backend" / "app" / "main.py"
+
+STAGES = ("block_check", "inspection", "logging", "forwarding")
+
+
+class StageTimer:
+    """Collects wall-clock samples for named stages of the proxy path."""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - started)
+
+        return timed
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def load_backend_app():
+    spec = importlib.util.spec_from_file_location("dummy_backend", BACKEND_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def load_corpus(paths: list[str]) -> list[dict]:
+    corpus: list[dict] = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            corpus.extend(json.loads(line) for line in fh if line.strip())
+    if not corpus:
+        raise SystemExit("corpus is empty")
+    return corpus
+
+
+def print_report(timer: StageTimer, statuses: dict[int, int], total: int, elapsed: float) -> None:
+    print(f"requests     {total}")
+    print(f"elapsed      {elapsed:.2f}s")
+    print(f"throughput   {total / elapsed:,.0f} req/s")
+    print("statuses     " + ", ".join(f"{code}: {n}" for code, n in sorted(statuses.items())))
+    print()
+    print(f"{'stage':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage in ("request", *STAGES):
+        ordered = sorted(timer.samples.get(stage, []))
+        print(
+            f"{stage:<14}{len(ordered):>8}"
+            + "".join(
+                f"{percentile(ordered, q) * 1000:>10.3f}" for q in (0.50, 0.95, 0.99, 1.0)
+            )
+        )
+
+
+async def run(args: argparse.Namespace) -> None:
+    corpus = load_corpus(args.corpus)
+
+    # ── Stand-ins for Redis and Postgres ─────────────────────────────────────
+    redis = StandInRedis()
+    session = StandInSession()
+    log_writer_module.AsyncSessionLocal = session
+    rule_store._current = default_rule_set()
+    settings.PROXY_STREAMING = args.mode == "streaming"
+    main.upstreams = UpstreamPool(["http://backend"])
+
+    waf = main.app
+    waf.state.redis = redis
+    waf.state.rate_limiter = RateLimiter(redis)
+    waf.state.reputation = Reputation(redis)
+    waf.state.http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=load_backend_app()), base_url="http://backend"
+    )
+
+    # ── Stage instrumentation ────────────────────────────────────────────────
+    timer = StageTimer()
+    block_cache.is_blocked = timer.wrap("block_check", block_cache.is_blocked)
+    if settings.PROXY_STREAMING:
+        main._read_and_inspect = timer.wrap("inspection", main._read_and_inspect)
+    else:
+        main.inspection_pool.inspect = timer.wrap("inspection", main.inspection_pool.inspect)
+    main._write_log = timer.wrap("logging", main._write_log)
+    waf.state.http_client.send = timer.wrap("forwarding", waf.state.http_client.send)
+
+    log_writer.start()
+    statuses: dict[int, int] = defaultdict(int)
+    requests = itertools.islice(itertools.cycle(enumerate(corpus)), args.requests)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=waf), base_url="http://waf"
+    ) as client:
+
+        async def worker() -> None:
+            for index, item in requests:
+                headers = dict(item.get("headers") or {})
+                headers["X-Real-IP"] = item.get("ip") or f"198.51.100.{index % args.ips}"
+                started = time.perf_counter()
+                resp = await client.request(
+                    item.get("method", "GET"),
+                    item["path"],
+                    params=item.get("query") or None,
+                    headers=headers,
+                    content=(item.get("body") or "").encode(),
+                )
+                timer.samples["request"].append(time.perf_counter() - started)
+                statuses[resp.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await log_writer.stop()
+    await waf.state.http_client.aclose()
+
+    print_report(timer, statuses, args.requests, elapsed)
+    print()
+    print(f"log rows     {session.rows_written} written, {log_writer.dropped} dropped")
+    lookups = verdict_cache.hits + verdict_cache.misses
+    print(f"verdicts     {verdict_cache.hits} of {lookups} cache lookups hit")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus", nargs="+", help="JSONL request corpus file(s)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--ips", type=int, default=250, help="distinct client IPs to cycle")
+    parser.add_argument("--mode", choices=("streaming", "buffered"), default="streaming")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,74 @@
+"""Local stand-ins for Redis and Postgres used by the benchmarks.
+
+They implement just the calls the proxy path makes, with no network I/O, so
+the numbers reflect the WAF's own overhead rather than a particular database
+deployment.
+"""
+
+from types import SimpleNamespace
+
+from app.ruleset import compile_rules
+from app.seed import _DEFAULT_RULES
+
+
+class StandInRedis:
+    """In-memory replacement for the redis.asyncio client."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    async def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    async def pttl(self, key: str) -> int:
+        return -1 if key in self.data else -2
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def publish(self, channel: str, message: str) -> int:
+        return 0
+
+    async def ping(self) -> bool:
+        return True
+
+    def register_script(self, script: str):
+        # Rate limiter script: never over the limit; reputation: never blocks.
+        result = [0, "0"] if "half_life" in script else 0
+
+        async def run(keys=(), args=()):
+            return result
+
+        return run
+
+    async def aclose(self) -> None:
+        pass
+
+
+class StandInSession:
+    """AsyncSessionLocal replacement that accepts writes and discards them."""
+
+    def __init__(self) -> None:
+        self.rows_written = 0
+
+    def __call__(self) -> "StandInSession":
+        return self
+
+    async def __aenter__(self) -> "StandInSession":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def execute(self, statement, params=None):
+        if isinstance(params, list):
+            self.rows_written += len(params)
+
+    async def commit(self) -> None:
+        pass
+
+
+def default_rule_set(version: int = 1):
+    """The seeded rule corpus, compiled without touching the database."""
+    rows = [SimpleNamespace(id=str(i), **rule) for i, rule in enumerate(_DEFAULT_RULES)]
+    return compile_rules(rows, version)
@@ -0,0 +1,12 @@
+"""Shared fixtures. Run from the waf/ directory: ``python -m pytest``."""
+
+import pytest
+
+from app.ruleset import RuleSet
+from app.scan import load_rule_set
+
+
+@pytest.fixture(scope="session")
+def seeded_rules() -> RuleSet:
+    """The default rules, compiled and vetted as at startup."""
+    return load_rule_set([])
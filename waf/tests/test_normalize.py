@@ -0,0 +1,49 @@
+from app.normalize import (
+    Views,
+    compress_whitespace,
+    escape_decode,
+    html_decode,
+    remove_comments,
+    url_decode,
+)
+
+
+def test_url_decode_repeats_until_stable():
+    assert url_decode("%252e%252e%252f") == "../"
+    assert url_decode("a+b%20c") == "a b c"
+    assert url_decode("%u003cscript") == "<script"
+
+
+def test_html_decode():
+    assert html_decode("&lt;script&gt;") == "<script>"
+    assert html_decode("&#x3c;&#60;") == "<<"
+    assert html_decode("&amp;lt;") == "<"
+
+
+def test_escape_decode():
+    assert escape_decode("\\u003cscript\\x3e") == "<script>"
+
+
+def test_remove_comments():
+    assert remove_comments("union/**/select") == "union select"
+    assert remove_comments("a<!-- b -->c") == "a c"
+    # Unterminated comments are removed too.
+    assert remove_comments("union/* select") == "union "
+
+
+def test_compress_whitespace():
+    assert compress_whitespace("a  \t\n b c") == "a b c"
+
+
+def test_transforms_return_unchanged_input_as_is():
+    text = "nothing to decode"
+    for transform in (url_decode, html_decode, escape_decode, remove_comments):
+        assert transform(text) is text
+
+
+def test_views_are_chained_and_memoized():
+    views = Views("UNION%2F%2A%2A%2FSELECT")
+    chain = ("url_decode", "remove_comments", "lowercase")
+    assert views.get(chain) == "union select"
+    assert views.get(chain) is views.get(chain)
+    assert views.get(()) == "UNION%2F%2A%2A%2FSELECT"
@@ -0,0 +1,61 @@
+import math
+import time
+
+import pytest
+
+from app.prefix_table import PrefixTable, normalize_network, parse_cidr
+
+
+def test_longest_prefix_wins():
+    table = PrefixTable()
+    table.add("10.0.0.0/8", expires=time.time() + 100)
+    table.add("10.1.0.0/16")
+    assert table.lookup("10.1.2.3") == math.inf
+    assert table.lookup("10.2.0.1") == pytest.approx(time.time() + 100, abs=5)
+    assert table.lookup("11.0.0.1") is None
+
+
+def test_expired_entries_are_ignored():
+    table = PrefixTable()
+    table.add("192.0.2.0/24", expires=time.time() - 1)
+    table.add("192.0.0.0/16")
+    # The expired /24 falls through to the covering /16.
+    assert table.lookup("192.0.2.7") == math.inf
+    table.remove("192.0.0.0/16")
+    assert table.lookup("192.0.2.7") is None
+
+
+def test_ipv6_and_mapped_ipv4():
+    table = PrefixTable()
+    table.add("2001:db8::/32")
+    table.add("::ffff:203.0.113.0/120")
+    assert table.lookup("2001:db8::1") == math.inf
+    assert table.lookup("2001:db9::1") is None
+    # Stored and looked up as plain IPv4 either way.
+    assert table.lookup("203.0.113.9") == math.inf
+    assert table.lookup("::ffff:203.0.113.9") == math.inf
+
+
+def test_remove_and_len():
+    table = PrefixTable()
+    table.add("198.51.100.1")
+    assert len(table) == 1
+    assert table.remove("198.51.100.1")
+    assert not table.remove("198.51.100.1")
+    assert len(table) == 0
+    assert table.lookup("198.51.100.1") is None
+
+
+def test_invalid_addresses():
+    assert PrefixTable().lookup("not-an-ip") is None
+    with pytest.raises(ValueError):
+        parse_cidr("10.0.0.0/33")
+    with pytest.raises(ValueError):
+        parse_cidr("300.0.0.1")
+
+
+def test_normalize_network():
+    assert normalize_network("10.1.2.3/8") == "10.0.0.0/8"
+    assert normalize_network("10.1.2.3/32") == "10.1.2.3"
+    assert normalize_network("::ffff:10.0.0.1") == "10.0.0.1"
+    assert normalize_network("2001:DB8::1/128") == "2001:db8::1"
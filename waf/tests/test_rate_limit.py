@@ -0,0 +1,88 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from app import rate_limit
+from app.blocklist import block_key
+from app.rate_limit import RateLimiter
+
+_START = 60 * 1_000_000
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _clock(monkeypatch, now: list[float]) -> None:
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+
+
+def test_sliding_window_weights_the_previous_bucket(monkeypatch):
+    now = [float(_START)]
+    _clock(monkeypatch, now)
+
+    async def run() -> tuple[list[bool], list[bool]]:
+        limiter = RateLimiter(
+            fakeredis.aioredis.FakeRedis(), ip_limit=10, window_seconds=60, block_seconds=0
+        )
+        first = [await limiter.allow("10.0.0.1", "/") for _ in range(11)]
+        # Halfway through the next bucket, half of the previous one still counts.
+        now[0] = _START + 90
+        second = [await limiter.allow("10.0.0.1", "/") for _ in range(6)]
+        return first, second
+
+    first, second = _run(run())
+    assert first == [True] * 10 + [False]
+    assert second == [True] * 5 + [False]
+
+
+def test_ip_limit_sets_the_block_key(monkeypatch):
+    _clock(monkeypatch, [float(_START)])
+
+    async def run():
+        redis = fakeredis.aioredis.FakeRedis()
+        limiter = RateLimiter(redis, ip_limit=2, window_seconds=60, block_seconds=30)
+        results = [await limiter.allow("10.0.0.2", "/") for _ in range(3)]
+        return results, await redis.ttl(block_key("10.0.0.2"))
+
+    results, ttl = _run(run())
+    assert results == [True, True, False]
+    assert 0 < ttl <= 30
+
+
+def test_route_limit_blocks_only_that_route(monkeypatch):
+    now = [float(_START)]
+    _clock(monkeypatch, now)
+
+    async def run():
+        redis = fakeredis.aioredis.FakeRedis()
+        limiter = RateLimiter(
+            redis, ip_limit=100, window_seconds=60, routes="/login=2", block_seconds=300
+        )
+        login = [await limiter.allow("10.0.0.3", "/login") for _ in range(3)]
+        elsewhere = await limiter.allow("10.0.0.3", "/home")
+        # The route block outlasts the window that caused it.
+        now[0] = _START + 180
+        later = await limiter.allow("10.0.0.3", "/login/reset")
+        return login, elsewhere, later, await redis.exists(block_key("10.0.0.3"))
+
+    login, elsewhere, later, ip_blocked = _run(run())
+    assert login == [True, True, False]
+    assert elsewhere is True
+    assert later is False
+    assert not ip_blocked
+
+
+def test_every_key_shares_the_ip_hash_tag(monkeypatch):
+    _clock(monkeypatch, [float(_START)])
+
+    async def run():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        limiter = RateLimiter(redis, ip_limit=1, window_seconds=60, routes="/a=5")
+        await limiter.allow("10.0.0.4", "/a")
+        await limiter.allow("10.0.0.4", "/a")
+        return await redis.keys("*")
+
+    keys = _run(run())
+    assert keys
+    assert all("{10.0.0.4}" in key for key in keys)
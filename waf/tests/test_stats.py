@@ -0,0 +1,66 @@
+import asyncio
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import fakeredis.aioredis
+
+from app.stats import StatsCounters
+
+
+def _row(ip: str, action: str = "allow", threat_types: list[str] | None = None) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "ip_address": ip,
+        "action_taken": action,
+        "threat_types": threat_types or [],
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def test_record_and_snapshot():
+    async def run() -> dict:
+        stats = StatsCounters(fakeredis.aioredis.FakeRedis(decode_responses=True))
+        await stats.record([_row("10.0.0.1", "block", ["SQLi", "XSS"]), _row("10.0.0.2")])
+        await stats.record([_row("10.0.0.1", "block", ["SQLi"])])
+        return await stats.snapshot()
+
+    snapshot = asyncio.run(run())
+    assert snapshot["total_requests"] == 3
+    assert snapshot["blocked_requests"] == 2
+    assert snapshot["allowed_requests"] == 1
+    assert snapshot["top_ips"][0] == {"ip": "10.0.0.1", "count": 2}
+    assert {t["type"]: t["count"] for t in snapshot["threat_distribution"]} == {
+        "SQLi": 2,
+        "XSS": 1,
+    }
+    assert sum(hour["count"] for hour in snapshot["requests_over_time"]) == 3
+
+
+def test_space_saving_keeps_heavy_hitters():
+    # Zipf-like traffic from far more IPs than the sketch holds.
+    traffic = [f"10.0.0.{n}" for n in range(1, 6) for _ in range(120 // n)]
+    traffic += [f"192.168.{n // 250}.{n % 250}" for n in range(300)]
+    random.Random(0).shuffle(traffic)
+    truth = Counter(traffic)
+    capacity = 20
+
+    async def run() -> list[dict]:
+        stats = StatsCounters(
+            fakeredis.aioredis.FakeRedis(decode_responses=True), top_ips_capacity=capacity
+        )
+        for start in range(0, len(traffic), 7):
+            await stats.record([_row(ip) for ip in traffic[start : start + 7]])
+        return (await stats.snapshot(top_n=capacity + 1))["top_ips"]
+
+    tracked = {entry["ip"]: entry["count"] for entry in asyncio.run(run())}
+    assert len(tracked) == capacity
+    # Every IP seen more than N/capacity times is guaranteed a slot ...
+    for ip, count in truth.items():
+        if count > len(traffic) / capacity:
+            assert ip in tracked
+    # ... and no tracked count is an underestimate.
+    for ip, count in tracked.items():
+        assert count >= truth[ip]
+    assert max(tracked, key=tracked.get) == "10.0.0.1"
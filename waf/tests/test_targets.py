@@ -0,0 +1,39 @@
+from app.targets import body_target, is_structured, request_targets
+
+
+def test_request_targets():
+    targets = request_targets(
+        "/search",
+        "q=shoes&page=2&flag",
+        {"User-Agent": "curl/8", "Cookie": "session=abc; theme=dark", "X-Other": "skip"},
+    )
+    assert targets["path"] == "/search"
+    assert targets["query"] == "q\nshoes\npage\n2\nflag"
+    assert targets["cookies"] == "abc\ndark"
+    # Only the headers listed in INSPECTION_HEADERS.
+    assert targets["headers"] == "curl/8"
+
+
+def test_empty_targets_are_omitted():
+    assert request_targets("/", "") == {"path": "/"}
+
+
+def test_structured_content_types():
+    assert is_structured("application/json; charset=utf-8")
+    assert is_structured("application/vnd.api+json")
+    assert is_structured("application/x-www-form-urlencoded")
+    assert not is_structured("text/plain")
+    assert not is_structured(None)
+
+
+def test_body_target_fields():
+    assert body_target("a=1&b=x", "application/x-www-form-urlencoded") == "a\n1\nb\nx"
+    fields = body_target('{"user": {"name": "bob"}, "tags": ["x"], "n": 1}', "application/json")
+    assert sorted(fields.split("\n")) == ["bob", "n", "name", "tags", "user", "x"]
+
+
+def test_body_target_falls_back_to_the_raw_body():
+    # Cut off by the inspection window, malformed, or not structured at all.
+    assert body_target('{"a": "b"', "application/json", complete=False) == '{"a": "b"'
+    assert body_target('{"a": ', "application/json") == '{"a": '
+    assert body_target("a=1", "text/plain") == "a=1"
@@ -0,0 +1,61 @@
+from app.verdict_cache import VerdictCache
+
+
+def _key(cache: VerdictCache, query: str, body: str | None = None) -> bytes:
+    return cache.key({"path": "/", "query": query}, body, "application/json", True)
+
+
+def test_hit_after_put():
+    cache = VerdictCache(max_size=10, ttl=60, max_body_bytes=100)
+    key = _key(cache, "a=1")
+    assert cache.get(key, version=1) is None
+    cache.put(key, 1, (60, ["SQLi"], "block"))
+    assert cache.get(key, version=1) == (60, ["SQLi"], "block")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_keys_separate_inputs_and_flags():
+    cache = VerdictCache(max_size=10, ttl=60, max_body_bytes=100)
+    keys = {
+        _key(cache, "a=1"),
+        _key(cache, "a=1", "{}"),
+        cache.key({"path": "/", "query": "a=1"}, None, None, False),
+        # Same concatenation, different split between targets.
+        cache.key({"path": "/a", "query": "=1"}, None, None, True),
+    }
+    assert len(keys) == 4
+
+
+def test_rule_set_change_empties_the_cache():
+    cache = VerdictCache(max_size=10, ttl=60, max_body_bytes=100)
+    key = _key(cache, "a=1")
+    cache.get(key, version=1)
+    cache.put(key, 1, (0, [], "allow"))
+    assert cache.get(key, version=2) is None
+    assert len(cache) == 0
+    # A verdict computed under an older rule set isn't stored.
+    cache.put(key, 1, (0, [], "allow"))
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_expiry():
+    cache = VerdictCache(max_size=2, ttl=60, max_body_bytes=100)
+    first, second, third = (_key(cache, f"a={n}") for n in range(3))
+    cache.get(first, version=1)
+    cache.put(first, 1, (0, [], "allow"))
+    cache.put(second, 1, (0, [], "allow"))
+    cache.get(first, version=1)  # now most recently used
+    cache.put(third, 1, (0, [], "allow"))
+    assert cache.get(second, version=1) is None
+    assert cache.get(first, version=1) is not None
+
+    expired = VerdictCache(max_size=2, ttl=0, max_body_bytes=100)
+    expired.get(first, version=1)
+    expired.put(first, 1, (0, [], "allow"))
+    assert expired.get(first, version=1) is None
+
+
+def test_covers():
+    assert VerdictCache(max_size=10, ttl=60, max_body_bytes=100).covers(100)
+    assert not VerdictCache(max_size=10, ttl=60, max_body_bytes=100).covers(101)
+    assert not VerdictCache(max_size=0, ttl=60, max_body_bytes=100).covers(0)